@@ -1,18 +1,36 @@
 import asyncio
 from dotenv import load_dotenv
 from enum import Enum
+import hashlib
 from pydantic import BaseModel
 import json
-from typing import List, Optional
+import math
+import os
+import sqlite3
+import time
+from typing import TYPE_CHECKING, Awaitable, Callable, List, Optional
+import uuid
 
-from google.adk import Agent
-from google.adk.tools import google_search
-from google.adk.runners import Runner
-from google.adk.sessions import InMemorySessionService
-from google.genai import types
+import vendors
 
+# google.adk and google.genai take seconds to import, only load them to run the agent
+if TYPE_CHECKING:
+    from google.adk import Agent
+    from google.adk.runners import Runner
 
-load_dotenv(".env")
+
+# Bound the prompt so a large backfill doesn't become one huge request
+CHUNK_SIZE = 25
+CHUNK_CHARS = 8000
+CONCURRENCY = 4
+# Chunks are resent with only the transactions still missing a category
+CHUNK_RETRIES = 2
+APP_NAME, USER_ID = "categorization_service", "user"
+CACHE_PATH = os.environ.get("CATEGORY_CACHE_PATH", "category_cache.db")
+CACHE_TTL = 180 * 24 * 60 * 60
+CACHE_MAX_ENTRIES = 50_000
+# Amounts within about 50% of each other share a cache bucket
+AMOUNT_BUCKET_RATIO = 1.5
 
 
 class Category(str, Enum):
@@ -56,16 +74,21 @@ Your final output must only be a single JSON object with the schema defined belo
 }}
 """
 
-# Couldn't get agent to use both google_search and output_schema 💀
-agent = Agent(
-    name="categorization_agent",
-    description="Categorizes personal banking transactions, using Google search when necessary.",
-    model="gemini-2.0-flash",
-    instruction=PROMPT,
-    tools=[google_search],
-    input_schema=TransactionListInput,
-    # output_schema=CategorizedTransactionList
-)
+
+def build_agent() -> "Agent":
+    from google.adk import Agent
+    from google.adk.tools import google_search
+
+    # Couldn't get agent to use both google_search and output_schema 💀
+    return Agent(
+        name="categorization_agent",
+        description="Categorizes personal banking transactions, using Google search when necessary.",
+        model="gemini-2.0-flash",
+        instruction=PROMPT,
+        tools=[google_search],
+        input_schema=TransactionListInput,
+        # output_schema=CategorizedTransactionList
+    )
 
 
 def extract_json_from_md(text: str) -> str:
@@ -73,47 +96,305 @@ def extract_json_from_md(text: str) -> str:
     return text[l_brace : r_brace + 1] if r_brace > l_brace > -1 else text
 
 
+_runner: Optional["Runner"] = None
+
+
+def get_runner() -> "Runner":
+    global _runner
+    if _runner is None:
+        from google.adk.runners import Runner
+        from google.adk.sessions import InMemorySessionService
+
+        load_dotenv(".env")
+        _runner = Runner(
+            agent=build_agent(),
+            app_name=APP_NAME,
+            session_service=InMemorySessionService(),
+        )
+    return _runner
+
+
 async def run_categorization_agent(input: TransactionListInput) -> list[dict]:
-    app_name, user_id, session_id = "categorization_service", "user", "session"
-    session_service = InMemorySessionService()
-    await session_service.create_session(
-        app_name=app_name, user_id=user_id, session_id=session_id
+    from google.genai import types
+
+    runner = get_runner()
+    # Every chunk gets its own session so concurrent chunks don't share history
+    session_id = uuid.uuid4().hex
+    await runner.session_service.create_session(
+        app_name=APP_NAME, user_id=USER_ID, session_id=session_id
     )
-    runner = Runner(agent=agent, app_name=app_name, session_service=session_service)
 
     # Send user message as JSON to the agent
     user_message = types.Content(
         role="user", parts=[types.Part(text=input.model_dump_json())]
     )
-    print(f"Sending message to agent: {user_message}")
+    print(f"Sending {len(input.transactions)} transactions to agent")
 
     # Run agent
     agent_response = None
-    async for event in runner.run_async(
-        user_id=user_id, session_id=session_id, new_message=user_message
-    ):
-        if event.is_final_response():
-            if event.content and event.content.parts:
-                agent_response = event.content.parts[0].text
-            break
+    try:
+        async for event in runner.run_async(
+            user_id=USER_ID, session_id=session_id, new_message=user_message
+        ):
+            if event.is_final_response():
+                if event.content and event.content.parts:
+                    agent_response = event.content.parts[0].text
+                break
+    finally:
+        await runner.session_service.delete_session(
+            app_name=APP_NAME, user_id=USER_ID, session_id=session_id
+        )
 
     if agent_response:
         try:
             parsed_output = json.loads(extract_json_from_md(agent_response))
             return parsed_output["categorized_transactions"]
-        except json.JSONDecodeError:
+        except (json.JSONDecodeError, KeyError, TypeError):
             print("Failed to parse JSON output")
     else:
         print("No response from agent")
     return []
 
 
-def categorize_transactions(transactions: list[TransactionInput]):
-    print("Starting categorization service...")
-    result = asyncio.run(
-        run_categorization_agent(TransactionListInput(transactions=transactions))
+def stub_agent(
+    category: Category = Category.GROCERIES, delay: float = 0.0
+) -> Callable[[TransactionListInput], Awaitable[list[dict]]]:
+    """Local stand-in for run_categorization_agent that never touches the network."""
+
+    async def run(input: TransactionListInput) -> list[dict]:
+        if delay:
+            await asyncio.sleep(delay)
+        return [
+            {
+                "transaction_id": t.transaction_id,
+                "category": category.value,
+                "reason": "stub",
+            }
+            for t in input.transactions
+        ]
+
+    return run
+
+
+def chunk_transactions(
+    transactions: list[TransactionInput],
+    max_items: int = CHUNK_SIZE,
+    max_chars: int = CHUNK_CHARS,
+) -> list[list[TransactionInput]]:
+    chunks: list[list[TransactionInput]] = []
+    chunk: list[TransactionInput] = []
+    chars = 0
+    for t in transactions:
+        size = len(t.model_dump_json())
+        if chunk and (len(chunk) >= max_items or chars + size > max_chars):
+            chunks.append(chunk)
+            chunk, chars = [], 0
+        chunk.append(t)
+        chars += size
+    if chunk:
+        chunks.append(chunk)
+    return chunks
+
+
+async def categorize_in_batches(
+    transactions: list[TransactionInput],
+    run_chunk: Callable[[TransactionListInput], Awaitable[list[dict]]],
+    concurrency: int = CONCURRENCY,
+    retries: int = CHUNK_RETRIES,
+) -> dict[str, dict]:
+    """Categorize chunks concurrently, returning agent output keyed by transaction_id."""
+    valid_categories = {c.value for c in Category}
+    results: dict[str, dict] = {}
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def run(chunk: list[TransactionInput]):
+        pending = chunk
+        for attempt in range(retries + 1):
+            async with semaphore:
+                try:
+                    output = await run_chunk(TransactionListInput(transactions=pending))
+                except Exception as e:
+                    print(f"chunk failed attempt={attempt + 1} e={e}")
+                    output = []
+
+            wanted = {t.transaction_id for t in pending}
+            for e in output:
+                if not isinstance(e, dict):
+                    continue
+                tid = e.get("transaction_id")
+                if tid in wanted and e.get("category") in valid_categories:
+                    results[tid] = e
+            pending = [t for t in pending if t.transaction_id not in results]
+            if not pending:
+                return
+        print(f"could not categorize {[t.transaction_id for t in pending]}")
+
+    chunks = chunk_transactions(transactions)
+    start = time.perf_counter()
+    await asyncio.gather(*(run(c) for c in chunks))
+    elapsed = time.perf_counter() - start
+    print(
+        f"categorized {len(results)}/{len(transactions)} transactions in "
+        f"{len(chunks)} chunks, {elapsed:.2f}s "
+        f"({len(results) / elapsed if elapsed else 0:.1f} transactions/s)"
     )
+    return results
+
+
+def amount_bucket(amount: Optional[int]) -> int:
+    # Same sign and nearest power of 1.5, so $4.50 and $5.20 coffees share a bucket.
+    # Bucket 0 is kept for no amount, hence the + 1.
+    if not amount:
+        return 0
+    bucket = round(math.log(abs(amount)) / math.log(AMOUNT_BUCKET_RATIO)) + 1
+    return (1 if amount > 0 else -1) * bucket
+
+
+def cache_key(t: TransactionInput) -> str:
+    parts = [
+        vendors.normalize_vendor(t.vendor or "", t.location or ""),
+        vendors.normalize_vendor(t.description or "", t.location or ""),
+        vendors.normalize_vendor(t.location or ""),
+        amount_bucket(t.amount),
+    ]
+    return hashlib.sha256(json.dumps(parts).encode()).hexdigest()
+
+
+class CategoryCache:
+    """Agent answers keyed by cache_key, expiring after ttl and evicting least recently used."""
+
+    def __init__(
+        self,
+        path: str = CACHE_PATH,
+        ttl: int = CACHE_TTL,
+        max_entries: int = CACHE_MAX_ENTRIES,
+    ):
+        self.con = sqlite3.connect(path)
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.collapsed = 0
+        self.con.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS category_cache (
+                key TEXT PRIMARY KEY,
+                category TEXT NOT NULL,
+                reason TEXT NOT NULL,
+                created INTEGER NOT NULL,
+                last_used INTEGER NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS category_cache_last_used
+            ON category_cache (last_used);
+            """
+        )
+
+    def get_many(self, keys: list[str]) -> dict[str, dict]:
+        now = int(time.time())
+        found = {}
+        for i in range(0, len(keys), 500):
+            chunk = keys[i : i + 500]
+            placeholders = ", ".join("?" * len(chunk))
+            rows = self.con.execute(
+                f"""
+                SELECT key, category, reason FROM category_cache
+                WHERE key IN ({placeholders}) AND created >= ?
+                """,
+                [*chunk, now - self.ttl],
+            ).fetchall()
+            found.update(
+                {key: {"category": c, "reason": reason} for key, c, reason in rows}
+            )
+        with self.con:
+            self.con.executemany(
+                "UPDATE category_cache SET last_used = ? WHERE key = ?",
+                [(now, key) for key in found],
+            )
+        return found
+
+    def put_many(self, entries: dict[str, dict]) -> None:
+        now = int(time.time())
+        with self.con:
+            self.con.executemany(
+                "INSERT OR REPLACE INTO category_cache VALUES (?, ?, ?, ?, ?)",
+                [
+                    (key, e["category"], e.get("reason", ""), now, now)
+                    for key, e in entries.items()
+                ],
+            )
+            self.con.execute(
+                "DELETE FROM category_cache WHERE created < ?", (now - self.ttl,)
+            )
+            self.con.execute(
+                """
+                DELETE FROM category_cache WHERE key IN (
+                    SELECT key FROM category_cache
+                    ORDER BY last_used DESC LIMIT -1 OFFSET ?
+                )
+                """,
+                (self.max_entries,),
+            )
+
+    def stats(self) -> dict[str, int]:
+        return {"hits": self.hits, "misses": self.misses, "collapsed": self.collapsed}
+
+
+_cache: Optional[CategoryCache] = None
+
+
+def get_cache() -> CategoryCache:
+    global _cache
+    if _cache is None:
+        _cache = CategoryCache()
+    return _cache
+
+
+def categorize_transactions(
+    transactions: list[TransactionInput],
+    run_chunk: Optional[Callable[[TransactionListInput], Awaitable[list[dict]]]] = None,
+    cache: Optional[CategoryCache] = None,
+) -> list[dict]:
+    print("Starting categorization service...")
+    cache = cache or get_cache()
+    keys = [cache_key(t) for t in transactions]
+    answers = cache.get_many(list(set(keys)))
+
+    # Only send one transaction per key, the rest reuse its answer
+    to_send: dict[str, TransactionInput] = {}
+    for key, t in zip(keys, transactions):
+        if key in answers:
+            cache.hits += 1
+        elif key in to_send:
+            cache.collapsed += 1
+        else:
+            cache.misses += 1
+            to_send[key] = t
+
+    if to_send:
+        results = asyncio.run(
+            categorize_in_batches(
+                list(to_send.values()), run_chunk or run_categorization_agent
+            )
+        )
+        new_answers = {
+            key: results[t.transaction_id]
+            for key, t in to_send.items()
+            if t.transaction_id in results
+        }
+        cache.put_many(new_answers)
+        answers.update(new_answers)
+
+    result = [
+        {
+            "transaction_id": t.transaction_id,
+            "category": answers[key]["category"],
+            "reason": answers[key].get("reason", ""),
+        }
+        for key, t in zip(keys, transactions)
+        if key in answers
+    ]
     print(json.dumps(result, indent=2))
+    print(f"category cache {cache.stats()}")
     return result
 
 
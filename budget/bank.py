@@ -0,0 +1,324 @@
+import bisect
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from datetime import date, datetime, timedelta, timezone
+import os
+import random
+import time
+from typing import Callable, Optional, TypeVar
+from zoneinfo import ZoneInfo
+
+BANK_ID = "1"
+PAGE_SIZE = 50
+# Stop paging an account after this many pages even if the watermark was not reached
+MAX_PAGES = 20
+# Pending transactions can post with an earlier timestamp, so re-read a window
+# behind the watermark and let the unique index drop what we already have
+WATERMARK_OVERLAP = 7 * 24 * 60 * 60
+MAX_WORKERS = 4
+RETRIES = 3
+BACKOFF_SECONDS = 1.0
+# Backfills search by date, the most ubank returns per page
+BACKFILL_PAGE_SIZE = 200
+BACKFILL_WINDOW_DAYS = 30
+
+RENT = "rent"
+SHARED = "shared"
+ACCOUNT_KINDS = (RENT, SHARED)
+
+T = TypeVar("T")
+
+
+@dataclass(frozen=True)
+class Account:
+    account_id: str
+    kind: str  # RENT accounts feed rent_payments, SHARED accounts feed transactions
+
+
+def parse_accounts(spec: str) -> list[Account]:
+    # e.g. "rent:<account id>,shared:<account id>,shared:<account id>"
+    accounts = []
+    for entry in spec.split(","):
+        entry = entry.strip()
+        if not entry:
+            continue
+        kind, _, account_id = entry.partition(":")
+        if kind not in ACCOUNT_KINDS or not account_id:
+            raise ValueError(f"invalid account entry '{entry}', expected kind:account_id")
+        accounts.append(Account(account_id, kind))
+    return accounts
+
+
+def load_accounts() -> list[Account]:
+    spec = os.environ.get("BUDGET_ACCOUNTS")
+    if spec:
+        return parse_accounts(spec)
+
+    # Fall back to the env vars the sync has always used
+    accounts = []
+    if rent := os.environ.get("HUGH_ACCOUNT_ID"):
+        accounts.append(Account(rent, RENT))
+    for name in ("SHARED_SAVE_ACCOUNT_ID", "SHARED_SPEND_ACCOUNT_ID"):
+        if shared := os.environ.get(name):
+            accounts.append(Account(shared, SHARED))
+    return accounts
+
+
+def with_retry(
+    fn: Callable[[], T], retries: Optional[int] = None, backoff: Optional[float] = None
+) -> T:
+    retries = RETRIES if retries is None else retries
+    backoff = BACKOFF_SECONDS if backoff is None else backoff
+    for attempt in range(retries + 1):
+        try:
+            return fn()
+        except Exception as e:
+            if attempt == retries:
+                raise
+            delay = backoff * 2**attempt * (1 + random.random())
+            print(f"request failed attempt={attempt + 1} retrying in {delay:.1f}s e={e}")
+            time.sleep(delay)
+    raise AssertionError("unreachable")
+
+
+def fetch_account(
+    client,
+    customer_id: str,
+    account_id: str,
+    watermark: Optional[tuple[int, str]] = None,
+    page_size: Optional[int] = None,
+    max_pages: Optional[int] = None,
+) -> tuple[list, bool]:
+    """Page through an account, newest first, until we reach the watermark.
+
+    Returns (transactions, truncated), truncated when max_pages ran out first and
+    there's a gap between the oldest transaction fetched and the watermark.
+    Without a watermark only the first page is fetched, as the sync always did.
+    """
+    page_size = page_size or PAGE_SIZE
+    max_pages = max_pages or MAX_PAGES
+    transactions = []
+    page_id = ""
+    for _ in range(max_pages):
+        res = with_retry(
+            lambda: client.search_account_transactions(
+                account_id=account_id,
+                bank_id=BANK_ID,
+                customerId=customer_id,
+                limit=page_size,
+                pageId=page_id,
+            )
+        )
+        for tran in res.transactions:
+            if watermark and tran.posted:
+                if tran.posted.timestamp() < watermark[0] - WATERMARK_OVERLAP:
+                    return transactions, False
+            transactions.append(tran)
+        if not watermark or not res.nextPageId:
+            return transactions, False
+        page_id = res.nextPageId
+    print(f"watermark not reached after {max_pages} pages for account={account_id}")
+    return transactions, True
+
+
+def fetch_accounts(
+    client,
+    customer_id: str,
+    accounts: list[Account],
+    watermarks: dict[str, tuple[int, str]],
+    max_workers: int = MAX_WORKERS,
+) -> tuple[dict[str, list], set[str]]:
+    """Fetch every account concurrently over one authenticated client.
+
+    Returns the transactions per account and the accounts whose fetch was truncated.
+    """
+    if not accounts:
+        return {}, set()
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(accounts))) as pool:
+        futures = {
+            a.account_id: pool.submit(
+                fetch_account,
+                client,
+                customer_id,
+                a.account_id,
+                watermarks.get(a.account_id),
+            )
+            for a in accounts
+        }
+        results = {account_id: f.result() for account_id, f in futures.items()}
+    fetched = {account_id: trans for account_id, (trans, _) in results.items()}
+    truncated = {account_id for account_id, (_, cut) in results.items() if cut}
+    print(
+        f"fetched {sum(len(t) for t in fetched.values())} transactions from "
+        f"{len(accounts)} accounts in {time.perf_counter() - start:.2f}s"
+    )
+    return fetched, truncated
+
+
+def date_windows(start: date, end: date, days: int) -> list[tuple[date, date]]:
+    """[from, to] windows of days covering start to end inclusive, oldest first."""
+    if days < 1:
+        raise ValueError("windows must be at least a day")
+    windows = []
+    while start <= end:
+        to = min(start + timedelta(days=days - 1), end)
+        windows.append((start, to))
+        start = to + timedelta(days=1)
+    return windows
+
+
+def fetch_window(
+    client,
+    account_id: str,
+    from_date: date,
+    to_date: date,
+    page_size: Optional[int] = None,
+) -> tuple[list, int]:
+    """(every posted transaction on the account from from_date to to_date inclusive,
+    pages read). Pending transactions are left for the sync to pick up once posted."""
+    from ubank import Filter
+
+    transactions = []
+    token = None
+    pages = 0
+    while True:
+        body = Filter(
+            fromDate=from_date,
+            toDate=to_date,
+            limit=page_size or BACKFILL_PAGE_SIZE,
+            accountId=[account_id],
+            excludeTransactionType=["Pending"],
+            paginationToken=token,
+        )
+        res = with_retry(lambda: client.summarise_transactions(body=body))
+        pages += 1
+        transactions.extend(res.transactions)
+        if not res.nextPageId or not res.transactions:
+            return transactions, pages
+        token = res.nextPageId
+
+
+# In-process stand-in for ubank.Client, shaped like the parts of the API we use
+
+
+@dataclass
+class FakeValue:
+    amount: str
+
+
+@dataclass
+class FakeFrom:
+    legalName: Optional[str]
+
+
+@dataclass
+class FakeTransaction:
+    id: str
+    accountId: str
+    posted: Optional[datetime]
+    value: Optional[FakeValue]
+    from_: Optional[FakeFrom] = None
+    lwc: Optional[dict] = None
+    shortDescription: Optional[str] = None
+
+
+@dataclass
+class FakeSearchResults:
+    nextPageId: str
+    transactions: list
+    pendingTransactions: list = field(default_factory=list)
+
+
+@dataclass
+class FakeTransactionsSummary:
+    nextPageId: str
+    totalCount: int
+    totalAmount: str
+    transactions: list
+
+
+class FakeClient:
+    def __init__(
+        self,
+        transactions: dict[str, list[FakeTransaction]],
+        latency: float = 0.0,
+        failures: int = 0,
+    ):
+        # Newest first, matching ubank's ordering
+        self.transactions = {
+            account_id: sorted(
+                trans,
+                key=lambda t: t.posted or datetime.max.replace(tzinfo=timezone.utc),
+                reverse=True,
+            )
+            for account_id, trans in transactions.items()
+        }
+        # Posted transactions oldest first with their timestamps, for date searches
+        self.by_posted = {}
+        for account_id, trans in self.transactions.items():
+            posted = [t for t in reversed(trans) if t.posted]
+            times = [t.posted.timestamp() for t in posted]
+            self.by_posted[account_id] = (times, posted)
+        self.latency = latency
+        # Number of requests to fail before answering, to exercise retries
+        self.failures = failures
+        self.requests = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def _request(self) -> None:
+        self.requests += 1
+        if self.latency:
+            time.sleep(self.latency)
+        if self.failures > 0:
+            self.failures -= 1
+            raise ConnectionError("fake bank unavailable")
+
+    def search_account_transactions(
+        self,
+        account_id: str,
+        bank_id: str,
+        customerId: str,
+        limit: int = 50,
+        pageId: str = "",
+        query: str = "",
+    ) -> FakeSearchResults:
+        self._request()
+        trans = self.transactions.get(account_id, [])
+        offset = int(pageId) if pageId else 0
+        page = trans[offset : offset + limit]
+        next_offset = offset + limit
+        return FakeSearchResults(
+            nextPageId=str(next_offset) if next_offset < len(trans) else "",
+            transactions=page,
+        )
+
+    def summarise_transactions(self, body) -> FakeTransactionsSummary:
+        """Posted transactions between body.fromDate and body.toDate in body.timezone,
+        newest first. Pending transactions never match, they have no date."""
+        self._request()
+        tz = ZoneInfo(body.timezone)
+        start = datetime.combine(body.fromDate, datetime.min.time(), tz).timestamp()
+        end = datetime.combine(
+            body.toDate + timedelta(days=1), datetime.min.time(), tz
+        ).timestamp()
+        matched = []
+        for account_id in body.accountId or self.by_posted:
+            times, posted = self.by_posted.get(account_id, ([], []))
+            first = bisect.bisect_left(times, start)
+            matched += posted[first : bisect.bisect_left(times, end, first)]
+        matched.sort(key=lambda t: t.posted, reverse=True)
+
+        offset = int(body.paginationToken) if body.paginationToken else 0
+        next_offset = offset + body.limit
+        return FakeTransactionsSummary(
+            nextPageId=str(next_offset) if next_offset < len(matched) else "",
+            totalCount=len(matched),
+            totalAmount=f"{sum(float(t.value.amount) for t in matched if t.value):.2f}",
+            transactions=matched[offset:next_offset],
+        )
@@ -0,0 +1,83 @@
+"""Throughput of main.backfill against synthetic history.
+
+Serves the synthetic transactions from bench_sync.py through bank.FakeClient's
+date search and backfills them into a fresh SQLite file with a slow stub agent,
+reporting per-stage timings and how many categories the vendor index and the
+classifier filled in instead of the agent. tests/test_backfill.py checks what
+it stores and that a stopped backfill resumes from its checkpoints.
+
+    python budget/bench_backfill.py --transactions 100000 --agent-delay 0.05
+"""
+
+import argparse
+from contextlib import redirect_stdout
+from datetime import date
+import json
+import os
+import tempfile
+import time
+
+import bench_sync
+
+START, END = date(2020, 1, 1), date(2025, 1, 1)
+
+
+def run(args, workdir: str) -> dict:
+    import agent
+    import bank
+    import main
+
+    accounts = bench_sync.synthetic_transactions(args.transactions, args.seed)
+    db_path = os.path.join(workdir, "backfill.db")
+    bench_sync.create_database(db_path)
+    main.connect(db_path)
+    main.stage_seconds.clear()
+    client = bank.FakeClient(accounts)
+    start = time.perf_counter()
+    with open(os.devnull, "w") as devnull, redirect_stdout(devnull):
+        run_chunk = agent.stub_agent(delay=args.agent_delay)
+        main.backfill(client, START, END, args.window_days, run_chunk)
+    seconds = time.perf_counter() - start
+    stored = main.cur.execute("SELECT COUNT(*) FROM transactions").fetchone()[0]
+    stored += main.cur.execute("SELECT COUNT(*) FROM rent_payments").fetchone()[0]
+    guessed = main.cur.execute(
+        "SELECT COUNT(*) FROM category_source WHERE source != 'agent'"
+    ).fetchone()[0]
+    main.con.close()
+    return {
+        "transactions": args.transactions,
+        "stored": stored,
+        "window_days": args.window_days,
+        "agent_delay": args.agent_delay,
+        "seconds": round(seconds, 3),
+        "transactions_per_second": round(stored / seconds),
+        "stage_seconds": {k: round(v, 3) for k, v in main.stage_seconds.items()},
+        "requests": client.requests,
+        "guessed_categories": guessed,
+    }
+
+
+def main_():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--transactions", type=int, default=100_000)
+    parser.add_argument("--window-days", type=int, default=30)
+    parser.add_argument("--agent-delay", type=float, default=0.05)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        # Keep the bench away from the real database, agent cache and model
+        os.environ["SQLITE_URL"] = os.path.join(workdir, "unused.db")
+        os.environ["CUSTOMER_ID"] = "bench"
+        os.environ["BUDGET_ACCOUNTS"] = (
+            f"rent:{bench_sync.RENT_ACCOUNT},shared:{bench_sync.SAVE_ACCOUNT},"
+            f"shared:{bench_sync.SPEND_ACCOUNT}"
+        )
+        os.environ["CATEGORY_CACHE_PATH"] = os.path.join(workdir, "cache.db")
+        os.environ["CLASSIFIER_PATH"] = os.path.join(workdir, "model.json")
+        result = run(args, workdir)
+    print(json.dumps(result))
+
+
+if __name__ == "__main__":
+    main_()
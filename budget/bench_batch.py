@@ -0,0 +1,224 @@
+"""Memory and throughput of main.TransactionBatch against per-row Transaction objects.
+
+Runs the same synthetic ubank transactions (see bench_sync.py) through both
+ways of holding them: building the rows, inserting them into an in-memory
+transactions table and turning the uncategorized ones into agent inputs. The
+per-row path is the Transaction class main.py used before TransactionBatch.
+tests/test_batch.py checks both give the same rows and agent inputs.
+
+    python budget/bench_batch.py --sizes 100000 500000
+"""
+
+import argparse
+import gc
+import json
+import os
+import sqlite3
+import sys
+import time
+import tracemalloc
+
+import agent
+import bench_sync
+import main
+
+
+class Transaction:
+    def __init__(
+        self,
+        account_id: str,
+        transaction_id: str,
+        account_name: str,
+        amount: int,
+        time: int,
+        vendor: str,
+        category: str,
+        location: str,
+        description: str,
+    ):
+        self.account_id = account_id
+        self.transaction_id = transaction_id
+        self.account_name = account_name
+        self.amount = amount
+        self.time = time
+        self.vendor = vendor
+        self.category = category
+        self.location = location
+        self.description = description
+
+    def to_tuple(self):
+        return (
+            self.account_id,
+            self.transaction_id,
+            self.account_name,
+            self.amount,
+            self.time,
+            self.vendor,
+            self.category,
+            self.location,
+            self.description,
+        )
+
+
+def per_row_transactions(transactions: list) -> list[Transaction]:
+    """The filtering store_saving_and_spend_transactions did before TransactionBatch."""
+    rows = []
+    for tran in transactions:
+        if not tran.value or not tran.posted:
+            continue
+        source = (
+            tran.from_.legalName
+            if tran.from_ and tran.from_.legalName
+            else "bonus interest"
+        )
+        payment_in_cents = int(float(tran.value.amount) * 100)
+        tran_time = int(tran.posted.timestamp())
+        if tran.lwc:
+            rows.append(
+                Transaction(
+                    tran.accountId,
+                    tran.id,
+                    source,
+                    payment_in_cents,
+                    tran_time,
+                    tran.lwc.get("merchantName", ""),
+                    "",
+                    tran.lwc.get("merchantLocation", ""),
+                    tran.shortDescription if tran.shortDescription else "",
+                )
+            )
+        else:
+            rows.append(
+                Transaction(
+                    tran.accountId, tran.id, source, payment_in_cents, tran_time,
+                    "", "Debit", "", "",
+                )  # fmt: skip
+            )
+    return rows
+
+
+def per_row_agent_inputs(rows: list[Transaction]) -> list[agent.TransactionInput]:
+    return [
+        agent.TransactionInput(
+            account_id=t.account_id,
+            transaction_id=t.transaction_id,
+            amount=t.amount,
+            time=t.time,
+            vendor=t.vendor,
+            location=t.location,
+            description=t.description,
+        )
+        for t in rows
+        if not t.category
+    ]
+
+
+def table() -> sqlite3.Connection:
+    con = sqlite3.connect(":memory:")
+    with open(os.path.join(bench_sync.DATA_DIR, "create_transaction.sql")) as f:
+        con.executescript(f.read())
+    return con
+
+
+def measure(build) -> tuple[object, float, int]:
+    """(result, seconds, bytes still allocated by the result). Memory is traced on a
+    second build so tracing doesn't slow the timed one."""
+    gc.collect()
+    start = time.perf_counter()
+    result = build()
+    seconds = time.perf_counter() - start
+    tracemalloc.start()
+    traced = build()
+    retained, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del traced
+    return result, seconds, retained
+
+
+def run(n: int, seed: int) -> dict:
+    transactions = [
+        t
+        for account, ts in bench_sync.synthetic_transactions(n, seed).items()
+        if account != bench_sync.RENT_ACCOUNT
+        for t in ts
+    ]
+    results = {"transactions": len(transactions)}
+
+    with open(os.devnull, "w") as devnull:
+        stdout, sys.stdout = sys.stdout, devnull
+        try:
+            rows, build_seconds, retained = measure(
+                lambda: per_row_transactions(transactions)
+            )
+            batch, batch_build_seconds, batch_retained = measure(
+                lambda: main.transaction_batch(transactions, set())
+            )
+        finally:
+            sys.stdout = stdout
+
+    def timed(f):
+        start = time.perf_counter()
+        result = f()
+        return result, time.perf_counter() - start
+
+    per_row_con, batch_con = table(), table()
+    _, insert_seconds = timed(
+        lambda: per_row_con.executemany(
+            "INSERT INTO transactions VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            [t.to_tuple() for t in rows],
+        )
+    )
+    _, batch_insert_seconds = timed(
+        lambda: batch_con.executemany(
+            "INSERT INTO transactions VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            batch.rows(),
+        )
+    )
+    # Both go through pydantic validators, warm them up the same
+    per_row_agent_inputs(rows[:1000]), batch.agent_inputs(list(range(1000)))
+    inputs, agent_seconds = timed(lambda: per_row_agent_inputs(rows))
+    # So the per-row models aren't left for the garbage collector to walk while the
+    # batch path is timed
+    del inputs
+    gc.collect()
+    batch_inputs, batch_agent_seconds = timed(
+        lambda: batch.agent_inputs(batch.uncategorized())
+    )
+
+    per_row_seconds = build_seconds + insert_seconds + agent_seconds
+    batch_seconds = batch_build_seconds + batch_insert_seconds + batch_agent_seconds
+    results.update(
+        {
+            "rows": len(batch),
+            "agent_inputs": len(batch_inputs),
+            "per_row": {
+                "build_seconds": round(build_seconds, 4),
+                "insert_seconds": round(insert_seconds, 4),
+                "agent_input_seconds": round(agent_seconds, 4),
+                "rows_per_second": round(len(rows) / per_row_seconds),
+                "retained_mb": round(retained / 2**20, 1),
+            },
+            "batch": {
+                "build_seconds": round(batch_build_seconds, 4),
+                "insert_seconds": round(batch_insert_seconds, 4),
+                "agent_input_seconds": round(batch_agent_seconds, 4),
+                "rows_per_second": round(len(batch) / batch_seconds),
+                "retained_mb": round(batch_retained / 2**20, 1),
+            },
+        }
+    )
+    return results
+
+
+def main_():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100_000])
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    for n in args.sizes:
+        print(json.dumps(run(n, args.seed)))
+
+
+if __name__ == "__main__":
+    main_()
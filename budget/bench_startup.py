@@ -0,0 +1,77 @@
+"""Catch regressions in how long `import main` takes.
+
+Runs `python -X importtime -c "import main"` a few times, reports the slowest
+imports and any module that should only load when a command needs it, and fails
+if the import is over budget.
+
+    python budget/bench_startup.py [--budget-ms 150] [--runs 5]
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+BUDGET_MS = 150
+# Only the commands that talk to the bank or the agent should pay for these
+LAZY_MODULES = ("ubank", "meatie", "httpx", "google.adk", "google.genai", "agent")
+BUDGET_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def import_times(module: str) -> dict[str, int]:
+    """Cumulative import time in microseconds of every module imported."""
+    res = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=BUDGET_DIR,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    times = {}
+    for line in res.stderr.splitlines():
+        # import time: self [us] | cumulative | imported package
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line.split("|")
+        times[name.strip()] = int(cumulative)
+    return times
+
+
+def eager_lazy_modules(times: dict[str, int]) -> list[str]:
+    """The LAZY_MODULES, and their submodules, that were imported."""
+    return sorted(
+        {m for m in times for lazy in LAZY_MODULES if m == lazy or m.startswith(f"{lazy}.")}
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--module", default="main")
+    parser.add_argument("--budget-ms", type=float, default=BUDGET_MS)
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    runs = [import_times(args.module) for _ in range(args.runs)]
+    # The fastest run is the least noisy estimate
+    best = min(runs, key=lambda t: t.get(args.module, 0))
+    total_ms = best.get(args.module, 0) / 1000
+
+    slowest = sorted(best.items(), key=lambda kv: kv[1], reverse=True)[:10]
+    eager = eager_lazy_modules(best)
+    result = {
+        "module": args.module,
+        "import_ms": round(total_ms, 2),
+        "budget_ms": args.budget_ms,
+        "slowest_ms": {name: round(us / 1000, 2) for name, us in slowest},
+        "eager_lazy_modules": eager,
+    }
+    print(json.dumps(result, indent=2))
+
+    if total_ms > args.budget_ms:
+        print(f"FAIL: import took {total_ms:.1f}ms, budget is {args.budget_ms}ms")
+        exit(1)
+
+
+if __name__ == "__main__":
+    main()
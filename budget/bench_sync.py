@@ -0,0 +1,186 @@
+"""End-to-end benchmark of the bank sync against synthetic transactions.
+
+Generates ubank-shaped transactions, serves them through bank.FakeClient and
+runs store_saving_and_spend_transactions and store_pleb_transactions_in_db
+against a fresh SQLite file with the stub agent. Each run appends a JSON line
+with per-stage timings to the results file so runs can be compared over time.
+
+    python budget/bench_sync.py --sizes 10000 100000 1000000
+"""
+
+import argparse
+from contextlib import redirect_stdout
+from datetime import datetime, timedelta, timezone
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+
+BUDGET_DIR = os.path.dirname(os.path.abspath(__file__))
+DATA_DIR = os.path.join(BUDGET_DIR, "..", "data")
+RENT_ACCOUNT, SAVE_ACCOUNT, SPEND_ACCOUNT = "bench-rent", "bench-save", "bench-spend"
+RENTERS = {"Alice Example": 1001, "Bob Example": 1002, "Carol Example": 1003}
+
+MERCHANTS = [
+    "Woolworths", "Coles", "Aldi", "Harris Farm", "IGA",
+    "Guzman Y Gomez", "Mr Wong", "Sushi Train", "Bar Luca", "Din Tai Fung",
+    "BP", "Ampol", "Shell", "Wilson Parking", "Secure Parking",
+    "Qantas", "Jetstar", "Virgin Australia", "Uber", "Opal",
+    "Anytime Fitness", "Chemist Warehouse", "Priceline", "Origin Energy", "Sydney Water",
+]  # fmt: skip
+SUBURBS = ["Pyrmont", "Ultimo", "Glebe", "Newtown", "Surry Hills", "Sydney"]
+
+
+def synthetic_transactions(n: int, seed: int = 0) -> dict[str, list]:
+    import bank
+
+    rng = random.Random(seed)
+    start = datetime(2020, 1, 1, tzinfo=timezone.utc)
+    accounts = {RENT_ACCOUNT: [], SAVE_ACCOUNT: [], SPEND_ACCOUNT: []}
+    for i in range(n):
+        posted = start + timedelta(seconds=rng.randrange(5 * 365 * 24 * 60 * 60))
+        roll = rng.random()
+        if roll < 0.1:
+            # Rent payments, some from people we don't know or with no sender
+            name = rng.choice([*RENTERS, "Someone Else"])
+            accounts[RENT_ACCOUNT].append(
+                bank.FakeTransaction(
+                    id=f"rent-{i}",
+                    accountId=RENT_ACCOUNT,
+                    posted=posted,
+                    value=bank.FakeValue(f"{rng.randint(200, 400)}.00"),
+                    from_=bank.FakeFrom(name) if rng.random() > 0.05 else None,
+                )
+            )
+            continue
+
+        account = SAVE_ACCOUNT if roll < 0.2 else SPEND_ACCOUNT
+        tran = bank.FakeTransaction(
+            id=f"tran-{i}",
+            accountId=account,
+            posted=posted if rng.random() > 0.03 else None,
+            value=bank.FakeValue(f"-{rng.randint(1, 20000) / 100:.2f}"),
+        )
+        if roll < 0.2:
+            # Transfers and interest have no merchant and maybe no sender
+            tran.value = bank.FakeValue(f"{rng.randint(1, 50000) / 100:.2f}")
+            if rng.random() > 0.5:
+                tran.from_ = bank.FakeFrom("Alice Example")
+        else:
+            merchant = rng.choice(MERCHANTS)
+            suburb = rng.choice(SUBURBS)
+            tran.lwc = {
+                "merchantName": f"{merchant.upper()} {rng.randint(1, 9999)} {suburb.upper()}",
+                "merchantLocation": f"{suburb} NSW",
+            }
+            tran.shortDescription = f"{merchant} {suburb}"
+        accounts[account].append(tran)
+    return accounts
+
+
+def create_database(path: str) -> None:
+    import sqlite3
+
+    con = sqlite3.connect(path)
+    for schema in ("create_transaction.sql", "create_renter_table.sql"):
+        with open(os.path.join(DATA_DIR, schema)) as f:
+            con.executescript(f.read())
+    con.executemany(
+        "INSERT INTO renter VALUES (?, ?, ?)",
+        [(name, discord_id, 0) for name, discord_id in RENTERS.items()],
+    )
+    con.commit()
+    con.close()
+
+
+def git_revision() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=BUDGET_DIR,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ""
+
+
+def run(n: int, seed: int, workdir: str) -> dict:
+    import agent
+    import bank
+    import main
+
+    db_path = os.path.join(workdir, f"bench-{n}.db")
+    create_database(db_path)
+    # Every size starts cold, without the previous run's agent cache or model
+    for path in (os.environ["CATEGORY_CACHE_PATH"], os.environ["CLASSIFIER_PATH"]):
+        if os.path.exists(path):
+            os.remove(path)
+    agent._cache = None
+
+    gen_start = time.perf_counter()
+    client = bank.FakeClient(synthetic_transactions(n, seed))
+    generate_seconds = time.perf_counter() - gen_start
+
+    main.connect(db_path)
+    # Start from an old watermark so every page is read, in big pages
+    main.cur.executemany(
+        "INSERT INTO sync_watermark VALUES (?, 0, '')",
+        [(a,) for a in (RENT_ACCOUNT, SAVE_ACCOUNT, SPEND_ACCOUNT)],
+    )
+    bank.PAGE_SIZE, bank.MAX_PAGES = 1000, sys.maxsize
+
+    main.stage_seconds.clear()
+    start = time.perf_counter()
+    with open(os.devnull, "w") as devnull, redirect_stdout(devnull):
+        main.store_saving_and_spend_transactions(client, run_chunk=agent.stub_agent())
+        main.store_pleb_transactions_in_db(client)
+    total_seconds = time.perf_counter() - start
+
+    stored = main.cur.execute("SELECT COUNT(*) FROM transactions").fetchone()[0]
+    stored += main.cur.execute("SELECT COUNT(*) FROM rent_payments").fetchone()[0]
+    main.con.close()
+    return {
+        "time": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "revision": git_revision(),
+        "python": sys.version.split()[0],
+        "transactions": n,
+        "stored": stored,
+        "requests": client.requests,
+        "generate_seconds": round(generate_seconds, 4),
+        "stage_seconds": {k: round(v, 4) for k, v in main.stage_seconds.items()},
+        "total_seconds": round(total_seconds, 4),
+        "transactions_per_second": round(n / total_seconds, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000])
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default="bench_sync_results.jsonl")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        # Keep the bench away from the real database, agent cache and model
+        os.environ["SQLITE_URL"] = os.path.join(workdir, "unused.db")
+        os.environ["CUSTOMER_ID"] = "bench"
+        os.environ["BUDGET_ACCOUNTS"] = (
+            f"rent:{RENT_ACCOUNT},shared:{SAVE_ACCOUNT},shared:{SPEND_ACCOUNT}"
+        )
+        os.environ["CATEGORY_CACHE_PATH"] = os.path.join(workdir, "cache.db")
+        os.environ["CLASSIFIER_PATH"] = os.path.join(workdir, "model.json")
+
+        with open(args.output, "a") as out:
+            for n in args.sizes:
+                result = run(n, args.seed, workdir)
+                print(json.dumps(result))
+                out.write(json.dumps(result) + "\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,229 @@
+import json
+import math
+import os
+import sqlite3
+import sys
+import time
+from typing import Iterable, Optional
+import zlib
+
+from dotenv import load_dotenv
+
+import storage
+import vendors
+
+MODEL_PATH = os.environ.get("CLASSIFIER_PATH", "category_model.json")
+N_FEATURES = 2**18
+ALPHA = 0.1
+# Predictions below this go on to the agent
+MIN_CONFIDENCE = 0.9
+# Categories that aren't decided by what was bought
+SKIP_LABELS = {"", "Debit"}
+# One in HOLDOUT rows (by transaction_id) is kept out of training for the report
+HOLDOUT = 10
+# Where a category came from, as recorded in storage's category_source table
+AGENT, USER, VENDOR_INDEX, CLASSIFIER = "agent", "user", "vendor", "classifier"
+# Only these are learned, learning the model's and the vendor index's own guesses
+# would reinforce their mistakes. Rows with no source predate it and are kept.
+CONFIRMED_SOURCES = {AGENT, USER}
+# Categorized rows with the source of their category, None when unrecorded
+_LABELLED_ROWS = """
+    SELECT t.rowid, t.transaction_id, t.vendor, t.description, t.location, t.category,
+        s.source
+    FROM transactions t LEFT JOIN category_source s USING (transaction_id)
+"""
+
+
+def features(vendor: str, description: str, location: str) -> list[int]:
+    """Hashed word and character trigram features."""
+    vendor_key = vendors.normalize_vendor(vendor or "", location or "")
+    text = [
+        ("v", vendor_key),
+        ("d", vendors.normalize_vendor(description or "", location or "")),
+        ("l", vendors.normalize_vendor(location or "")),
+    ]
+    grams = []
+    for field, value in text:
+        grams.extend(f"{field}w:{w}" for w in value.split())
+    grams.extend(f"vc:{g}" for g in vendors.trigrams(vendor_key))
+    return [zlib.crc32(g.encode()) % N_FEATURES for g in grams]
+
+
+def is_holdout(transaction_id: str) -> bool:
+    return zlib.crc32((transaction_id or "").encode()) % HOLDOUT == 0
+
+
+def is_confirmed(source: Optional[str]) -> bool:
+    return source is None or source in CONFIRMED_SOURCES
+
+
+class NaiveBayes:
+    """Multinomial naive Bayes that can keep learning from new rows."""
+
+    def __init__(self):
+        self.class_counts: dict[str, int] = {}
+        self.feature_counts: dict[str, dict[int, int]] = {}
+        self.feature_totals: dict[str, int] = {}
+        self.trained_rowid = 0
+
+    def learn(self, feats: list[int], label: str) -> None:
+        self.class_counts[label] = self.class_counts.get(label, 0) + 1
+        counts = self.feature_counts.setdefault(label, {})
+        for f in feats:
+            counts[f] = counts.get(f, 0) + 1
+        self.feature_totals[label] = self.feature_totals.get(label, 0) + len(feats)
+
+    def predict(self, feats: list[int]) -> Optional[tuple[str, float]]:
+        if not self.class_counts:
+            return None
+        n = sum(self.class_counts.values())
+        scores = {}
+        for label, count in self.class_counts.items():
+            counts = self.feature_counts[label]
+            denominator = math.log(self.feature_totals[label] + ALPHA * N_FEATURES)
+            score = math.log(count / n)
+            for f in feats:
+                score += math.log(counts.get(f, 0) + ALPHA) - denominator
+            scores[label] = score
+
+        # Softmax over the log scores for a confidence
+        best = max(scores, key=scores.__getitem__)
+        total = sum(math.exp(s - scores[best]) for s in scores.values())
+        return best, 1 / total
+
+    def train_from_table(self, cur: sqlite3.Cursor, holdout: bool = False) -> int:
+        """Learn every row with a confirmed category added since the last call."""
+        rows = cur.execute(
+            f"{_LABELLED_ROWS} WHERE t.rowid > ? ORDER BY t.rowid",
+            (self.trained_rowid,),
+        ).fetchall()
+        learned = 0
+        for row in rows:
+            rowid, transaction_id, vendor, description, location, category, source = row
+            self.trained_rowid = rowid
+            if category in SKIP_LABELS or not (vendor or description):
+                continue
+            if not is_confirmed(source):
+                continue
+            if holdout and is_holdout(transaction_id):
+                continue
+            self.learn(features(vendor, description, location), category)
+            learned += 1
+        return learned
+
+    def learn_categorized(self, rows: Iterable[tuple[str, str, str, str]]) -> int:
+        """Learn (vendor, description, location, category) rows confirmed after
+        train_from_table went past them, it only ever reads a row once."""
+        learned = 0
+        for vendor, description, location, category in rows:
+            if category in SKIP_LABELS or not (vendor or description):
+                continue
+            self.learn(features(vendor, description, location), category)
+            learned += 1
+        return learned
+
+    def save(self, path: str = MODEL_PATH) -> None:
+        tmp = f"{path}.tmp"
+        with open(tmp, "w") as f:
+            json.dump(
+                {
+                    "class_counts": self.class_counts,
+                    "feature_counts": self.feature_counts,
+                    "feature_totals": self.feature_totals,
+                    "trained_rowid": self.trained_rowid,
+                },
+                f,
+            )
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path: str = MODEL_PATH) -> "NaiveBayes":
+        model = cls()
+        if not os.path.exists(path):
+            return model
+        with open(path) as f:
+            data = json.load(f)
+        model.class_counts = data["class_counts"]
+        model.feature_counts = {
+            label: {int(k): v for k, v in counts.items()}
+            for label, counts in data["feature_counts"].items()
+        }
+        model.feature_totals = data["feature_totals"]
+        model.trained_rowid = data["trained_rowid"]
+        return model
+
+
+def update_model(cur: sqlite3.Cursor, path: str = MODEL_PATH) -> NaiveBayes:
+    model = NaiveBayes.load(path)
+    learned = model.train_from_table(cur)
+    if learned:
+        model.save(path)
+        print(f"classifier learned {learned} new transactions")
+    return model
+
+
+def retrain(cur: sqlite3.Cursor, path: str = MODEL_PATH) -> NaiveBayes:
+    model = NaiveBayes()
+    learned = model.train_from_table(cur)
+    model.save(path)
+    print(f"classifier trained on {learned} transactions, saved to {path}")
+    return model
+
+
+def report(cur: sqlite3.Cursor, threshold: float = MIN_CONFIDENCE) -> dict:
+    """Train without the held-out rows and score them."""
+    start = time.perf_counter()
+    model = NaiveBayes()
+    model.train_from_table(cur, holdout=True)
+    train_seconds = time.perf_counter() - start
+
+    rows = [
+        r[1:6]
+        for r in cur.execute(_LABELLED_ROWS).fetchall()
+        if is_holdout(r[1])
+        and r[5] not in SKIP_LABELS
+        and (r[2] or r[3])
+        and is_confirmed(r[6])
+    ]
+    start = time.perf_counter()
+    predictions = [model.predict(features(v, d, l)) for _, v, d, l, _ in rows]
+    score_seconds = time.perf_counter() - start
+
+    correct = confident = confident_correct = 0
+    for row, prediction in zip(rows, predictions):
+        if not prediction:
+            continue
+        label, confidence = prediction
+        correct += label == row[4]
+        if confidence >= threshold:
+            confident += 1
+            confident_correct += label == row[4]
+
+    n = len(rows)
+    result = {
+        "held_out": n,
+        "accuracy": correct / n if n else 0.0,
+        "threshold": threshold,
+        "coverage": confident / n if n else 0.0,
+        "accuracy_above_threshold": confident_correct / confident if confident else 0.0,
+        "train_seconds": round(train_seconds, 4),
+        "score_ms_per_transaction": round(score_seconds * 1000 / n, 4) if n else 0.0,
+    }
+    print(json.dumps(result, indent=2))
+    return result
+
+
+if __name__ == "__main__":
+    load_dotenv(".env")
+    SQLITE_URL = os.environ.get("SQLITE_URL")
+    assert SQLITE_URL
+
+    command = sys.argv[1] if len(sys.argv) > 1 else "report"
+    cur = storage.connect(SQLITE_URL).cursor()
+    if command == "retrain":
+        retrain(cur)
+    elif command == "report":
+        report(cur)
+    else:
+        print(f"unknown command {command}, expected retrain or report")
+        exit(1)
@@ -0,0 +1,94 @@
+"""Per-renter balances kept in step with rent_payments.
+
+rent_payments stays the event log: rent notices (negative, written by the
+rent-notice bot) and payments (positive, written by the sync). A trigger folds
+every insert into renter_balance in the same transaction, whichever program
+wrote it, so a balance is one primary key lookup however long the history is.
+"""
+
+import sqlite3
+import time
+from typing import Optional
+
+# renter_balance and its triggers are created by storage.py's migrations
+_REBUILD_QUERY = """
+    SELECT
+        discord_id,
+        SUM(amount),
+        MAX(CASE WHEN amount > 0 THEN time END),
+        MAX(CASE WHEN amount < 0 THEN time END),
+        COUNT(*)
+    FROM rent_payments
+    GROUP BY discord_id
+"""
+
+
+def rebuild(con: sqlite3.Connection) -> None:
+    """Recompute every balance from the event log."""
+    con.execute("DELETE FROM renter_balance")
+    con.execute(f"INSERT INTO renter_balance {_REBUILD_QUERY}")
+
+
+def current_balance(con: sqlite3.Connection, discord_id: int) -> int:
+    row = con.execute(
+        "SELECT balance FROM renter_balance WHERE discord_id = ?", (discord_id,)
+    ).fetchone()
+    return row[0] if row else 0
+
+
+def balance_as_of(con: sqlite3.Connection, discord_id: int, at: int) -> int:
+    """Balance including every event up to and including unix time `at`."""
+    row = con.execute(
+        "SELECT SUM(amount) FROM rent_payments WHERE discord_id = ? AND time <= ?",
+        (discord_id, at),
+    ).fetchone()
+    return row[0] or 0
+
+
+def balances(con: sqlite3.Connection) -> list[tuple[str, int, int]]:
+    """(name, discord_id, balance) for every renter with any rent history."""
+    return con.execute(
+        """
+        SELECT COALESCE(r.name, ''), b.discord_id, b.balance
+        FROM renter_balance AS b
+        LEFT JOIN renter AS r ON r.discord_id = b.discord_id
+        ORDER BY b.balance
+        """
+    ).fetchall()
+
+
+def overdue(
+    con: sqlite3.Connection, threshold: int = 0, now: Optional[int] = None
+) -> list[tuple[str, int, int, int]]:
+    """(name, discord_id, balance, days since last payment) for renters owing more than threshold cents."""
+    now = now or int(time.time())
+    rows = con.execute(
+        """
+        SELECT COALESCE(r.name, ''), b.discord_id, b.balance, b.last_payment
+        FROM renter_balance AS b
+        LEFT JOIN renter AS r ON r.discord_id = b.discord_id
+        WHERE b.balance < ?
+        ORDER BY b.balance
+        """,
+        (-threshold,),
+    ).fetchall()
+    return [
+        (name, discord_id, balance, (now - last_payment) // 86400 if last_payment else -1)
+        for name, discord_id, balance, last_payment in rows
+    ]
+
+
+def reconcile(con: sqlite3.Connection, fix: bool = True) -> list[tuple]:
+    """Compare renter_balance with the event log, returning (discord_id, stored, expected) mismatches."""
+    expected = {row[0]: row for row in con.execute(_REBUILD_QUERY).fetchall()}
+    stored = {
+        row[0]: row for row in con.execute("SELECT * FROM renter_balance").fetchall()
+    }
+    mismatches = [
+        (discord_id, stored.get(discord_id), expected.get(discord_id))
+        for discord_id in expected.keys() | stored.keys()
+        if stored.get(discord_id) != expected.get(discord_id)
+    ]
+    if mismatches and fix:
+        rebuild(con)
+    return mismatches
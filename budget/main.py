@@ -1,17 +1,68 @@
-from getpass import getpass
+import argparse
+from collections import defaultdict
+from contextlib import contextmanager
+from datetime import date, timedelta
+from functools import cache
+import queue
+import threading
 import time
-
-from meatie import limit
-from ubank import Client, Passkey
+from typing import Iterable, Iterator, Optional
 
 import sqlite3
 import os
 from dotenv import load_dotenv
-import agent
-
-
-class Transaction:
-    def __init__(
+import bank
+import classifier
+import ledger
+import rollups
+import storage
+import vendors
+
+# ubank, the agent (google.adk/genai) and the passkey are loaded on first use so
+# commands that don't need them start quickly
+
+
+# The transactions table's columns, in table order
+TRANSACTION_COLUMNS = (
+    "account_id",
+    "transaction_id",
+    "account_name",
+    "amount",
+    "time",
+    "vendor",
+    "category",
+    "location",
+    "description",
+)
+
+
+class TransactionBatch:
+    """Transactions as one list per transactions column, row i across all of them.
+
+    No per-row objects: rows are appended straight into the columns, inserted
+    from zip(*columns) and categorized by writing into the category column, with
+    who decided each category this run in category_source.
+    """
+
+    __slots__ = TRANSACTION_COLUMNS + ("category_source",)
+
+    def __init__(self):
+        for column in TRANSACTION_COLUMNS:
+            setattr(self, column, [])
+        # {row: classifier.AGENT, VENDOR_INDEX or CLASSIFIER}
+        self.category_source: dict[int, str] = {}
+
+    @classmethod
+    def from_rows(cls, rows: Iterable[tuple]) -> "TransactionBatch":
+        batch = cls()
+        for column, values in zip(TRANSACTION_COLUMNS, zip(*rows)):
+            setattr(batch, column, list(values))
+        return batch
+
+    def __len__(self) -> int:
+        return len(self.transaction_id)
+
+    def append(
         self,
         account_id: str,
         transaction_id: str,
@@ -22,247 +73,658 @@ class Transaction:
         category: str,
         location: str,
         description: str,
-    ):
-        self.account_id = account_id
-        self.transaction_id = transaction_id
-        self.account_name = account_name
-        self.amount = amount
-        self.time = time
-        self.vendor = vendor
-        self.category = category
-        self.location = location
-        self.description = description
-
-    def to_tuple(self):
-        return (
-            self.account_id,
-            self.transaction_id,
-            self.account_name,
-            self.amount,
-            self.time,
-            self.vendor,
-            self.category,
-            self.location,
-            self.description,
+    ) -> None:
+        self.account_id.append(account_id)
+        self.transaction_id.append(transaction_id)
+        self.account_name.append(account_name)
+        self.amount.append(amount)
+        self.time.append(time)
+        self.vendor.append(vendor)
+        self.category.append(category)
+        self.location.append(location)
+        self.description.append(description)
+
+    def rows(self) -> Iterator[tuple]:
+        """Table rows for executemany, built one at a time as it reads them."""
+        return zip(*(getattr(self, column) for column in TRANSACTION_COLUMNS))
+
+    def vendor_categories(self) -> Iterator[tuple[str, str, str]]:
+        return zip(self.vendor, self.location, self.category)
+
+    def category_sources(self) -> Iterator[tuple[str, str]]:
+        """(transaction_id, source) of the categories filled in, for the table."""
+        return ((self.transaction_id[i], s) for i, s in self.category_source.items())
+
+    def confirmed(self) -> Iterator[tuple[str, str, str, str]]:
+        """(vendor, description, location, category) of the rows the agent
+        categorized, the ones the classifier may learn."""
+        for i, source in self.category_source.items():
+            if source in classifier.CONFIRMED_SOURCES:
+                yield (
+                    self.vendor[i],
+                    self.description[i],
+                    self.location[i],
+                    self.category[i],
+                )
+
+    def uncategorized(self) -> list[int]:
+        return [i for i, category in enumerate(self.category) if not category]
+
+    def agent_inputs(self, rows: list[int]) -> list:
+        """agent.TransactionInput for each row, validated as one list."""
+        picked = [[getattr(self, name)[i] for i in rows] for name in AGENT_INPUT_COLUMNS]
+        return agent_input_list().validate_python(
+            [dict(zip(AGENT_INPUT_COLUMNS, values)) for values in zip(*picked)]
         )
 
 
-load_dotenv(".env")
-HUGH_ACCOUNT_ID = os.environ.get("HUGH_ACCOUNT_ID")
-BANK_ID = "1"
-CUSTOMER_ID = os.environ.get("CUSTOMER_ID")
-SQLITE_URL = os.environ.get("SQLITE_URL")
-PASSKEY_PATH = os.environ.get("PASSKEY_PATH")
-UBANK_PASS = os.environ.get("UBANK_PASS")
-SHARED_SAVE_ACCOUNT_ID = os.environ.get("SHARED_SAVE_ACCOUNT_ID")
-SHARED_SPEND_ACCOUNT_ID = os.environ.get("SHARED_SPEND_ACCOUNT_ID")
-RENT_TABLE = "rent_payments"
-TRANSACTION_TABLE = "transactions"
+# The columns agent.TransactionInput has
+AGENT_INPUT_COLUMNS = (
+    "account_id",
+    "transaction_id",
+    "amount",
+    "time",
+    "vendor",
+    "location",
+    "description",
+)
 
-assert SQLITE_URL
-assert CUSTOMER_ID
-assert HUGH_ACCOUNT_ID
-assert PASSKEY_PATH
-assert UBANK_PASS
-assert isinstance(SQLITE_URL, str)
 
+@cache
+def agent_input_list():
+    import agent
+    from pydantic import TypeAdapter
 
-con = sqlite3.connect(SQLITE_URL)
-cur = con.cursor()
+    return TypeAdapter(list[agent.TransactionInput])
 
-with open(PASSKEY_PATH, "rb") as f:
-    passkey = Passkey.load(f, password=UBANK_PASS)
 
+# Set by connect()
+con: sqlite3.Connection
+cur: sqlite3.Cursor
 
-def get_plebs() -> dict[str, int]:
-    res = cur.execute("SELECT name, discord_id FROM renter")
-    plebs = res.fetchall()
+# Wall-clock seconds spent in each sync stage, read by bench_sync.py
+stage_seconds: dict[str, float] = defaultdict(float)
+
+
+@contextmanager
+def timed(stage: str):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        stage_seconds[stage] += time.perf_counter() - start
+
+
+@cache
+def env(name: str) -> str:
+    load_dotenv(".env")
+    value = os.environ.get(name)
+    assert value, f"{name} is not set"
+    return value
+
+
+@cache
+def get_accounts() -> list[bank.Account]:
+    load_dotenv(".env")
+    accounts = bank.load_accounts()
+    assert accounts, "no accounts configured, set BUDGET_ACCOUNTS"
+    return accounts
+
+
+def connect(url: Optional[str] = None) -> sqlite3.Connection:
+    global con, cur
+    con = storage.connect(url or env("SQLITE_URL"))
+    cur = con.cursor()
+    return con
+
+
+@cache
+def get_passkey():
+    from ubank import Passkey
+
+    with open(env("PASSKEY_PATH"), "rb") as f:
+        return Passkey.load(f, password=env("UBANK_PASS"))
+
+
+def open_client():
+    from ubank import Client
+
+    return Client(get_passkey())
 
-    pleb_info = {}
-    for pleb_name, pleb_id in plebs:
-        pleb_info[pleb_name] = pleb_id
+
+def get_plebs() -> dict[str, int]:
+    pleb_info = storage.get_renters(con)
     print(f"pleb_names={pleb_info}")
     return pleb_info
 
 
-def get_all_transaction_ids_from_table(
-    table: str,
-) -> set[str]:
-    ids = cur.execute(f"SELECT transaction_id  FROM {table}").fetchall()
-    ids = [x[0] for x in ids if x[0] != "" and x[0] != "backfilling data"]
-    return set(ids)
+def accounts_of_kind(kind: str) -> list[bank.Account]:
+    return [a for a in get_accounts() if a.kind == kind]
 
 
-def get_vendor_and_categories() -> dict[str, str]:
-    vendors = cur.execute("SELECT vendor, category FROM transactions").fetchall()
-    v = {}
-    for vendor, category in vendors:
-        v[vendor] = category
-    return v
+def fetch_new_transactions(
+    client, accounts: list[bank.Account]
+) -> tuple[dict[str, list], set[str]]:
+    return bank.fetch_accounts(
+        client, env("CUSTOMER_ID"), accounts, storage.get_watermarks(con)
+    )
 
 
-def store_pleb_transactions_in_db():
+def set_watermark(
+    account_id: str, transactions: list, truncated: bool = False
+) -> None:
+    if truncated:
+        # Moving it would skip the transactions between the old watermark and the
+        # oldest fetched for good, leave it for `backfill` to fill the gap
+        print(
+            f"keeping the watermark for account={account_id}, run backfill from it "
+            "to fetch the rest"
+        )
+        return
+    posted = [(int(t.posted.timestamp()), t.id) for t in transactions if t.posted]
+    if not posted:
+        return
+    storage.set_watermark(con, account_id, *max(posted))
+
+
+def store_pleb_transactions_in_db(
+    client,
+    fetched: Optional[dict[str, list]] = None,
+    truncated: Iterable[str] = (),
+):
     pleb_info = get_plebs()
-    all_transaction_ids = get_all_transaction_ids_from_table(RENT_TABLE)
-    with Client(passkey) as client:
-        transactions_to_insert = []
-        now = int(time.time())
-        for tran in client.search_account_transactions(
-            account_id=HUGH_ACCOUNT_ID,
-            bank_id=BANK_ID,
-            customerId=CUSTOMER_ID,
-        ).transactions:
-            if tran.id in all_transaction_ids:
-                continue
-            if not tran.from_ or not tran.from_.legalName:
-                print(f"transaction had no legal name t={tran}")
-                continue
-            if not tran.value:
-                continue
-
-            pleb_name = tran.from_.legalName
-            if pleb_name not in pleb_info:
-                continue
-
-            pleb_id = pleb_info[pleb_name]
-
-            payment_in_cents = int(float(tran.value.amount) * 100)
-
-            transactions_to_insert.append((pleb_id, payment_in_cents, now, tran.id))
-
-        cur.executemany(
-            f""" INSERT INTO {RENT_TABLE} VALUES (?, ?, ?, ?);""",
-            transactions_to_insert,
+    accounts = accounts_of_kind(bank.RENT)
+    if fetched is None:
+        with timed("fetch"):
+            fetched, truncated = fetch_new_transactions(client, accounts)
+
+    transactions_to_insert = []
+    now = int(time.time())
+    for account in accounts:
+        transactions_to_insert += rent_payment_rows(
+            fetched.get(account.account_id, []), pleb_info, now
         )
-        con.commit()
-        print(f"Saved {len(transactions_to_insert)} in db")
+
+    with timed("insert"), storage.transaction(con):
+        saved = storage.insert_rent_payments(con, transactions_to_insert)
+        for account in accounts:
+            set_watermark(
+                account.account_id,
+                fetched.get(account.account_id, []),
+                account.account_id in truncated,
+            )
+    print(f"Saved {saved} in db")
+
+
+def rent_payment_rows(
+    transactions: list, pleb_info: dict[str, int], paid: Optional[int] = None
+) -> list[tuple]:
+    """(discord_id, amount, time, transaction_id) rows for the payments from renters,
+    at time paid, or when each was posted when paid isn't given."""
+    rows = []
+    for tran in transactions:
+        if not tran.from_ or not tran.from_.legalName:
+            print(f"transaction had no legal name t={tran}")
+            continue
+        if not tran.value:
+            continue
+
+        pleb_name = tran.from_.legalName
+        if pleb_name not in pleb_info:
+            continue
+
+        pleb_id = pleb_info[pleb_name]
+
+        payment_in_cents = int(float(tran.value.amount) * 100)
+
+        if paid is not None:
+            tran_time = paid
+        elif tran.posted:
+            tran_time = int(tran.posted.timestamp())
+        else:
+            tran_time = int(time.time())
+
+        rows.append((pleb_id, payment_in_cents, tran_time, tran.id))
+    return rows
 
 
 def get_all_bank_accounts():
-    with Client(passkey) as client:
+    with open_client() as client:
         banks = client.get_linked_banks()
         for b in banks.linkedBanks:
             for a in b.accounts:
                 print(a.model_dump_json())
 
 
-def store_saving_and_spend_transactions():
-    all_transaction_ids = get_all_transaction_ids_from_table(TRANSACTION_TABLE)
-    vendors = get_vendor_and_categories()
-    with Client(passkey) as client:
-        transactions_to_insert = []
-        transactions = client.search_account_transactions(
-            account_id=SHARED_SAVE_ACCOUNT_ID,
-            bank_id=BANK_ID,
-            customerId=CUSTOMER_ID,
-        ).transactions
-        transactions.extend(
-            client.search_account_transactions(
-                account_id=SHARED_SPEND_ACCOUNT_ID,
-                bank_id=BANK_ID,
-                customerId=CUSTOMER_ID,
-                limit=5,
-            ).transactions
+def store_saving_and_spend_transactions(
+    client,
+    fetched: Optional[dict[str, list]] = None,
+    run_chunk=None,
+    truncated: Iterable[str] = (),
+):
+    accounts = accounts_of_kind(bank.SHARED)
+    if fetched is None:
+        with timed("fetch"):
+            fetched, truncated = fetch_new_transactions(client, accounts)
+    fetched = {a.account_id: fetched.get(a.account_id, []) for a in accounts}
+
+    transactions = [t for account in fetched.values() for t in account]
+    # Only the transactions at the watermark boundary can already be stored
+    with timed("dedupe"):
+        existing_ids = storage.existing_transaction_ids(
+            con, [t.id for t in transactions]
         )
-        for tran in transactions:
-            if tran.id in all_transaction_ids:
-                continue
-            if not tran.value:
-                continue
-            if not tran.posted:
-                print(f"transaction not posted for id={tran.id}")
-                continue
-
-            source = (
-                tran.from_.legalName
-                if tran.from_ and tran.from_.legalName
-                else "bonus interest"
+    batch = transaction_batch(transactions, existing_ids)
+
+    # TODO
+    with timed("categorize"):
+        categorize_transactions(batch, run_chunk)
+
+    with timed("insert"), storage.transaction(con):
+        storage.insert_transactions(con, batch.rows())
+        storage.set_category_sources(con, batch.category_sources())
+        vendors.record(cur, batch.vendor_categories())
+        for account_id, account_transactions in fetched.items():
+            set_watermark(account_id, account_transactions, account_id in truncated)
+
+
+def transaction_batch(transactions: list, existing_ids: set[str]) -> TransactionBatch:
+    """The posted transactions with a value that aren't stored yet, as table columns."""
+    batch = TransactionBatch()
+    for tran in transactions:
+        if tran.id in existing_ids:
+            continue
+        if not tran.value:
+            continue
+        if not tran.posted:
+            print(f"transaction not posted for id={tran.id}")
+            continue
+
+        source = (
+            tran.from_.legalName
+            if tran.from_ and tran.from_.legalName
+            else "bonus interest"
+        )
+
+        payment_in_cents = int(float(tran.value.amount) * 100)
+
+        tran_time = int(tran.posted.timestamp())
+
+        if tran.lwc:
+            batch.append(
+                tran.accountId,
+                tran.id,
+                source,
+                payment_in_cents,
+                tran_time,
+                tran.lwc.get("merchantName", ""),
+                "",
+                tran.lwc.get("merchantLocation", ""),
+                tran.shortDescription if tran.shortDescription else "",
+            )
+        else:
+            batch.append(
+                tran.accountId,
+                tran.id,
+                source,
+                payment_in_cents,
+                tran_time,
+                "",
+                "Debit",
+                "",
+                "",
             )
+    return batch
 
-            payment_in_cents = int(float(tran.value.amount) * 100)
 
-            tran_time = int(tran.posted.timestamp())
+def categorize_transactions(
+    batch: TransactionBatch,
+    run_chunk=None,
+    model: Optional[classifier.NaiveBayes] = None,
+) -> None:
+    """Fill in the batch's empty categories from known vendors, then the classifier,
+    then the agent."""
+    for_agent = categorize_known(batch, model or classifier.update_model(cur))
+    if for_agent:
+        import agent
+
+        # Agent requires Pydantic base model as input
+        agent_output = agent.categorize_transactions(
+            batch.agent_inputs(for_agent), run_chunk
+        )
+        if agent_output:
+            answers = {e["transaction_id"]: e["category"] for e in agent_output}
+            for i in for_agent:
+                batch.category[i] = answers.get(batch.transaction_id[i], "")
+                if batch.category[i]:
+                    batch.category_source[i] = classifier.AGENT
+
+
+def categorize_known(
+    batch: TransactionBatch, model: classifier.NaiveBayes
+) -> list[int]:
+    """Fill in the empty categories known vendors or the classifier are sure of,
+    returning the rows left for the agent."""
+    category = batch.category
+    for_agent = []
+    for i in batch.uncategorized():
+        vendor, location = batch.vendor[i], batch.location[i]
+        if match := vendors.lookup(cur, vendor, location):
+            category[i], _ = match
+            batch.category_source[i] = classifier.VENDOR_INDEX
+            continue
+        prediction = model.predict(
+            classifier.features(vendor, batch.description[i], location)
+        )
+        if prediction and prediction[1] >= classifier.MIN_CONFIDENCE:
+            category[i], _ = prediction
+            batch.category_source[i] = classifier.CLASSIFIER
+            continue
+        for_agent.append(i)
+    return for_agent
 
-            if tran.lwc:
-                tran_vendor = tran.lwc.get("merchantName", "")
-                tran_location = tran.lwc.get("merchantLocation", "")
-                transaction = Transaction(
-                    tran.accountId,
-                    tran.id,
-                    source,
-                    payment_in_cents,
-                    tran_time,
-                    tran_vendor,
-                    "",
-                    tran_location,
-                    tran.shortDescription if tran.shortDescription else "",
-                )
-            else:
-                transaction = Transaction(
-                    tran.accountId,
-                    tran.id,
-                    source,
-                    payment_in_cents,
-                    tran_time,
-                    "",
-                    "Debit",
-                    "",
-                    "",
-                )
 
-            transactions_to_insert.append(transaction)
+def sync(client):
+    # Fetch every account at once so the sync takes as long as the slowest account
+    fetched, truncated = fetch_new_transactions(client, get_accounts())
+    store_saving_and_spend_transactions(client, fetched, truncated=truncated)
+    store_pleb_transactions_in_db(client, fetched, truncated)
 
-    # TODO
-    categorize_transactions(vendors, transactions_to_insert)
-
-    cur.executemany(
-        f"""
-        INSERT INTO {TRANSACTION_TABLE} VALUES (
-            ?, ?, ?, ?, ?, ?, ?, ?, ?
-        );
-        """,
-        [t.to_tuple() for t in transactions_to_insert],
+
+def categorize_stored_transactions():
+    columns = ", ".join(TRANSACTION_COLUMNS)
+    batch = TransactionBatch.from_rows(
+        cur.execute(f"SELECT {columns} FROM transactions WHERE category = ''")
     )
-    con.commit()
+    model = classifier.update_model(cur)
+    categorize_transactions(batch, model=model)
+
+    categorized = sum(1 for c in batch.category if c)
+    with storage.transaction(con):
+        storage.set_categories(
+            con, ((c, t) for c, t in zip(batch.category, batch.transaction_id) if c)
+        )
+        storage.set_category_sources(con, batch.category_sources())
+        vendors.record(cur, batch.vendor_categories())
+    # The model read these rows while they were uncategorized
+    model.learn_categorized(batch.confirmed())
+    model.save()
+    print(f"categorized {categorized}/{len(batch)} stored transactions")
+
+
+class CategorizeQueue:
+    """Agent categorization on a worker thread, so a backfill keeps fetching while the
+    agent answers.
+
+    Answers come back as (category, transaction_id, vendor, location, description)
+    for the caller to write, sqlite3 connections stay on the thread that opened them.
+    """
+
+    def __init__(self, run_chunk=None):
+        self.run_chunk = run_chunk
+        self.pending: queue.Queue = queue.Queue()
+        self.answers: queue.Queue = queue.Queue()
+        self.queued = 0
+        self.answered = 0
+        self.worker = threading.Thread(target=self._work, daemon=True)
+        self.worker.start()
+
+    def put(self, inputs: list) -> None:
+        self.queued += len(inputs)
+        self.pending.put(inputs)
+
+    def _work(self) -> None:
+        import agent
+
+        cache = agent.CategoryCache()
+        while (inputs := self.pending.get()) is not None:
+            try:
+                output = agent.categorize_transactions(inputs, self.run_chunk, cache)
+            except Exception as e:
+                print(f"agent failed for {len(inputs)} transactions e={e}")
+                output = []
+            by_id = {t.transaction_id: t for t in inputs}
+            self.answers.put(
+                [
+                    (
+                        e["category"],
+                        t.transaction_id,
+                        t.vendor,
+                        t.location,
+                        t.description,
+                    )
+                    for e in output
+                    if (t := by_id.get(e["transaction_id"]))
+                ]
+            )
+            self.answered += len(inputs)
+        cache.con.close()
+
+    def waiting(self) -> int:
+        return self.queued - self.answered
+
+    def take(self) -> list[tuple[str, str, str, str, str]]:
+        """The answers ready so far."""
+        answers = []
+        while True:
+            try:
+                answers += self.answers.get_nowait()
+            except queue.Empty:
+                return answers
+
+    def close(self) -> list[tuple[str, str, str, str, str]]:
+        """Wait for the agent to answer everything queued and return what's left."""
+        self.pending.put(None)
+        self.worker.join()
+        return self.take()
+
+
+def store_categories(
+    answers: list[tuple[str, str, str, str, str]], model: classifier.NaiveBayes
+) -> None:
+    if not answers:
+        return
+    with timed("insert"), storage.transaction(con):
+        storage.set_categories(con, ((c, t) for c, t, _, _, _ in answers))
+        storage.set_category_sources(
+            con, ((t, classifier.AGENT) for _, t, _, _, _ in answers)
+        )
+        vendors.record(cur, ((v, l, c) for c, _, v, l, _ in answers))
+    # The rows were stored uncategorized, so train_from_table has already passed them
+    model.learn_categorized((v, d, l, c) for c, _, v, l, d in answers)
 
 
-def categorize_transactions(
-    vendors: dict[str, str], transactions: list[Transaction]
+def backfill(
+    client,
+    start: date,
+    end: date,
+    window_days: int = bank.BACKFILL_WINDOW_DAYS,
+    run_chunk=None,
 ) -> None:
+    """Load every account's history from start to end, a window of days at a time.
 
-    def _enforce_input_schema(t: Transaction) -> agent.TransactionInput:
-        return agent.TransactionInput(
-            account_id=t.account_id,
-            transaction_id=t.transaction_id,
-            amount=t.amount,
-            source=t.source,
-            time=t.time,
-            vendor=t.vendor,
-            location=t.location,
-            description=t.description,
+    Each window is stored with its checkpoint in one transaction, so running the
+    same backfill again carries on after the last stored window. Rows the agent
+    hasn't categorized when a run stops stay uncategorized for `categorize`.
+    """
+    customer_id = env("CUSTOMER_ID")
+    pleb_info = get_plebs()
+    model = classifier.update_model(cur)
+    plan = []
+    for account in get_accounts():
+        done = storage.get_backfill_checkpoint(
+            con, account.account_id, start.isoformat()
         )
+        resume = date.fromisoformat(done) + timedelta(days=1) if done else start
+        if done:
+            print(f"resuming backfill account={account.account_id} after {done}")
+        for window in bank.date_windows(resume, end, window_days):
+            plan.append((account, *window))
+    print(f"backfilling {len(plan)} windows from {start} to {end}")
+
+    categorizer = CategorizeQueue(run_chunk)
+    began = time.perf_counter()
+    fetched = stored = 0
+    try:
+        for i, (account, from_date, to_date) in enumerate(plan, 1):
+            with timed("fetch"):
+                transactions, pages = bank.fetch_window(
+                    client, account.account_id, from_date, to_date
+                )
+            fetched += len(transactions)
 
-    transactions_to_categorize: list[agent.TransactionInput] = []
-    for t in transactions:
-        if t.category:
-            continue
-        if t.vendor in vendors:
-            t.category = vendors[t.vendor]
-            continue
+            for_agent = []
+            if account.kind == bank.RENT:
+                rows = rent_payment_rows(transactions, pleb_info)
+            else:
+                with timed("dedupe"):
+                    existing_ids = storage.existing_transaction_ids(
+                        con, [t.id for t in transactions]
+                    )
+                batch = transaction_batch(transactions, existing_ids)
+                with timed("categorize"):
+                    model.train_from_table(cur)
+                    for_agent = categorize_known(batch, model)
+
+            with timed("insert"), storage.transaction(con):
+                if account.kind == bank.RENT:
+                    stored += storage.insert_rent_payments(con, rows)
+                else:
+                    stored += storage.insert_transactions(con, batch.rows())
+                    storage.set_category_sources(con, batch.category_sources())
+                    vendors.record(cur, batch.vendor_categories())
+                set_watermark(account.account_id, transactions)
+                storage.set_backfill_checkpoint(
+                    con, account.account_id, start.isoformat(), to_date.isoformat()
+                )
 
-        transactions_to_categorize.append(
-            _enforce_input_schema(t)
-        )  # Agent requires Pydantic base model as input
+            if for_agent:
+                categorizer.put(batch.agent_inputs(for_agent))
+            store_categories(categorizer.take(), model)
+
+            elapsed = time.perf_counter() - began
+            print(
+                f"backfill window {i}/{len(plan)} account={account.account_id} "
+                f"{from_date}..{to_date} fetched={len(transactions)} pages={pages} "
+                f"total fetched={fetched} stored={stored} "
+                f"({fetched / elapsed if elapsed else 0:.0f} transactions/s) "
+                f"waiting for agent={categorizer.waiting()}"
+            )
+    except BaseException:
+        # Whatever the agent already answered is worth keeping
+        store_categories(categorizer.take(), model)
+        model.save()
+        print(
+            f"backfill stopped, run it again to resume, "
+            f"{categorizer.waiting()} transactions left for `categorize`"
+        )
+        raise
+
+    if categorizer.waiting():
+        print(f"waiting for the agent to categorize {categorizer.waiting()}")
+    with timed("categorize"):
+        answers = categorizer.close()
+    store_categories(answers, model)
+    model.save()
+    elapsed = time.perf_counter() - began
+    print(
+        f"backfilled {stored} new of {fetched} transactions in {len(plan)} windows, "
+        f"{elapsed:.2f}s ({fetched / elapsed if elapsed else 0:.0f} transactions/s), "
+        f"{categorizer.queued} sent to the agent"
+    )
 
-    if transactions_to_categorize:
-        agent_output = agent.categorize_transactions(transactions_to_categorize)
-        if agent_output:
-            category = {e["transaction_id"]: e["category"] for e in agent_output}
-            for t in transactions:
-                if not t.category:
-                    t.category = category[t.transaction_id]
+
+def main(argv: Optional[list[str]] = None):
+    parser = argparse.ArgumentParser(description="Sync ubank transactions into SQLite")
+    parser.add_argument(
+        "command",
+        nargs="?",
+        default="sync",
+        choices=[
+            "sync",
+            "sync-shared",
+            "sync-rent",
+            "list-accounts",
+            "categorize",
+            "retrain",
+            "balances",
+            "overdue",
+            "reconcile",
+            "spend",
+            "verify-rollups",
+            "backfill",
+        ],
+        help="sync (default) runs sync-shared and sync-rent over one bank session",
+    )
+    this_year = time.strftime("%Y")
+    parser.add_argument("--start", default=f"{this_year}-01", help="spend: YYYY-MM")
+    parser.add_argument("--end", default=f"{this_year}-12", help="spend: YYYY-MM")
+    parser.add_argument("--account", help="spend: only this account_id")
+    parser.add_argument(
+        "--from", dest="from_date", type=date.fromisoformat, help="backfill: YYYY-MM-DD"
+    )
+    parser.add_argument(
+        "--to",
+        dest="to_date",
+        type=date.fromisoformat,
+        default=date.today(),
+        help="backfill: YYYY-MM-DD, default today",
+    )
+    parser.add_argument(
+        "--window-days",
+        type=int,
+        default=bank.BACKFILL_WINDOW_DAYS,
+        help="backfill: days fetched and stored at a time",
+    )
+    args = parser.parse_args(argv)
+    if args.command == "backfill" and not args.from_date:
+        parser.error("backfill needs --from")
+
+    if args.command == "list-accounts":
+        get_all_bank_accounts()
+        return
+
+    connect()
+    if args.command == "categorize":
+        categorize_stored_transactions()
+    elif args.command == "retrain":
+        classifier.retrain(cur)
+    elif args.command == "balances":
+        for name, discord_id, balance in ledger.balances(con):
+            print(f"{name} discord_id={discord_id} balance=${balance / 100:.2f}")
+    elif args.command == "overdue":
+        for name, discord_id, balance, days in ledger.overdue(con):
+            print(
+                f"{name} discord_id={discord_id} owes=${-balance / 100:.2f} "
+                f"days_since_payment={days}"
+            )
+    elif args.command == "reconcile":
+        with storage.transaction(con):
+            mismatches = ledger.reconcile(con)
+        for discord_id, stored, expected in mismatches:
+            print(f"fixed discord_id={discord_id} stored={stored} expected={expected}")
+        print(f"reconciled renter balances, {len(mismatches)} mismatches")
+    elif args.command == "spend":
+        spend = rollups.spend_by_category(con, args.start, args.end, args.account)
+        for category, (total, count) in sorted(spend.items(), key=lambda kv: kv[1]):
+            print(f"{category or 'Uncategorized'}: ${total / 100:.2f} over {count}")
+    elif args.command == "verify-rollups":
+        with storage.transaction(con):
+            mismatches = rollups.verify(con)
+        for table, bucket, stored, expected in mismatches:
+            print(f"fixed {table} {bucket} stored={stored} expected={expected}")
+        print(f"verified spend rollups, {len(mismatches)} mismatches")
+    else:
+        with open_client() as client:
+            if args.command == "sync":
+                sync(client)
+            elif args.command == "sync-shared":
+                store_saving_and_spend_transactions(client)
+            elif args.command == "sync-rent":
+                store_pleb_transactions_in_db(client)
+            elif args.command == "backfill":
+                backfill(client, args.from_date, args.to_date, args.window_days)
 
 
 if __name__ == "__main__":
-    store_saving_and_spend_transactions()
-    store_pleb_transactions_in_db()
+    main()
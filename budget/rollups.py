@@ -0,0 +1,127 @@
+"""Monthly and weekly spend totals kept in step with the transactions table.
+
+Triggers on transactions add each insert to its buckets, move it between
+buckets when its category, amount, time or account changes and take it out on
+delete, all in the writer's transaction. Reports read a handful of buckets
+instead of re-aggregating every transaction. Buckets are in UTC.
+"""
+
+import sqlite3
+from typing import Optional
+
+# Monday 1970-01-05 00:00 UTC, weeks start on Mondays
+_WEEK_EPOCH = 4 * 86400
+_WEEK = 7 * 86400
+
+
+def _week(time: str) -> str:
+    return f"({time} - (({time} - {_WEEK_EPOCH}) % {_WEEK}))"
+
+
+def _month(time: str) -> str:
+    return f"strftime('%Y-%m', {time}, 'unixepoch')"
+
+
+# The tables and triggers are created by storage.py's migrations, bucketing rows
+# the same way as these queries
+_MONTHLY_QUERY = f"""
+    SELECT
+        {_month("time")},
+        COALESCE(category, ''),
+        COALESCE(account_id, ''),
+        SUM(amount),
+        COUNT(*)
+    FROM transactions
+    GROUP BY 1, 2, 3
+"""
+
+_WEEKLY_QUERY = f"""
+    SELECT {_week("time")}, COALESCE(category, ''), SUM(amount), COUNT(*)
+    FROM transactions
+    GROUP BY 1, 2
+"""
+
+
+def rebuild(con: sqlite3.Connection) -> None:
+    """Recompute every bucket from the transactions table."""
+    con.execute("DELETE FROM spend_monthly")
+    con.execute("DELETE FROM spend_weekly")
+    con.execute(f"INSERT INTO spend_monthly {_MONTHLY_QUERY}")
+    con.execute(f"INSERT INTO spend_weekly {_WEEKLY_QUERY}")
+
+
+def verify(con: sqlite3.Connection, fix: bool = True) -> list[tuple]:
+    """Compare the rollups with the raw table, returning (table, bucket, stored, expected) mismatches."""
+    mismatches = []
+    for table, query, key_columns in (
+        ("spend_monthly", _MONTHLY_QUERY, 3),
+        ("spend_weekly", _WEEKLY_QUERY, 2),
+    ):
+        expected = {
+            row[:key_columns]: row[key_columns:] for row in con.execute(query).fetchall()
+        }
+        # Buckets emptied by deletes or moves are left behind with a zero count
+        stored = {
+            row[:key_columns]: row[key_columns:]
+            for row in con.execute(f"SELECT * FROM {table} WHERE count != 0").fetchall()
+        }
+        mismatches.extend(
+            (table, key, stored.get(key), expected.get(key))
+            for key in expected.keys() | stored.keys()
+            if stored.get(key) != expected.get(key)
+        )
+    if mismatches and fix:
+        rebuild(con)
+    return mismatches
+
+
+def spend_by_category(
+    con: sqlite3.Connection,
+    start_month: str,
+    end_month: str,
+    account_id: Optional[str] = None,
+) -> dict[str, tuple[int, int]]:
+    """{category: (total cents, count)} over months start_month..end_month (YYYY-MM, inclusive)."""
+    query = """
+        SELECT category, SUM(total), SUM(count) FROM spend_monthly
+        WHERE month BETWEEN ? AND ?
+    """
+    params: list = [start_month, end_month]
+    if account_id is not None:
+        query += " AND account_id = ?"
+        params.append(account_id)
+    rows = con.execute(query + " GROUP BY category", params).fetchall()
+    return {category: (total, count) for category, total, count in rows if count}
+
+
+def monthly_spend(
+    con: sqlite3.Connection,
+    start_month: str,
+    end_month: str,
+    account_id: Optional[str] = None,
+) -> list[tuple[str, str, int, int]]:
+    """(month, category, total cents, count) per bucket, oldest first."""
+    query = """
+        SELECT month, category, SUM(total), SUM(count) FROM spend_monthly
+        WHERE month BETWEEN ? AND ?
+    """
+    params: list = [start_month, end_month]
+    if account_id is not None:
+        query += " AND account_id = ?"
+        params.append(account_id)
+    rows = con.execute(query + " GROUP BY month, category ORDER BY month", params)
+    return [row for row in rows.fetchall() if row[3]]
+
+
+def weekly_spend(
+    con: sqlite3.Connection, start: int, end: int
+) -> list[tuple[int, str, int, int]]:
+    """(week start, category, total cents, count) for weeks starting in [start, end), oldest first."""
+    return con.execute(
+        """
+        SELECT week, category, total, count FROM spend_weekly
+        WHERE week >= ? AND week < ? AND count != 0
+        ORDER BY week
+        """,
+        (start, end),
+    ).fetchall()
@@ -0,0 +1,497 @@
+"""Owns the budget SQLite schema and every write to it.
+
+The schema is versioned with PRAGMA user_version, connect() applies any
+migrations the database hasn't seen yet. Connections run in autocommit mode so
+writes are grouped explicitly with transaction().
+"""
+
+from contextlib import contextmanager
+import sqlite3
+from typing import Callable, Iterable, Iterator, Optional
+
+import ledger
+import rollups
+import vendors
+
+# Stay under SQLite's host parameter limit for IN (...) lookups
+LOOKUP_CHUNK = 500
+# The rows the unique transaction_id indexes cover, lookups by ID must repeat it for
+# SQLite to use them rather than scan the table
+HAS_UNIQUE_ID = "transaction_id NOT IN ('', 'backfilling data')"
+
+PRAGMAS = (
+    # Readers (the Go chart server, rent bot) don't block the sync writer and vice versa
+    "PRAGMA journal_mode = WAL",
+    # Safe with WAL, only the last transactions can be lost on power failure
+    "PRAGMA synchronous = NORMAL",
+    "PRAGMA busy_timeout = 5000",
+    "PRAGMA temp_store = MEMORY",
+    "PRAGMA cache_size = -20000",
+    "PRAGMA mmap_size = 268435456",
+)
+
+
+def _sql(*statements: str) -> Callable[[sqlite3.Connection], None]:
+    def apply(con: sqlite3.Connection) -> None:
+        for statement in statements:
+            con.execute(statement)
+
+    return apply
+
+
+def _unique_transaction_ids(con: sqlite3.Connection) -> None:
+    # Older syncs could store a transaction twice, keep the first copy
+    for table in ("transactions", "rent_payments"):
+        con.execute(
+            f"""
+            DELETE FROM {table}
+            WHERE transaction_id NOT IN ('', 'backfilling data')
+            AND rowid NOT IN (SELECT MIN(rowid) FROM {table} GROUP BY transaction_id)
+            """
+        )
+        # Rows without a ubank ID (our own notices, backfilled data) are allowed to repeat
+        con.execute(
+            f"""
+            CREATE UNIQUE INDEX IF NOT EXISTS {table}_transaction_id
+            ON {table} (transaction_id)
+            WHERE transaction_id NOT IN ('', 'backfilling data')
+            """
+        )
+
+
+# The DDL of every migration below is written out as it was first applied, so
+# editing ledger.py, rollups.py or vendors.py can't change what an old migration
+# does. Schema changes go in a new migration. The rebuilds fill the new tables
+# from the rows already stored.
+
+
+def _renter_balance(con: sqlite3.Connection) -> None:
+    _sql(
+        """
+        CREATE TABLE IF NOT EXISTS renter_balance (
+            discord_id INTEGER PRIMARY KEY,
+            balance INTEGER NOT NULL, -- cents, negative when they owe rent
+            last_payment INTEGER, -- time of the latest payment
+            last_notice INTEGER, -- time of the latest rent notice
+            events INTEGER NOT NULL
+        )
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS rent_payments_balance_insert
+        AFTER INSERT ON rent_payments
+        BEGIN
+            INSERT INTO renter_balance VALUES (
+                NEW.discord_id,
+                NEW.amount,
+                CASE WHEN NEW.amount > 0 THEN NEW.time END,
+                CASE WHEN NEW.amount < 0 THEN NEW.time END,
+                1
+            )
+            ON CONFLICT (discord_id) DO UPDATE SET
+                balance = balance + excluded.balance,
+                last_payment = COALESCE(
+                    MAX(last_payment, excluded.last_payment),
+                    last_payment,
+                    excluded.last_payment
+                ),
+                last_notice = COALESCE(
+                    MAX(last_notice, excluded.last_notice),
+                    last_notice,
+                    excluded.last_notice
+                ),
+                events = events + 1;
+        END
+        """,
+        # Deleting an event can't recover the last_* times, ledger.reconcile() does that
+        """
+        CREATE TRIGGER IF NOT EXISTS rent_payments_balance_delete
+        AFTER DELETE ON rent_payments
+        BEGIN
+            UPDATE renter_balance
+            SET balance = balance - OLD.amount, events = events - 1
+            WHERE discord_id = OLD.discord_id;
+        END
+        """,
+        # Covers ledger.balance_as_of() without touching the table
+        """
+        CREATE INDEX IF NOT EXISTS rent_payments_discord_id_time_amount
+        ON rent_payments (discord_id, time, amount)
+        """,
+        "DROP INDEX IF EXISTS rent_payments_discord_id",
+    )(con)
+    ledger.rebuild(con)
+
+
+def _spend_rollups(con: sqlite3.Connection) -> None:
+    # Weeks start on Mondays, 345600 is Monday 1970-01-05 00:00 UTC
+    _sql(
+        """
+        CREATE TABLE IF NOT EXISTS spend_monthly (
+            month TEXT NOT NULL, -- YYYY-MM
+            category TEXT NOT NULL,
+            account_id TEXT NOT NULL,
+            total INTEGER NOT NULL, -- cents, negative for money out
+            count INTEGER NOT NULL,
+            PRIMARY KEY (month, category, account_id)
+        ) WITHOUT ROWID
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS spend_weekly (
+            week INTEGER NOT NULL, -- unix time the week starts, Monday 00:00
+            category TEXT NOT NULL,
+            total INTEGER NOT NULL,
+            count INTEGER NOT NULL,
+            PRIMARY KEY (week, category)
+        ) WITHOUT ROWID
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS transactions_rollup_insert
+        AFTER INSERT ON transactions
+        BEGIN
+        INSERT INTO spend_monthly VALUES (
+            strftime('%Y-%m', NEW.time, 'unixepoch'),
+            COALESCE(NEW.category, ''),
+            COALESCE(NEW.account_id, ''),
+            1 * NEW.amount,
+            1
+        )
+        ON CONFLICT (month, category, account_id) DO UPDATE SET
+            total = total + excluded.total, count = count + excluded.count;
+        INSERT INTO spend_weekly VALUES (
+            (NEW.time - ((NEW.time - 345600) % 604800)),
+            COALESCE(NEW.category, ''),
+            1 * NEW.amount,
+            1
+        )
+        ON CONFLICT (week, category) DO UPDATE SET
+            total = total + excluded.total, count = count + excluded.count;
+        END
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS transactions_rollup_delete
+        AFTER DELETE ON transactions
+        BEGIN
+        INSERT INTO spend_monthly VALUES (
+            strftime('%Y-%m', OLD.time, 'unixepoch'),
+            COALESCE(OLD.category, ''),
+            COALESCE(OLD.account_id, ''),
+            -1 * OLD.amount,
+            -1
+        )
+        ON CONFLICT (month, category, account_id) DO UPDATE SET
+            total = total + excluded.total, count = count + excluded.count;
+        INSERT INTO spend_weekly VALUES (
+            (OLD.time - ((OLD.time - 345600) % 604800)),
+            COALESCE(OLD.category, ''),
+            -1 * OLD.amount,
+            -1
+        )
+        ON CONFLICT (week, category) DO UPDATE SET
+            total = total + excluded.total, count = count + excluded.count;
+        END
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS transactions_rollup_update
+        AFTER UPDATE OF category, amount, time, account_id ON transactions
+        BEGIN
+        INSERT INTO spend_monthly VALUES (
+            strftime('%Y-%m', OLD.time, 'unixepoch'),
+            COALESCE(OLD.category, ''),
+            COALESCE(OLD.account_id, ''),
+            -1 * OLD.amount,
+            -1
+        )
+        ON CONFLICT (month, category, account_id) DO UPDATE SET
+            total = total + excluded.total, count = count + excluded.count;
+        INSERT INTO spend_weekly VALUES (
+            (OLD.time - ((OLD.time - 345600) % 604800)),
+            COALESCE(OLD.category, ''),
+            -1 * OLD.amount,
+            -1
+        )
+        ON CONFLICT (week, category) DO UPDATE SET
+            total = total + excluded.total, count = count + excluded.count;
+        INSERT INTO spend_monthly VALUES (
+            strftime('%Y-%m', NEW.time, 'unixepoch'),
+            COALESCE(NEW.category, ''),
+            COALESCE(NEW.account_id, ''),
+            1 * NEW.amount,
+            1
+        )
+        ON CONFLICT (month, category, account_id) DO UPDATE SET
+            total = total + excluded.total, count = count + excluded.count;
+        INSERT INTO spend_weekly VALUES (
+            (NEW.time - ((NEW.time - 345600) % 604800)),
+            COALESCE(NEW.category, ''),
+            1 * NEW.amount,
+            1
+        )
+        ON CONFLICT (week, category) DO UPDATE SET
+            total = total + excluded.total, count = count + excluded.count;
+        END
+        """,
+    )(con)
+    rollups.rebuild(con)
+
+
+def _vendor_index(con: sqlite3.Connection) -> None:
+    _sql(
+        """
+        CREATE TABLE IF NOT EXISTS vendor_category (
+            vendor_key TEXT PRIMARY KEY,
+            category TEXT NOT NULL,
+            seen INTEGER NOT NULL,
+            trigram_count INTEGER NOT NULL
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS vendor_trigram (
+            trigram TEXT NOT NULL,
+            vendor_key TEXT NOT NULL,
+            PRIMARY KEY (trigram, vendor_key)
+        ) WITHOUT ROWID
+        """,
+    )(con)
+    vendors.rebuild(con.cursor())
+
+
+# Index i upgrades a database from user_version i to i + 1. Only ever append.
+MIGRATIONS: list[Callable[[sqlite3.Connection], None]] = [
+    # 1: the tables in data/, for a fresh database
+    _sql(
+        """
+        CREATE TABLE IF NOT EXISTS transactions (
+            account_id TEXT,
+            transaction_id TEXT,
+            account_name TEXT,
+            amount INTEGER,
+            time INTEGER,
+            vendor TEXT,
+            category TEXT,
+            location TEXT,
+            description TEXT
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS rent_payments (
+            discord_id INTEGER,
+            amount INTEGER,
+            time INTEGER,
+            transaction_id TEXT
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS renter (
+            name TEXT,
+            discord_id INTEGER,
+            channel_id INTEGER
+        )
+        """,
+    ),
+    # 2: incremental sync
+    _sql(
+        """
+        CREATE TABLE IF NOT EXISTS sync_watermark (
+            account_id TEXT PRIMARY KEY,
+            last_posted INTEGER NOT NULL,
+            last_id TEXT NOT NULL
+        )
+        """
+    ),
+    # 3: dedupe on transaction_id
+    _unique_transaction_ids,
+    # 4: vendor to category lookups
+    _vendor_index,
+    # 5: the columns we sort, filter and join on
+    _sql(
+        "CREATE INDEX IF NOT EXISTS transactions_time ON transactions (time)",
+        "CREATE INDEX IF NOT EXISTS transactions_vendor ON transactions (vendor)",
+        "CREATE INDEX IF NOT EXISTS transactions_category ON transactions (category)",
+        """
+        CREATE INDEX IF NOT EXISTS rent_payments_discord_id
+        ON rent_payments (discord_id, time)
+        """,
+        "CREATE INDEX IF NOT EXISTS renter_discord_id ON renter (discord_id)",
+    ),
+    # 6: balances maintained by trigger on rent_payments
+    _renter_balance,
+    # 7: spend by month and week maintained by trigger on transactions
+    _spend_rollups,
+    # 8: how far each account's backfill from a start date has got
+    _sql(
+        """
+        CREATE TABLE IF NOT EXISTS backfill_checkpoint (
+            account_id TEXT NOT NULL,
+            start_date TEXT NOT NULL,
+            done_through TEXT NOT NULL,
+            PRIMARY KEY (account_id, start_date)
+        )
+        """
+    ),
+    # 9: (discord_id, time) is a prefix of migration 6's covering index, so the
+    # two-column one only costs rent inserts. Databases migrated while 6 left it
+    # in place still have it.
+    _sql("DROP INDEX IF EXISTS rent_payments_discord_id"),
+    # 10: who decided each category: agent, vendor, classifier, or user for one
+    # corrected by hand. Rows categorized before this have none.
+    _sql(
+        """
+        CREATE TABLE IF NOT EXISTS category_source (
+            transaction_id TEXT PRIMARY KEY,
+            source TEXT NOT NULL
+        ) WITHOUT ROWID
+        """
+    ),
+]
+
+
+@contextmanager
+def transaction(con: sqlite3.Connection) -> Iterator[sqlite3.Connection]:
+    # IMMEDIATE takes the write lock up front rather than failing halfway through
+    con.execute("BEGIN IMMEDIATE")
+    try:
+        yield con
+    except BaseException:
+        con.execute("ROLLBACK")
+        raise
+    con.execute("COMMIT")
+
+
+def migrate(con: sqlite3.Connection) -> int:
+    version = con.execute("PRAGMA user_version").fetchone()[0]
+    for target in range(version + 1, len(MIGRATIONS) + 1):
+        with transaction(con):
+            MIGRATIONS[target - 1](con)
+            con.execute(f"PRAGMA user_version = {target}")
+        print(f"migrated database to version {target}")
+    return len(MIGRATIONS)
+
+
+def connect(url: str) -> sqlite3.Connection:
+    con = sqlite3.connect(url, isolation_level=None)
+    for pragma in PRAGMAS:
+        con.execute(pragma)
+    migrate(con)
+    return con
+
+
+def get_renters(con: sqlite3.Connection) -> dict[str, int]:
+    return dict(con.execute("SELECT name, discord_id FROM renter").fetchall())
+
+
+def get_watermarks(con: sqlite3.Connection) -> dict[str, tuple[int, str]]:
+    rows = con.execute(
+        "SELECT account_id, last_posted, last_id FROM sync_watermark"
+    ).fetchall()
+    return {account_id: (posted, last_id) for account_id, posted, last_id in rows}
+
+
+def set_watermark(
+    con: sqlite3.Connection, account_id: str, last_posted: int, last_id: str
+) -> None:
+    # Never move the watermark backwards
+    con.execute(
+        """
+        INSERT INTO sync_watermark VALUES (?, ?, ?)
+        ON CONFLICT (account_id) DO UPDATE SET
+            last_posted = excluded.last_posted,
+            last_id = excluded.last_id
+        WHERE excluded.last_posted >= sync_watermark.last_posted
+        """,
+        (account_id, last_posted, last_id),
+    )
+
+
+def get_backfill_checkpoint(
+    con: sqlite3.Connection, account_id: str, start_date: str
+) -> Optional[str]:
+    """The last day a backfill of the account from start_date stored, as YYYY-MM-DD."""
+    row = con.execute(
+        """
+        SELECT done_through FROM backfill_checkpoint
+        WHERE account_id = ? AND start_date = ?
+        """,
+        (account_id, start_date),
+    ).fetchone()
+    return row[0] if row else None
+
+
+def set_backfill_checkpoint(
+    con: sqlite3.Connection, account_id: str, start_date: str, done_through: str
+) -> None:
+    """Call in the transaction that stored the window, so the two commit together."""
+    con.execute(
+        """
+        INSERT INTO backfill_checkpoint VALUES (?, ?, ?)
+        ON CONFLICT (account_id, start_date) DO UPDATE SET
+            done_through = excluded.done_through
+        """,
+        (account_id, start_date, done_through),
+    )
+
+
+def _existing_ids(
+    con: sqlite3.Connection, query: str, transaction_ids: list[str]
+) -> set[str]:
+    existing = set()
+    for i in range(0, len(transaction_ids), LOOKUP_CHUNK):
+        chunk = transaction_ids[i : i + LOOKUP_CHUNK]
+        placeholders = ", ".join("?" * len(chunk))
+        rows = con.execute(query.format(placeholders=placeholders), chunk).fetchall()
+        existing.update(r[0] for r in rows)
+    return existing
+
+
+def existing_transaction_ids(
+    con: sqlite3.Connection, transaction_ids: list[str]
+) -> set[str]:
+    return _existing_ids(
+        con,
+        "SELECT transaction_id FROM transactions "
+        f"WHERE transaction_id IN ({{placeholders}}) AND {HAS_UNIQUE_ID}",
+        transaction_ids,
+    )
+
+
+def insert_transactions(con: sqlite3.Connection, rows: Iterable[tuple]) -> int:
+    """Insert (account_id, transaction_id, ..., description) rows, returning how many were new.
+
+    Call inside transaction() so the batch commits once.
+    """
+    # rowcount skips ignored rows and changes made by triggers
+    return con.executemany(
+        "INSERT OR IGNORE INTO transactions VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", rows
+    ).rowcount
+
+
+def insert_rent_payments(con: sqlite3.Connection, rows: Iterable[tuple]) -> int:
+    """Insert (discord_id, amount, time, transaction_id) rows, returning how many were new.
+
+    Call inside transaction() so the batch commits once.
+    """
+    return con.executemany(
+        "INSERT OR IGNORE INTO rent_payments VALUES (?, ?, ?, ?)", rows
+    ).rowcount
+
+
+def set_categories(con: sqlite3.Connection, categories: Iterable[tuple[str, str]]) -> None:
+    """Update (category, transaction_id) pairs."""
+    con.executemany(
+        "UPDATE transactions SET category = ? "
+        f"WHERE transaction_id = ? AND {HAS_UNIQUE_ID}",
+        categories,
+    )
+
+
+def set_category_sources(
+    con: sqlite3.Connection, sources: Iterable[tuple[str, str]]
+) -> None:
+    """Record (transaction_id, source) pairs, call in the transaction that set the
+    categories."""
+    con.executemany(
+        """
+        INSERT INTO category_source VALUES (?, ?)
+        ON CONFLICT (transaction_id) DO UPDATE SET source = excluded.source
+        """,
+        sources,
+    )
@@ -0,0 +1,47 @@
+import os
+import shutil
+import tempfile
+
+import pytest
+
+import bench_sync
+
+# agent.py and classifier.py read their paths on import, so point them away from the
+# real cache and model before any test module imports them
+WORKDIR = tempfile.mkdtemp(prefix="budget-tests-")
+os.environ.update(
+    {
+        "SQLITE_URL": os.path.join(WORKDIR, "unused.db"),
+        "CUSTOMER_ID": "test",
+        "BUDGET_ACCOUNTS": (
+            f"rent:{bench_sync.RENT_ACCOUNT},shared:{bench_sync.SAVE_ACCOUNT},"
+            f"shared:{bench_sync.SPEND_ACCOUNT}"
+        ),
+        "CATEGORY_CACHE_PATH": os.path.join(WORKDIR, "cache.db"),
+        "CLASSIFIER_PATH": os.path.join(WORKDIR, "model.json"),
+    }
+)
+
+
+@pytest.fixture(scope="session", autouse=True)
+def workdir():
+    yield WORKDIR
+    shutil.rmtree(WORKDIR, ignore_errors=True)
+
+
+@pytest.fixture
+def fresh_db(tmp_path):
+    """Makes a new database with the bench renters, and clears the agent cache and
+    model left over from another test or database. Returns its path."""
+    import agent
+
+    def fresh(name: str = "budget.db") -> str:
+        db_path = str(tmp_path / name)
+        bench_sync.create_database(db_path)
+        for path in (os.environ["CATEGORY_CACHE_PATH"], os.environ["CLASSIFIER_PATH"]):
+            if os.path.exists(path):
+                os.remove(path)
+        agent._cache = None
+        return db_path
+
+    return fresh
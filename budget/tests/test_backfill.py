@@ -0,0 +1,147 @@
+from contextlib import redirect_stdout
+from datetime import date, timedelta
+import io
+
+import agent
+import bank
+import bench_sync
+import classifier
+import ledger
+import main
+import rollups
+import storage
+
+START, END = date(2020, 1, 1), date(2025, 1, 1)
+WINDOW_DAYS = 30
+TRANSACTIONS = 3_000
+
+
+def expected_ids(accounts: dict[str, list]) -> set[str]:
+    """What a backfill should store: posted transactions with a value, and rent
+    from known renters."""
+    ids = set()
+    for account, transactions in accounts.items():
+        for t in transactions:
+            if not t.value or not t.posted:
+                continue
+            if account == bench_sync.RENT_ACCOUNT and (
+                not t.from_ or t.from_.legalName not in bench_sync.RENTERS
+            ):
+                continue
+            ids.add(t.id)
+    return ids
+
+
+def stored_rows(con) -> tuple[list, list]:
+    # Categories depend on what the agent answered before the stop, compare the rest
+    transactions = con.execute(
+        """
+        SELECT account_id, transaction_id, account_name, amount, time, vendor,
+            location, description
+        FROM transactions ORDER BY transaction_id
+        """
+    ).fetchall()
+    rent = con.execute("SELECT * FROM rent_payments ORDER BY transaction_id").fetchall()
+    return transactions, rent
+
+
+def remaining_requests(con, accounts: dict[str, list]) -> int:
+    """Requests it takes to fetch the windows after each account's checkpoint."""
+    client = bank.FakeClient(accounts)
+    for account_id in accounts:
+        done = storage.get_backfill_checkpoint(con, account_id, START.isoformat())
+        resume = date.fromisoformat(done) + timedelta(days=1) if done else START
+        for from_date, to_date in bank.date_windows(resume, END, WINDOW_DAYS):
+            bank.fetch_window(client, account_id, from_date, to_date)
+    return client.requests
+
+
+def confirmed_count(cur) -> int:
+    labels = ", ".join(f"'{label}'" for label in classifier.SKIP_LABELS)
+    sources = ", ".join(f"'{source}'" for source in classifier.CONFIRMED_SOURCES)
+    return cur.execute(
+        f"""
+        SELECT COUNT(*) FROM transactions JOIN category_source USING (transaction_id)
+        WHERE category NOT IN ({labels}) AND (vendor != '' OR description != '')
+            AND source IN ({sources})
+        """
+    ).fetchone()[0]
+
+
+def test_backfill(fresh_db):
+    accounts = bench_sync.synthetic_transactions(TRANSACTIONS, seed=0)
+    main.connect(fresh_db())
+    with redirect_stdout(io.StringIO()):
+        main.backfill(
+            bank.FakeClient(accounts), START, END, WINDOW_DAYS, agent.stub_agent()
+        )
+    transactions, rent = stored_rows(main.con)
+    uncategorized = main.cur.execute(
+        "SELECT COUNT(*) FROM transactions WHERE category = ''"
+    ).fetchone()[0]
+    # The saved classifier, caught up on rows stored since, has learned every row
+    # the agent categorized, including those answered after they were stored, and
+    # none of the guesses
+    model = classifier.NaiveBayes.load()
+    model.train_from_table(main.cur)
+    confirmed = confirmed_count(main.cur)
+    guessed = main.cur.execute(
+        "SELECT COUNT(*) FROM category_source WHERE source != 'agent'"
+    ).fetchone()[0]
+    with storage.transaction(main.con):
+        rollup_mismatches = rollups.verify(main.con)
+        ledger_mismatches = ledger.reconcile(main.con)
+    main.con.close()
+
+    stored = {r[1] for r in transactions} | {r[3] for r in rent}
+    assert stored == expected_ids(accounts)
+    assert uncategorized == 0
+    assert guessed
+    assert 0 < sum(model.class_counts.values()) == confirmed
+    assert not rollup_mismatches
+    assert not ledger_mismatches
+
+
+def test_resumed_backfill_matches_straight_through(fresh_db):
+    accounts = bench_sync.synthetic_transactions(TRANSACTIONS, seed=0)
+    run_chunk = agent.stub_agent()
+
+    main.connect(fresh_db("full.db"))
+    client = bank.FakeClient(accounts)
+    with redirect_stdout(io.StringIO()):
+        main.backfill(client, START, END, WINDOW_DAYS, run_chunk)
+    full = stored_rows(main.con)
+    main.con.close()
+
+    class Interrupted(bank.FakeClient):
+        def summarise_transactions(self, body):
+            if self.requests >= client.requests // 2:
+                raise KeyboardInterrupt
+            return super().summarise_transactions(body)
+
+    main.connect(fresh_db("resumed.db"))
+    with redirect_stdout(io.StringIO()):
+        try:
+            main.backfill(Interrupted(accounts), START, END, WINDOW_DAYS, run_chunk)
+        except KeyboardInterrupt:
+            pass
+        remaining = remaining_requests(main.con, accounts)
+        second = bank.FakeClient(accounts)
+        main.backfill(second, START, END, WINDOW_DAYS, run_chunk)
+        # Whatever the interrupted run's agent queue lost
+        main.categorize_stored_transactions()
+    resumed = stored_rows(main.con)
+    with storage.transaction(main.con):
+        rollup_mismatches = rollups.verify(main.con)
+        ledger_mismatches = ledger.reconcile(main.con)
+    uncategorized = main.cur.execute(
+        "SELECT COUNT(*) FROM transactions WHERE category = ''"
+    ).fetchone()[0]
+    main.con.close()
+
+    # Only the windows the first attempt didn't store are fetched again
+    assert second.requests == remaining < client.requests
+    assert resumed == full
+    assert uncategorized == 0
+    assert not rollup_mismatches
+    assert not ledger_mismatches
@@ -0,0 +1,45 @@
+from contextlib import redirect_stdout
+import io
+import json
+
+import bench_batch
+import bench_sync
+import main
+
+
+def synthetic_transactions(n: int) -> list:
+    return [
+        t
+        for account, ts in bench_sync.synthetic_transactions(n, seed=0).items()
+        if account != bench_sync.RENT_ACCOUNT
+        for t in ts
+    ]
+
+
+def test_batch_matches_per_row_transactions():
+    transactions = synthetic_transactions(5_000)
+    rows = bench_batch.per_row_transactions(transactions)
+    with redirect_stdout(io.StringIO()):
+        batch = main.transaction_batch(transactions, set())
+
+    per_row_con, batch_con = bench_batch.table(), bench_batch.table()
+    insert = "INSERT INTO transactions VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)"
+    per_row_con.executemany(insert, [t.to_tuple() for t in rows])
+    batch_con.executemany(insert, batch.rows())
+    query = "SELECT * FROM transactions ORDER BY rowid"
+    assert batch_con.execute(query).fetchall() == per_row_con.execute(query).fetchall()
+
+    expected = [t.model_dump() for t in bench_batch.per_row_agent_inputs(rows)]
+    inputs = batch.agent_inputs(batch.uncategorized())
+    assert expected
+    assert json.dumps([t.model_dump() for t in inputs]) == json.dumps(expected)
+
+
+def test_existing_transactions_are_skipped():
+    transactions = synthetic_transactions(100)
+    existing = {t.id for t in transactions[::2]}
+    with redirect_stdout(io.StringIO()):
+        batch = main.transaction_batch(transactions, existing)
+
+    assert batch.transaction_id
+    assert not existing & set(batch.transaction_id)
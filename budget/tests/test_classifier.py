@@ -0,0 +1,43 @@
+import classifier
+import storage
+
+ROWS = [
+    ("tran-1", "WOOLWORTHS 1234 PYRMONT", "Groceries", classifier.AGENT),
+    ("tran-2", "GUZMAN Y GOMEZ 55 GLEBE", "Dining", classifier.USER),
+    ("tran-3", "UBER 800 SYDNEY", "Transport", classifier.VENDOR_INDEX),
+    ("tran-4", "QANTAS 12 SYDNEY", "Travel", classifier.CLASSIFIER),
+    # Categorized before sources were recorded
+    ("tran-5", "CHEMIST WAREHOUSE 9 ULTIMO", "Health", None),
+]
+
+
+def categorized(fresh_db):
+    con = storage.connect(fresh_db())
+    con.executemany(
+        """
+        INSERT INTO transactions VALUES ('bench-spend', ?, '', -1000, 0, ?, ?, '', '')
+        """,
+        [row[:3] for row in ROWS],
+    )
+    storage.set_category_sources(con, [(row[0], row[3]) for row in ROWS if row[3]])
+    return con
+
+
+def test_learns_only_confirmed_categories(fresh_db):
+    con = categorized(fresh_db)
+    model = classifier.NaiveBayes()
+    learned = model.train_from_table(con.cursor())
+    con.close()
+
+    assert learned == 3
+    assert set(model.class_counts) == {"Groceries", "Dining", "Health"}
+
+
+def test_source_is_replaced_when_confirmed(fresh_db):
+    con = categorized(fresh_db)
+    storage.set_category_sources(con, [("tran-3", classifier.USER)])
+    model = classifier.NaiveBayes()
+    model.train_from_table(con.cursor())
+    con.close()
+
+    assert "Transport" in model.class_counts
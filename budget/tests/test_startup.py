@@ -0,0 +1,6 @@
+import bench_startup
+
+
+def test_main_imports_no_lazy_modules():
+    """Only the commands that talk to the bank or the agent should import them."""
+    assert bench_startup.eager_lazy_modules(bench_startup.import_times("main")) == []
@@ -0,0 +1,40 @@
+from contextlib import redirect_stdout
+from datetime import date, datetime, timezone
+import io
+
+import agent
+import bank
+import bench_sync
+import main
+
+
+def test_truncated_sync_keeps_watermark(fresh_db, monkeypatch):
+    """A sync with more new transactions than MAX_PAGES pages must keep the
+    watermark, so a backfill from it can still fetch the rest."""
+    accounts = bench_sync.synthetic_transactions(2_000, seed=0)
+    client = bank.FakeClient(accounts)
+    main.connect(fresh_db())
+    old = int(datetime(2019, 12, 1, tzinfo=timezone.utc).timestamp())
+    main.cur.executemany(
+        "INSERT INTO sync_watermark VALUES (?, ?, '')",
+        [(a, old) for a in (bench_sync.SAVE_ACCOUNT, bench_sync.SPEND_ACCOUNT)],
+    )
+    monkeypatch.setattr(bank, "PAGE_SIZE", 50)
+    monkeypatch.setattr(bank, "MAX_PAGES", 2)
+
+    with redirect_stdout(io.StringIO()):
+        main.store_saving_and_spend_transactions(client, run_chunk=agent.stub_agent())
+        watermarks = main.storage.get_watermarks(main.con)
+        main.backfill(
+            client, date(2019, 12, 1), date(2025, 1, 1), 365, agent.stub_agent()
+        )
+    stored = {r[0] for r in main.cur.execute("SELECT transaction_id FROM transactions")}
+    main.con.close()
+
+    assert all(w == (old, "") for w in watermarks.values())
+    assert stored == {
+        t.id
+        for account in (bench_sync.SAVE_ACCOUNT, bench_sync.SPEND_ACCOUNT)
+        for t in accounts[account]
+        if t.posted and t.value
+    }
@@ -0,0 +1,122 @@
+import re
+import sqlite3
+from typing import Iterable, Optional
+
+# Created by storage.py's migrations
+VENDOR_TABLE = "vendor_category"
+TRIGRAM_TABLE = "vendor_trigram"
+# Dice similarity of vendor trigrams needed before we trust a near match
+MIN_CONFIDENCE = 0.75
+MAX_CANDIDATES = 20
+
+_NON_ALNUM = re.compile(r"[^a-z0-9 ]+")
+_HAS_DIGIT = re.compile(r"\d")
+# Trailing tokens that say where a purchase happened rather than who the vendor is
+_LOCATION_SUFFIXES = {
+    "au", "aus", "australia",
+    "nsw", "vic", "qld", "wa", "sa", "tas", "act", "nt",
+    "sydney", "melbourne", "brisbane", "perth", "adelaide", "hobart", "darwin", "canberra",
+    "pty", "ltd", "limited",
+}  # fmt: skip
+
+
+def _tokens(text: str) -> list[str]:
+    return _NON_ALNUM.sub(" ", text.lower()).split()
+
+
+def normalize_vendor(vendor: str, location: str = "") -> str:
+    # Drop store numbers and anything else with digits in it
+    tokens = [t for t in _tokens(vendor) if not _HAS_DIGIT.search(t)]
+    suffixes = _LOCATION_SUFFIXES | set(_tokens(location))
+    # Keep at least one token so "Sydney Fish Market" doesn't vanish
+    while len(tokens) > 1 and tokens[-1] in suffixes:
+        tokens.pop()
+    return " ".join(tokens)
+
+
+def trigrams(key: str) -> set[str]:
+    padded = f"  {key} "
+    return {padded[i : i + 3] for i in range(len(padded) - 2)}
+
+
+def rebuild(cur: sqlite3.Cursor) -> None:
+    """Populate the index from every categorized transaction, oldest first."""
+    cur.execute(f"DELETE FROM {VENDOR_TABLE}")
+    cur.execute(f"DELETE FROM {TRIGRAM_TABLE}")
+    rows = cur.execute(
+        """
+        SELECT vendor, location, category FROM transactions
+        WHERE vendor != '' AND category != ''
+        ORDER BY rowid
+        """
+    ).fetchall()
+    record(cur, rows)
+
+
+def record(cur: sqlite3.Cursor, rows: Iterable[tuple[str, str, str]]) -> None:
+    """Add (vendor, location, category) rows, the latest category for a vendor wins."""
+    latest: dict[str, tuple[str, int]] = {}
+    for vendor, location, category in rows:
+        key = normalize_vendor(vendor or "", location or "")
+        if not key or not category:
+            continue
+        _, seen = latest.get(key, ("", 0))
+        latest[key] = (category, seen + 1)
+    if not latest:
+        return
+
+    cur.executemany(
+        f"""
+        INSERT INTO {VENDOR_TABLE} VALUES (?, ?, ?, ?)
+        ON CONFLICT (vendor_key) DO UPDATE SET
+            category = excluded.category,
+            seen = seen + excluded.seen
+        """,
+        [
+            (key, category, seen, len(trigrams(key)))
+            for key, (category, seen) in latest.items()
+        ],
+    )
+    cur.executemany(
+        f"INSERT OR IGNORE INTO {TRIGRAM_TABLE} VALUES (?, ?)",
+        [(tri, key) for key in latest for tri in trigrams(key)],
+    )
+
+
+def lookup(
+    cur: sqlite3.Cursor, vendor: str, location: str = ""
+) -> Optional[tuple[str, float]]:
+    """Return (category, confidence) for the closest known vendor, if close enough."""
+    key = normalize_vendor(vendor or "", location or "")
+    if not key:
+        return None
+
+    exact = cur.execute(
+        f"SELECT category FROM {VENDOR_TABLE} WHERE vendor_key = ?", (key,)
+    ).fetchone()
+    if exact:
+        return (exact[0], 1.0)
+
+    grams = list(trigrams(key))
+    placeholders = ", ".join("?" * len(grams))
+    candidates = cur.execute(
+        f"""
+        SELECT c.category, c.trigram_count, COUNT(*) AS shared
+        FROM {TRIGRAM_TABLE} AS t
+        JOIN {VENDOR_TABLE} AS c ON c.vendor_key = t.vendor_key
+        WHERE t.trigram IN ({placeholders})
+        GROUP BY t.vendor_key
+        ORDER BY shared DESC
+        LIMIT {MAX_CANDIDATES}
+        """,
+        grams,
+    ).fetchall()
+
+    best = None
+    for category, trigram_count, shared in candidates:
+        confidence = 2 * shared / (len(grams) + trigram_count)
+        if best is None or confidence > best[1]:
+            best = (category, confidence)
+    if best and best[1] >= MIN_CONFIDENCE:
+        return best
+    return None
@@ -11,5 +11,9 @@ CREATE TABLE property_sale (
     car_spaces INTEGER,
     water_rates INTEGER,
     council_rates INTEGER,
-    strata INTEGER
+    strata INTEGER,
+    listing_id BIGINT
 );
+
+-- Re-ingesting a scrape upserts on this, see property/store.py
+CREATE UNIQUE INDEX property_sale_listing_id ON property_sale (listing_id);
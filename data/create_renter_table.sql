@@ -1,3 +1,4 @@
+-- The schema is owned by budget/storage.py, which adds indexes and migrations on top of this
 CREATE TABLE rent_payments (
 	discord_id INTEGER,
 	amount INTEGER, -- in cents. Negative for a rent notice. ie they owe money. Positive if they have paid money
@@ -1,3 +1,4 @@
+-- The schema is owned by budget/storage.py, which adds indexes and migrations on top of this
 CREATE TABLE transactions (
   account_id TEXT,
   transaction_id TEXT,
@@ -0,0 +1,14 @@
+-- Created by budget/storage.py, kept up to date by budget/vendors.py as transactions are inserted
+CREATE TABLE vendor_category (
+	vendor_key TEXT PRIMARY KEY, -- normalized vendor, lower case without store numbers or location suffix
+	category TEXT NOT NULL, -- latest category we stored for the vendor
+	seen INTEGER NOT NULL, -- how many transactions we've seen for the vendor
+	trigram_count INTEGER NOT NULL
+);
+
+-- Character trigrams of vendor_key for near matches ("woolworths" ~ "woolworths metro")
+CREATE TABLE vendor_trigram (
+	trigram TEXT NOT NULL,
+	vendor_key TEXT NOT NULL,
+	PRIMARY KEY (trigram, vendor_key)
+) WITHOUT ROWID;
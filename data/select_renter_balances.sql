@@ -0,0 +1,5 @@
+-- renter_balance is kept in step with rent_payments by a trigger, see budget/ledger.py
+SELECT t.name, b.balance, b.discord_id, b.last_payment, b.last_notice FROM renter_balance AS b
+LEFT JOIN renter AS t
+ON b.discord_id = t.discord_id
+ORDER BY b.balance;
@@ -29,6 +29,7 @@
           plotly
           pandas
           openpyxl
+          pytest
           pip
         ];
         nativeBuildInputs = with pkgs; [
@@ -0,0 +1,59 @@
+"""Speed of comparables.py over synthetic listings.
+
+Indexes synthetic sales (see bench_extract.py) in a few batches, then times a
+batch of queries. tests/test_comparables.py checks the answers.
+
+    python property/bench_comparables.py --sales 100000 --queries 10000
+"""
+
+import argparse
+import json
+import time
+
+import numpy as np
+
+import bench_extract
+import comparables
+import data
+import projection
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sales", type=int, default=100_000)
+    parser.add_argument("--queries", type=int, default=10_000)
+    parser.add_argument("--k", type=int, default=comparables.K)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rows, _ = data.extract_batch(bench_extract.synthetic_listings(args.sales + args.queries, args.seed))
+    sales = projection.Sales.from_rows(rows[: -args.queries])
+    listings = projection.Sales.from_rows(rows[-args.queries :])
+    now = float(sales.sell_time.max())
+
+    start = time.perf_counter()
+    index = comparables.ComparableIndex()
+    for batch in np.array_split(np.arange(len(sales)), 4):
+        index.add(sales.take(batch))
+    index_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    index.query(listings, args.k, now)
+    query_seconds = time.perf_counter() - start
+
+    print(
+        json.dumps(
+            {
+                "sales": len(index),
+                "index_seconds": round(index_seconds, 4),
+                "queries": len(listings),
+                "k": args.k,
+                "query_seconds": round(query_seconds, 4),
+                "microseconds_per_query": round(query_seconds / len(listings) * 1e6, 1),
+            }
+        )
+    )
+
+
+if __name__ == "__main__":
+    main()
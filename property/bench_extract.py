@@ -0,0 +1,148 @@
+"""Benchmark of listing extraction, serial against a process pool.
+
+Generates Domain-shaped sold listings, including ones extract_fields rejects,
+and runs them through data.extract at each worker count. It also reads the
+listings back from a JSON file with one malformed element and reports the
+peak memory that took. tests/test_extract.py checks both give the right
+records.
+
+    python property/bench_extract.py --size 200000 --workers 1 2 4 8
+"""
+
+import argparse
+from datetime import date, timedelta
+import json
+import os
+import random
+import tempfile
+import time
+import tracemalloc
+
+import data
+
+STREETS = [
+    "Harris Street", "Pyrmont Street", "Point Street", "Bowman Street",
+    "Jones Bay Road", "Saunders Street", "Miller Street", "John Street",
+]  # fmt: skip
+POSTCODES = [2009, 2007, 2037, 2000, 2010]
+PERIODS = ["per quarter", "pq", "per annum", "p.a.", "per year", "/qtr", ""]
+
+
+def synthetic_listing(i: int, rng: random.Random) -> dict:
+    sold = date(2005, 1, 1) + timedelta(days=rng.randrange(20 * 365))
+    price = rng.randrange(400, 4000) * 1000
+    general = {
+        "bedrooms": rng.randint(0, 4),
+        "bathrooms": rng.randint(1, 3),
+        "parkingSpaces": rng.randint(0, 2),
+    }
+    description = " ".join(
+        [
+            "Light filled apartment moments from Darling Harbour with harbour glimpses.",
+            f"Strata levies ${rng.randint(800, 3000):,} {rng.choice(PERIODS)}."
+            if rng.random() < 0.8 else "",
+            f"Water rates: ${rng.randint(150, 300):,} {rng.choice(PERIODS)}."
+            if rng.random() < 0.7 else "",
+            f"Council ${rng.randint(250, 600):,} {rng.choice(PERIODS)}"
+            if rng.random() < 0.7 else "",
+            "Close to the light rail, Fish Market and the CBD.",
+        ]
+    )
+    listing = {
+        "listingId": 2_000_000_000 + i,
+        "landSize": {"value": rng.randint(40, 200)},
+        "price": {"display": f"${price:,}"},
+        "address": {
+            "streetAddress": f"{rng.randint(1, 400)}/{rng.randint(1, 200)} {rng.choice(STREETS)}",
+            "postCode": str(rng.choice(POSTCODES)),
+        },
+        "features": {"general": general},
+        "dateSold": {"value": sold.isoformat()},
+        "description": description,
+    }
+    if rng.random() < 0.3:
+        # Older listings only have the nested generalFeatures shape
+        listing["features"] = {"general": {}}
+        listing["generalFeatures"] = {k: {"value": v} for k, v in general.items()}
+
+    roll = rng.random()
+    if roll < 0.02:
+        listing["price"]["display"] = "Contact agent"
+    elif roll < 0.03:
+        listing["address"]["streetAddress"] = ""
+    elif roll < 0.04:
+        listing["dateSold"]["value"] = None
+    elif roll < 0.045:
+        del listing["description"]
+    return listing
+
+
+def synthetic_listings(n: int, seed: int = 0) -> list[dict]:
+    rng = random.Random(seed)
+    return [synthetic_listing(i, rng) for i in range(n)]
+
+
+def run(listings: list[dict], workers: int, batch_size: int):
+    stats = data.IngestStats()
+    start = time.perf_counter()
+    records = [r for batch in data.extract(listings, stats, batch_size, workers) for r in batch]
+    return records, stats, time.perf_counter() - start
+
+
+def malformed_element(listings: list[dict]) -> dict:
+    """Read listings back from a JSON array with one element broken partway through."""
+    elements = [json.dumps(listing) for listing in listings]
+    bad = len(elements) // 10
+    elements[bad] = elements[bad].replace('"address"', '"address" 5', 1)
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "listings.json")
+        with open(path, "w") as f:
+            f.write("[" + ", ".join(elements) + "]")
+        stats = data.IngestStats()
+        start = time.perf_counter()
+        read = sum(1 for _ in data.iter_records([path], stats))
+        seconds = time.perf_counter() - start
+        tracemalloc.start()
+        sum(1 for _ in data.iter_records([path], data.IngestStats()))
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        file_size = os.path.getsize(path)
+    return {
+        "read": read,
+        "rejected": dict(stats.rejected),
+        "seconds": round(seconds, 4),
+        "peak_mb": round(peak / 2**20, 1),
+        "file_mb": round(file_size / 2**20, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--size", type=int, default=100_000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--batch-size", type=int, default=data.BATCH_SIZE)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, os.cpu_count() or 1])
+    args = parser.parse_args()
+
+    listings = synthetic_listings(args.size, args.seed)
+    _, serial_stats, serial_seconds = run(listings, 1, args.batch_size)
+    print(f"serial: {serial_stats.report()}")
+
+    for workers in sorted(set(args.workers)):
+        _, stats, seconds = run(listings, workers, args.batch_size)
+        print(
+            json.dumps(
+                {
+                    "workers": workers,
+                    "records": stats.records,
+                    "seconds": round(seconds, 4),
+                    "records_per_second": round(stats.records / seconds, 1),
+                    "speedup": round(serial_seconds / seconds, 2),
+                }
+            )
+        )
+    print(json.dumps({"malformed_element": malformed_element(listings)}))
+
+
+if __name__ == "__main__":
+    main()
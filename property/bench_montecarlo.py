@@ -0,0 +1,59 @@
+"""Speed and memory of montecarlo.py over synthetic listings, at each worker count.
+
+tests/test_montecarlo.py checks the streamed histogram percentiles against
+exact ones, and that more processes give the same numbers.
+
+    python property/bench_montecarlo.py --properties 200 --paths 20000 --workers 1 4
+"""
+
+import argparse
+import json
+import time
+import tracemalloc
+
+import numpy as np
+
+import bench_extract
+import data
+import montecarlo
+import projection
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sales", type=int, default=50_000)
+    parser.add_argument("--properties", type=int, default=100)
+    parser.add_argument("--paths", type=int, default=20_000)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2])
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rows, _ = data.extract_batch(bench_extract.synthetic_listings(args.sales, args.seed))
+    sales = projection.Sales.from_rows(rows)
+    model = montecarlo.fit(sales)
+    latest = projection.latest_sales(sales)
+    properties = latest.take(np.arange(min(args.properties, len(latest))))
+
+    for workers in args.workers:
+        tracemalloc.start()
+        start = time.perf_counter()
+        montecarlo.simulate(properties, model, [5, 10, 20], args.paths, args.seed, workers)
+        seconds = time.perf_counter() - start
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        print(
+            json.dumps(
+                {
+                    "workers": workers,
+                    "properties": len(properties),
+                    "paths": args.paths,
+                    "seconds": round(seconds, 4),
+                    "paths_per_second": round(len(properties) * args.paths / seconds, 1),
+                    "peak_mb": round(peak / 2**20, 1),
+                }
+            )
+        )
+
+
+if __name__ == "__main__":
+    main()
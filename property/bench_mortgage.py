@@ -0,0 +1,57 @@
+"""Speed of mortgage.py's batched amortization.
+
+Times thousands of 30 year scenarios of random loans with rate changes,
+offsets, extra and lump sum repayments, with full schedules and through the
+extra repayment grid. tests/test_mortgage.py checks the schedules month by
+month against a plain loop.
+
+    python property/bench_mortgage.py --loans 10000
+"""
+
+import argparse
+import json
+import time
+
+import numpy as np
+
+import mortgage
+
+
+def random_loans(n: int, rng: np.random.Generator, events: bool = True) -> mortgage.Loans:
+    return mortgage.Loans(
+        principal=rng.uniform(200_000, 1_500_000, n),
+        rate=rng.uniform(0.0, 0.09, n),
+        offset=rng.uniform(0, 100_000, n) * (rng.random(n) < 0.5),
+        extra=rng.choice([0, 200, 500, 1500], n),
+        rate_changes={12 * y: rng.uniform(0.03, 0.09, n) for y in (2, 5, 9)} if events else {},
+        offset_changes={60: rng.uniform(0, 300_000, n)} if events else {},
+        lump_sums={36: rng.uniform(0, 50_000, n), 120: rng.uniform(0, 100_000, n)} if events else {},
+    )
+
+
+def timed(name: str, fn, scenarios: int) -> None:
+    start = time.perf_counter()
+    fn()
+    seconds = time.perf_counter() - start
+    print(json.dumps({"run": name, "scenarios": scenarios, "seconds": round(seconds, 4)}))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--loans", type=int, default=10_000)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    plain = random_loans(args.loans, rng, events=False)
+    events = random_loans(args.loans, rng)
+    timed("schedule, no events", lambda: mortgage.amortize(plain), args.loans)
+    timed("schedule, 7 events", lambda: mortgage.amortize(events), args.loans)
+    timed("totals only, 7 events", lambda: mortgage.amortize(events, keep_schedule=False), args.loans)
+    extras = np.arange(0, 5000, 100)[1:]
+    few = random_loans(max(args.loans // len(extras), 1), rng)
+    timed("extra repayment grid", lambda: mortgage.extra_repayment_grid(few, extras), len(few) * (len(extras) + 1))
+
+
+if __name__ == "__main__":
+    main()
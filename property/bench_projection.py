@@ -0,0 +1,62 @@
+"""Timing of projection.py over synthetic listings (see bench_extract.py).
+
+    python property/bench_projection.py --properties 5000 --scenarios 36 --years 30
+"""
+
+import argparse
+import json
+import time
+
+import numpy as np
+
+import bench_extract
+import data
+import projection
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sales", type=int, default=50_000)
+    parser.add_argument("--properties", type=int, default=5_000)
+    parser.add_argument("--scenarios", type=int, default=36)
+    parser.add_argument("--years", type=int, default=30)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rows, _ = data.extract_batch(bench_extract.synthetic_listings(args.sales, args.seed))
+    sales = projection.Sales.from_rows(rows)
+
+    start = time.perf_counter()
+    growth = projection.estimate_growth(sales)
+    growth_seconds = time.perf_counter() - start
+
+    latest = projection.latest_sales(sales)
+    properties = latest.take(np.arange(min(args.properties, len(latest))))
+    start = time.perf_counter()
+    result = projection.project(
+        properties,
+        growth,
+        years=np.arange(1, args.years + 1),
+        growth_delta=np.linspace(-0.03, 0.03, args.scenarios),
+    )
+    project_seconds = time.perf_counter() - start
+
+    print(
+        json.dumps(
+            {
+                "sales": len(sales),
+                "postcodes": len(growth.postcodes),
+                "buildings": len(growth.buildings),
+                "growth_seconds": round(growth_seconds, 4),
+                "properties": len(properties),
+                "scenarios": args.scenarios,
+                "years": args.years,
+                "cells": result.net_return.size,
+                "project_seconds": round(project_seconds, 4),
+            }
+        )
+    )
+
+
+if __name__ == "__main__":
+    main()
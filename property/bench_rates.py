@@ -0,0 +1,65 @@
+"""Speed of rates.py over synthetic descriptions (see bench_extract.py).
+
+Times the old three-search extraction, the single scan and the pandas column
+mode. tests/test_rates.py checks the labeled descriptions in fixtures/rates.json.
+
+    python property/bench_rates.py --size 200000
+"""
+
+import argparse
+import json
+import random
+import re
+import time
+from typing import Optional
+
+import bench_extract
+import rates
+
+
+def parse_amount_or_zero(regex_match: Optional[re.Match[str]]) -> int:
+    if not regex_match:
+        return 0
+    return int("".join(c for c in regex_match.group() if c.isnumeric()))
+
+
+def three_searches(description: str) -> tuple[int, int, int]:
+    """What extract_fields did before rates.py, amounts as quoted."""
+    return (
+        parse_amount_or_zero(re.search(r"[sS]trata[^0-9]+?\d[0-9,]+", description)),
+        parse_amount_or_zero(re.search(r"[wW]ater[^0-9]+?\d[0-9,]+", description)),
+        parse_amount_or_zero(re.search(r"[cC]ouncil[^0-9]+?\d[0-9,]+", description)),
+    )
+
+
+def timed(name: str, fn, descriptions: list[str]) -> None:
+    start = time.perf_counter()
+    fn(descriptions)
+    seconds = time.perf_counter() - start
+    print(
+        json.dumps(
+            {
+                "extractor": name,
+                "descriptions": len(descriptions),
+                "seconds": round(seconds, 4),
+                "descriptions_per_second": round(len(descriptions) / seconds, 1),
+            }
+        )
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--size", type=int, default=100_000)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    descriptions = [bench_extract.synthetic_listing(i, rng).get("description", "") for i in range(args.size)]
+    timed("three_searches", lambda ds: [three_searches(d) for d in ds], descriptions)
+    timed("extract_rates", lambda ds: [rates.extract_rates(d) for d in ds], descriptions)
+    timed("extract_rates_column", rates.extract_rates_column, descriptions)
+
+
+if __name__ == "__main__":
+    main()
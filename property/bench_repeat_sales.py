@@ -0,0 +1,98 @@
+"""Speed of repeat_sales.py, adding sales at once and in batches.
+
+Synthetic apartments in a few postcodes resell over 25 years along a known
+quarterly log price path plus noise, under differently written addresses.
+tests/test_repeat_sales.py checks the index recovers that path and that
+batches give the same index as adding everything at once.
+
+    python property/bench_repeat_sales.py --properties 50000
+"""
+
+import argparse
+import json
+import time
+
+import numpy as np
+
+import projection
+import repeat_sales
+
+POSTCODES = [2009, 2007, 2037, 2000]
+STREETS = ["Harris", "Pyrmont", "Point", "Bowman", "Jones Bay", "Saunders"]
+YEARS = 25
+START = np.datetime64("2000-01-01", "s").astype(np.int64)
+
+
+def synthetic_sales(n: int, seed: int):
+    """(Sales, {postcode: true quarterly log index from 2000})."""
+    rng = np.random.default_rng(seed)
+    quarters = YEARS * 4
+    truth = {p: np.concatenate([[0], np.cumsum(rng.normal(0.015, 0.03, quarters - 1))]) for p in POSTCODES}
+
+    # Distinct apartments, so every one should get its own key
+    addresses = rng.choice(len(POSTCODES) * len(STREETS) * 200 * 300, n, replace=False)
+    postcode = np.array(POSTCODES)[addresses % len(POSTCODES)]
+    street = np.array(STREETS)[addresses // len(POSTCODES) % len(STREETS)]
+    number = addresses // (len(POSTCODES) * len(STREETS)) % 200 + 1
+    apt = addresses // (len(POSTCODES) * len(STREETS) * 200) + 1
+    value = rng.uniform(13, 14.5, n)
+    resales = rng.integers(1, 5, n)
+
+    rows = []
+    listing_id = 0
+    for i in range(n):
+        for quarter in np.sort(rng.choice(quarters, resales[i], replace=False)):
+            sell_time = START + int(quarter * 91.3 * 86400) + int(rng.integers(0, 80 * 86400))
+            price = np.exp(value[i] + truth[postcode[i]][quarter] + rng.normal(0, 0.05))
+            # The same apartment written the way different agents write it
+            street_name = f"{street[i]} {rng.choice(['Street', 'St', 'street', 'St.'])}"
+            apt_num = rng.choice([str(apt[i]), f"Unit {apt[i]}", f"Apt {apt[i]}"])
+            rows.append(
+                (apt_num, str(number[i]), street_name, int(postcode[i]), int(price), 80, sell_time, 2, 1, 1, 0, 0, 0, listing_id)
+            )
+            listing_id += 1
+    return projection.Sales.from_rows(rows), truth
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--properties", type=int, default=20_000)
+    parser.add_argument("--batches", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    sales, _ = synthetic_sales(args.properties, args.seed)
+    shuffled = sales.take(np.random.default_rng(args.seed).permutation(len(sales)))
+
+    start = time.perf_counter()
+    whole = repeat_sales.RepeatSales()
+    pairs = whole.add(shuffled)
+    whole_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    incremental = repeat_sales.RepeatSales()
+    batch_seconds = []
+    for batch in np.array_split(np.arange(len(sales)), args.batches):
+        batch_start = time.perf_counter()
+        incremental.add(sales.take(batch))
+        batch_seconds.append(time.perf_counter() - batch_start)
+    incremental_seconds = time.perf_counter() - start
+
+    print(
+        json.dumps(
+            {
+                "sales": len(sales),
+                "pairs": pairs,
+                "properties_keyed": len(whole.builder.sales),
+                "buildings": len(whole.by_building.groups),
+                "seconds": round(whole_seconds, 4),
+                "sales_per_second": round(len(sales) / whole_seconds, 1),
+                "incremental_seconds": round(incremental_seconds, 4),
+                "batch_seconds": [round(s, 4) for s in batch_seconds],
+            }
+        )
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+"""Benchmark of re-ingesting a scrape through store.py's bulk upserts.
+
+Extracts synthetic listings (see bench_extract.py) and writes them twice, with
+a listing repeated in the first batch, reporting what each run wrote and left
+stored. Runs against a temporary SQLite file unless --url points at a Postgres
+database to use instead.
+
+    python property/bench_write.py --size 100000
+    python property/bench_write.py --url postgresql://localhost/property_bench
+"""
+
+import argparse
+import json
+import os
+import tempfile
+import time
+
+import bench_extract
+import data
+import store
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--size", type=int, default=100_000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--batch-size", type=int, default=store.BATCH_SIZE)
+    parser.add_argument("--url", help="database to write to, a temporary SQLite file by default")
+    args = parser.parse_args()
+
+    records, stats = data.extract_batch(bench_extract.synthetic_listings(args.size, args.seed))
+    print(stats.report())
+
+    with tempfile.TemporaryDirectory() as workdir:
+        url = args.url or f"sqlite:///{os.path.join(workdir, 'bench.db')}"
+        for attempt in ("first", "again"):
+            with store.open_writer(url, args.batch_size) as writer:
+                start = time.perf_counter()
+                # The repeat is deduped in its batch and counted once
+                write_stats = writer.write(records[:1] + records)
+                seconds = time.perf_counter() - start
+                rows, listings = store.count(writer)
+            print(
+                json.dumps(
+                    {
+                        "run": attempt,
+                        "rows": len(records),
+                        "batch_size": args.batch_size,
+                        "seconds": round(seconds, 4),
+                        "rows_per_second": round(len(records) / seconds, 1),
+                        "written": write_stats.rows,
+                        "stored": rows,
+                        "distinct_listings": listings,
+                        "failed_batches": len(write_stats.failed),
+                    }
+                )
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,269 @@
+"""Comparable sales for listings, from property_sale held in memory.
+
+Sales are bucketed by postcode into float32 feature rows (bedrooms,
+bathrooms, car spaces, square metres and sale date, scaled so one unit of
+distance is about one bedroom). Within a bucket, sales are grouped into cells
+of equal bedrooms, bathrooms and car spaces. Queries sharing those search
+cells nearest first and stop once no unsearched cell can beat their k-th
+neighbour, each search a matrix multiply against the cells' rows plus a
+partial sort, so results are exact without comparing against the whole
+bucket. Postcodes with fewer than k sales fall back to every sale.
+refresh() reads only the listings stored since it last ran and adds them to
+their cells.
+
+    python property/comparables.py sqlite:///property.db results.json --k 10
+"""
+
+import argparse
+from dataclasses import dataclass, field
+import time
+from typing import Iterable, Optional
+
+import numpy as np
+
+import projection
+
+K = 10
+QUERY_CHUNK = 1024
+FEATURES = ("bedrooms", "bathrooms", "car_spaces", "square_mtr", "years")
+# A bedroom, a bathroom and a half, two car spaces, 25 sqm or two years apart all count the same
+SCALE = np.array([1.0, 1 / 1.5, 1 / 2, 1 / 25, 1 / 2], dtype=np.float32)
+# The leading features that take few values, rows are grouped into cells by them
+DISCRETE = 3
+# Used for sales without a land size when measuring distance
+DEFAULT_SQM = 80
+# Dates are years since 2000, small numbers keep float32 distances precise
+EPOCH_YEARS = 30
+
+
+def _features(sales: projection.Sales, default_sqm: float) -> np.ndarray:
+    sqm = np.where(sales.square_mtr > 0, sales.square_mtr, default_sqm)
+    columns = (sales.bedrooms, sales.bathrooms, sales.car_spaces, sqm, sales.years() - EPOCH_YEARS)
+    return np.stack(columns, axis=1).astype(np.float32) * SCALE
+
+
+@dataclass
+class Bucket:
+    features: np.ndarray = field(default_factory=lambda: np.zeros((0, len(FEATURES)), dtype=np.float32))
+    norms: np.ndarray = field(default_factory=lambda: np.zeros(0, dtype=np.float32))
+    price: np.ndarray = field(default_factory=lambda: np.zeros(0, dtype=np.int64))
+    square_mtr: np.ndarray = field(default_factory=lambda: np.zeros(0, dtype=np.int64))
+    listing_id: np.ndarray = field(default_factory=lambda: np.zeros(0, dtype=np.int64))
+    # (rows sorted by cell, cell coordinates, cell starts, cell ends), built on first query
+    cells: Optional[tuple] = field(default=None, repr=False)
+
+    def __len__(self) -> int:
+        return len(self.price)
+
+    @staticmethod
+    def concat(buckets: Iterable["Bucket"]) -> "Bucket":
+        buckets = list(buckets)
+        return Bucket(*(np.concatenate([getattr(b, name) for b in buckets]) for name in _COLUMNS))
+
+    def append(self, features: np.ndarray, sales: projection.Sales):
+        new = Bucket(
+            features, (features * features).sum(axis=1), sales.listing_price, sales.square_mtr, sales.listing_id
+        )
+        self.__dict__.update(Bucket.concat([self, new]).__dict__)
+
+    def _cells(self) -> tuple:
+        """Rows grouped into cells of equal bedrooms, bathrooms and car spaces."""
+        if self.cells is None:
+            coordinates, cell = np.unique(self.features[:, :DISCRETE], axis=0, return_inverse=True)
+            counts = np.bincount(cell.ravel(), minlength=len(coordinates))
+            ends = np.cumsum(counts)
+            self.cells = (np.argsort(cell.ravel(), kind="stable"), coordinates, ends - counts, ends)
+        return self.cells
+
+    def _distances(self, queries: np.ndarray, query_ids: np.ndarray, rows: np.ndarray) -> np.ndarray:
+        # |q - x|^2 = |q|^2 + |x|^2 - 2 q.x, the q.x for every pair is one matmul
+        distance = (queries * queries).sum(axis=1)[:, None] + self.norms[rows][None, :]
+        distance -= 2 * queries @ self.features[rows].T
+        # A listing isn't its own comparable
+        distance[query_ids[:, None] == self.listing_id[rows][None, :]] = np.inf
+        return distance
+
+    def nearest(self, queries: np.ndarray, query_ids: np.ndarray, k: int) -> tuple[np.ndarray, np.ndarray]:
+        """(row, squared distance) of the k nearest rows to queries sharing bedrooms, bathrooms
+        and car spaces, nearest first.
+
+        Cells are visited nearest first. Distance to a cell's bedrooms, bathrooms
+        and car spaces is a lower bound on distance to any row in it, so once the
+        first cells hold k rows for every query, only cells whose bound is under
+        the furthest k-th distance so far can hold anything nearer.
+        """
+        order, coordinates, starts, ends = self._cells()
+        bound = ((coordinates - queries[0, :DISCRETE]) ** 2).sum(axis=1)
+        by_bound = np.argsort(bound, kind="stable")
+        # One extra row per query in case it's the listing itself
+        enough = int(np.searchsorted(np.cumsum(ends[by_bound] - starts[by_bound]), k + len(queries))) + 1
+        gather = lambda cells: np.concatenate([order[starts[c] : ends[c]] for c in cells])
+
+        rows = gather(by_bound[:enough])
+        k = min(k, len(rows))
+        nearest, distance = _smallest(self._distances(queries, query_ids, rows), k)
+        nearest = rows[nearest]
+        # Queries whose k-th distance reaches further cells search those too, together
+        # with the others that reach as far
+        reachable = np.searchsorted(bound[by_bound], distance[:, -1], side="right")
+        for reach in np.unique(reachable[reachable > enough]).tolist():
+            who = np.flatnonzero(reachable == reach)
+            more = gather(by_bound[enough:reach])
+            more_distance = self._distances(queries[who], query_ids[who], more)
+            candidates = np.concatenate([nearest[who], np.broadcast_to(more, (len(who), len(more)))], axis=1)
+            best, distance[who] = _smallest(np.concatenate([distance[who], more_distance], axis=1), k)
+            nearest[who] = np.take_along_axis(candidates, best, axis=1)
+        return nearest, np.maximum(distance, 0)
+
+
+def _smallest(distance: np.ndarray, k: int) -> tuple[np.ndarray, np.ndarray]:
+    """(column, value) of the k smallest of each row, smallest first."""
+    columns = np.argpartition(distance, k - 1, axis=1)[:, :k]
+    values = np.take_along_axis(distance, columns, axis=1)
+    order = np.argsort(values, axis=1, kind="stable")
+    return np.take_along_axis(columns, order, axis=1), np.take_along_axis(values, order, axis=1)
+
+
+_COLUMNS = ("features", "norms", "price", "square_mtr", "listing_id")
+
+
+def _row_percentiles(values: np.ndarray, percentiles: Iterable[float]) -> list[np.ndarray]:
+    """Linearly interpolated percentiles of each row ignoring nan, like np.nanpercentile(axis=1)
+    without its loop over rows."""
+    ordered = np.sort(values, axis=1)  # nan sorts last
+    last = (~np.isnan(ordered)).sum(axis=1) - 1
+    result = []
+    for p in percentiles:
+        position = np.maximum(last, 0) * (p / 100)
+        below = np.floor(position).astype(np.int64)
+        above = np.minimum(below + 1, np.maximum(last, 0))
+        low, high = (np.take_along_axis(ordered, i[:, None], axis=1)[:, 0] for i in (below, above))
+        value = low + (high - low) * (position - below)
+        result.append(np.where(last >= 0, value, np.nan))
+    return result
+
+
+@dataclass
+class Comparables:
+    """Every (query, k) array holds the k nearest sales to each query, nearest first."""
+
+    listing_id: np.ndarray
+    distance: np.ndarray
+    price: np.ndarray
+    price_per_sqm: np.ndarray  # nan where the sale has no land size
+    median_price: np.ndarray  # (query,)
+    median_per_sqm: np.ndarray
+    low_per_sqm: np.ndarray  # 25th percentile
+    high_per_sqm: np.ndarray  # 75th percentile
+
+
+@dataclass
+class ComparableIndex:
+    buckets: dict[int, Bucket] = field(default_factory=dict)
+    everything: Optional[Bucket] = None
+    seen_listings: set[int] = field(default_factory=set)
+    # The largest listing_id refresh has read, None before it has read any
+    listing_cursor: Optional[int] = None
+
+    def __len__(self) -> int:
+        return sum(len(b) for b in self.buckets.values())
+
+    def add(self, sales: projection.Sales) -> int:
+        """Index sales not seen before, returning how many were added."""
+        seen = np.fromiter(self.seen_listings, dtype=np.int64, count=len(self.seen_listings))
+        sales = sales.take(~np.isin(sales.listing_id, seen) & (sales.listing_price > 0))
+        if not len(sales):
+            return 0
+        self.seen_listings.update(sales.listing_id.tolist())
+        features = _features(sales, DEFAULT_SQM)
+        postcodes, groups = np.unique(sales.postcode, return_inverse=True)
+        for g, postcode in enumerate(postcodes.tolist()):
+            rows = np.flatnonzero(groups == g)
+            self.buckets.setdefault(postcode, Bucket()).append(features[rows], sales.take(rows))
+        self.everything = None
+        return len(sales)
+
+    def refresh(self, url: str) -> int:
+        """Index the sales stored since the last refresh, read past listing_cursor."""
+        sales = projection.load_sales(url, after_listing_id=self.listing_cursor)
+        if len(sales):
+            self.listing_cursor = max(self.listing_cursor or 0, int(sales.listing_id.max()))
+        return self.add(sales)
+
+    def _everything(self) -> Bucket:
+        if self.everything is None:
+            self.everything = Bucket.concat([Bucket(), *self.buckets.values()])
+        return self.everything
+
+    def query(self, listings: projection.Sales, k: int = K, now: Optional[float] = None) -> Comparables:
+        """The k nearest sales to each listing, as if each listing sold at unix time now
+        (default the current time), so recent sales count as closer."""
+        n = len(listings)
+        at = time.time() if now is None else now
+        listings = projection.Sales(**{**listings.__dict__, "sell_time": np.full(n, at)})
+        features = _features(listings, DEFAULT_SQM)
+
+        k = min(k, len(self)) or 1
+        listing_id = np.full((n, k), -1, dtype=np.int64)
+        distance = np.full((n, k), np.inf, dtype=np.float32)
+        price = np.zeros((n, k), dtype=np.int64)
+        sqm = np.zeros((n, k), dtype=np.int64)
+
+        postcodes, groups = np.unique(listings.postcode, return_inverse=True)
+        for g, postcode in enumerate(postcodes.tolist()):
+            bucket = self.buckets.get(postcode)
+            if bucket is None or len(bucket) < k:
+                bucket = self._everything()
+            if not len(bucket):
+                continue
+            members = np.flatnonzero(groups == g)
+            # Queries with the same bedrooms, bathrooms and car spaces search the same cells
+            _, same = np.unique(features[members, :DISCRETE], axis=0, return_inverse=True)
+            by_cell = np.argsort(same.ravel(), kind="stable")
+            splits = np.flatnonzero(np.diff(same.ravel()[by_cell])) + 1
+            chunks = (
+                cell[start : start + QUERY_CHUNK]
+                for cell in np.split(members[by_cell], splits)
+                for start in range(0, len(cell), QUERY_CHUNK)
+            )
+            for chunk in chunks:
+                rows, d = bucket.nearest(features[chunk], listings.listing_id[chunk], k)
+                found = rows.shape[1]
+                listing_id[chunk, :found] = bucket.listing_id[rows]
+                distance[chunk, :found] = np.sqrt(d)
+                price[chunk, :found] = bucket.price[rows]
+                sqm[chunk, :found] = bucket.square_mtr[rows]
+
+        # Listings whose comparables all lack a land size get nan statistics
+        with np.errstate(divide="ignore", invalid="ignore"):
+            per_sqm = np.where((sqm > 0) & (listing_id >= 0), price / sqm, np.nan)
+        (median_price,) = _row_percentiles(np.where(listing_id >= 0, price, np.nan), [50])
+        low, median, high = _row_percentiles(per_sqm, [25, 50, 75])
+        return Comparables(listing_id, distance, price, per_sqm, median_price, median, low, high)
+
+
+if __name__ == "__main__":
+    import data
+
+    parser = argparse.ArgumentParser(description="Comparable sales for every listing in scrape files")
+    parser.add_argument("db_location", help="Postgres URL, or sqlite:///path for a local file")
+    parser.add_argument("paths", nargs="+", help="JSON/NDJSON scrape files or globs, optionally gzipped")
+    parser.add_argument("--k", type=int, default=K)
+    args = parser.parse_args()
+
+    index = ComparableIndex()
+    print(f"indexed {index.refresh(args.db_location)} sales")
+    stats = data.IngestStats()
+    rows = [r for batch in data.extract(data.iter_records(data.expand_paths(args.paths), stats), stats) for r in batch]
+    listings = projection.Sales.from_rows(rows)
+
+    start = time.perf_counter()
+    comparables = index.query(listings, args.k)
+    seconds = time.perf_counter() - start
+    for i in range(len(listings)):
+        print(
+            f"{listings.apt_num[i]}/{listings.street_num[i]} {listings.street[i]} {listings.postcode[i]}: "
+            f"listed ${listings.listing_price[i]:,}, comparables median ${comparables.median_price[i]:,.0f}, "
+            f"${comparables.low_per_sqm[i]:,.0f}-${comparables.high_per_sqm[i]:,.0f}/sqm"
+        )
+    print(f"{len(listings)} listings in {seconds:.3f}s ({seconds / max(len(listings), 1) * 1e6:.0f}us each), {stats.report()}")
@@ -1,34 +1,267 @@
+import argparse
+from collections import Counter, deque
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
 from datetime import datetime
+import glob
+import gzip
+from functools import lru_cache
+from itertools import islice
 import json
-import sys
-from typing import Optional
-import psycopg2
+import os
+import time
+from typing import IO, Iterable, Iterator, Optional
 import re
 
+import rates
+import store
 
-def parse_json():
+BATCH_SIZE = store.BATCH_SIZE
+READ_CHUNK = 1 << 16
+# A value longer than this is rejected rather than read into memory whole
+MAX_VALUE_CHARS = 64 << 20
+READ_TAIL = 64
+# The end of one object and the start of the next, to carry on after a malformed one
+_NEXT_OBJECT = re.compile(r"\}\s*,?\s*(?=\{)")
+PROGRESS_EVERY = 10_000
+
+
+class RejectedRecord(Exception):
+    def __init__(self, reason: str, message: str):
+        super().__init__(message)
+        self.reason = reason
+
+
+@dataclass
+class IngestStats:
+    records: int = 0
+    accepted: int = 0
+    rejected: Counter = field(default_factory=Counter)
+    start: float = field(default_factory=time.perf_counter)
+
+    def add(self, other: "IngestStats"):
+        self.records += other.records
+        self.accepted += other.accepted
+        self.rejected.update(other.rejected)
+
+    def records_per_second(self) -> float:
+        elapsed = time.perf_counter() - self.start
+        return self.records / elapsed if elapsed else 0.0
+
+    def report(self) -> str:
+        return (
+            f"records={self.records} accepted={self.accepted} "
+            f"rejected={sum(self.rejected.values())} "
+            f"rate={self.records_per_second():.0f}/s "
+            f"reasons={dict(self.rejected.most_common())}"
+        )
+
+
+def expand_paths(patterns: Iterable[str]) -> list[str]:
+    paths = []
+    for pattern in patterns:
+        matches = sorted(glob.glob(pattern))
+        if not matches:
+            print(f"no files match {pattern}")
+        paths.extend(matches)
+    return paths
+
+
+def open_text(path: str) -> IO[str]:
+    if path.endswith(".gz"):
+        return gzip.open(path, "rt")
+    return open(path, "r")
+
+
+def iter_json_values(f: IO[str], stats: Optional[IngestStats] = None) -> Iterator:
+    """Yield the elements of a top-level JSON array, or each of a stream of
+    concatenated JSON values, reading the file a chunk at a time.
+
+    With stats, a malformed element is counted as invalid_json and reading
+    carries on from the next element boundary, otherwise it raises.
+    """
+    decoder = json.JSONDecoder()
+    buf, pos, eof = "", 0, False
+    chunk = READ_CHUNK
+    in_array: Optional[bool] = None
+    # Where in the value the last decode failed, so an error that doesn't move
+    # when more is read is known to be in the data rather than the buffer's end
+    failed_at: Optional[int] = None
+    while True:
+        # Skip whitespace and the array's punctuation between values
+        while pos < len(buf) and (buf[pos].isspace() or (in_array and buf[pos] in ",]")):
+            pos += 1
+        if pos < len(buf) and in_array is None:
+            in_array = buf[pos] == "["
+            if in_array:
+                pos += 1
+            continue
+        if pos >= len(buf):
+            if eof:
+                return
+            buf, pos = f.read(chunk), 0
+            eof = not buf
+            continue
+
+        try:
+            value, end = decoder.raw_decode(buf, pos)
+        except json.JSONDecodeError as e:
+            truncated = e.msg.startswith("Unterminated string") or e.pos - pos != failed_at
+            if not eof and truncated and len(buf) - pos < MAX_VALUE_CHARS:
+                # The value may run past the buffer, read more (doubling for huge values)
+                failed_at = e.pos - pos
+                more = f.read(chunk)
+                eof = not more
+                buf, pos = buf[pos:] + more, 0
+                chunk *= 2
+                continue
+            if stats is None:
+                raise
+            stats.records += 1
+            stats.rejected["invalid_json"] += 1
+            buf, pos, eof = _skip_to_next_value(f, buf, max(e.pos, pos + 1), eof)
+            chunk, failed_at = READ_CHUNK, None
+            continue
+        chunk, failed_at = READ_CHUNK, None
+        yield value
+        pos = end
+        if pos > READ_CHUNK:
+            buf, pos = buf[pos:], 0
+
+
+def _skip_to_next_value(f: IO[str], buf: str, pos: int, eof: bool) -> tuple[str, int, bool]:
+    """(buffer, position of the next object after pos, eof), reading on as needed and
+    dropping what's been skipped. The position is the buffer's end if there's none."""
+    while True:
+        if match := _NEXT_OBJECT.search(buf, pos):
+            return buf, match.end(), eof
+        if eof:
+            return buf, len(buf), eof
+        # Keep a little in case a boundary straddles the read
+        buf, pos = buf[-READ_TAIL:], 0
+        more = f.read(READ_CHUNK)
+        eof = not more
+        buf += more
+
+
+def iter_records(paths: Iterable[str], stats: IngestStats) -> Iterator[dict]:
+    """Stream raw listing records from JSON, NDJSON and gzipped files."""
+    for path in paths:
+        with open_text(path) as f:
+            if path.removesuffix(".gz").endswith((".ndjson", ".jsonl")):
+                # One record per line, a bad line only loses that record
+                for line in f:
+                    if not line.strip():
+                        continue
+                    try:
+                        yield json.loads(line)
+                    except json.JSONDecodeError:
+                        stats.records += 1
+                        stats.rejected["invalid_json"] += 1
+            else:
+                try:
+                    yield from iter_json_values(f, stats)
+                except json.JSONDecodeError as e:
+                    print(f"stopped reading {path}, invalid JSON: {e}")
+                    stats.rejected["invalid_json_file"] += 1
+
+
+def batched(iterable: Iterable, n: int) -> Iterator[list]:
+    it = iter(iterable)
+    while batch := list(islice(it, n)):
+        yield batch
+
+
+def extract_fields(sale: dict):
     try:
-        with open(f"results.json", "r") as f:
-            data = json.load(f)
-        return data
-    except Exception as e:
+        return extract_fields_or_reject(sale)
+    except RejectedRecord as e:
         print(e)
-        exit(1)
+        return
 
-def extract_fields(sale: dict):
+
+def extract_or_count(sale: dict, stats: IngestStats) -> Optional[tuple]:
+    stats.records += 1
+    try:
+        record = extract_fields_or_reject(sale)
+    except RejectedRecord as e:
+        stats.rejected[e.reason] += 1
+        return None
+    except KeyError as e:
+        stats.rejected[f"missing_{e.args[0]}"] += 1
+        return None
+    except (ValueError, TypeError, AttributeError):
+        stats.rejected["malformed"] += 1
+        return None
+    stats.accepted += 1
+    return record
+
+
+def extract_batch(sales: list[dict]) -> tuple[list[tuple], IngestStats]:
+    stats = IngestStats()
+    records = [r for r in (extract_or_count(s, stats) for s in sales) if r]
+    return records, stats
+
+
+def extract_serial(
+    sales: Iterable[dict], stats: IngestStats, batch_size: int = BATCH_SIZE
+) -> Iterator[list[tuple]]:
+    for batch in batched(sales, batch_size):
+        records, batch_stats = extract_batch(batch)
+        stats.add(batch_stats)
+        yield records
+
+
+def extract_parallel(
+    sales: Iterable[dict],
+    stats: IngestStats,
+    batch_size: int = BATCH_SIZE,
+    workers: Optional[int] = None,
+) -> Iterator[list[tuple]]:
+    """Same batches as extract_serial, extracted across a process pool.
+
+    Batches come back in input order and only a couple per worker are in
+    flight at once, so memory stays bounded like the serial path.
+    """
+    workers = workers or os.cpu_count() or 1
+    with ProcessPoolExecutor(workers) as pool:
+        pending = deque()
+        for batch in batched(sales, batch_size):
+            pending.append(pool.submit(extract_batch, batch))
+            if len(pending) < 2 * workers:
+                continue
+            records, batch_stats = pending.popleft().result()
+            stats.add(batch_stats)
+            yield records
+        while pending:
+            records, batch_stats = pending.popleft().result()
+            stats.add(batch_stats)
+            yield records
+
+
+def extract(
+    sales: Iterable[dict],
+    stats: IngestStats,
+    batch_size: int = BATCH_SIZE,
+    workers: int = 1,
+) -> Iterator[list[tuple]]:
+    if workers == 1:
+        return extract_serial(sales, stats, batch_size)
+    return extract_parallel(sales, stats, batch_size, workers or None)
+
+
+def extract_fields_or_reject(sale: dict) -> tuple:
     listing_id = int(sale["listingId"])
     square_mtr = int(sale.get("landSize", {}).get("value", 0))
 
     display_price = sale.get("price", {}).get("display", 0)
     listing_price = parse_price(display_price)
     if listing_price == 0:
-        print(f"Could not parse price, display='{display_price}'")
-        return
+        raise RejectedRecord("no_price", f"Could not parse price, display='{display_price}'")
 
     street_addr = sale["address"]["streetAddress"]
     if not street_addr:
-        print("Could not find street address")
-        return
+        raise RejectedRecord("no_street_address", "Could not find street address")
     apt_num, street_num, street = split_address(street_addr) 
     postcode = int(sale["address"]["postCode"])
 
@@ -48,21 +281,11 @@ def extract_fields(sale: dict):
     # Convert to timestamp
     date_sold = sale["dateSold"]["value"]
     if not date_sold:
-        print("Could not find date sold")
-        return
+        raise RejectedRecord("no_date_sold", "Could not find date sold")
     sell_time = int(datetime.strptime(date_sold, "%Y-%m-%d").timestamp())
 
-    description = sale["description"]
-    strata = parse_amount_or_zero(
-        # Get everything from "strata" to the end of the number incl. commas
-        regex_match=re.search(r"[sS]trata[^0-9]+?\d[0-9,]+", description)
-    )
-    water_rates = parse_amount_or_zero(
-        regex_match=re.search(r"[wW]ater[^0-9]+?\d[0-9,]+", description)
-    )
-    council_rates = parse_amount_or_zero(
-        regex_match=re.search(r"[cC]ouncil[^0-9]+?\d[0-9,]+", description)
-    )
+    # Annual dollars, whatever period the listing quotes
+    strata, water_rates, council_rates = rates.extract_rates(sale["description"])
     return (
         apt_num,
         street_num,
@@ -80,16 +303,6 @@ def extract_fields(sale: dict):
         listing_id
     )
 
-def parse_amount_or_zero(regex_match: Optional[re.Match[str]]) -> int:
-    if not regex_match:
-        return 0
-    text = regex_match.group()
-    digits = []
-    for c in text:
-        if c.isnumeric():
-            digits.append(c)
-    return int("".join(digits))
-
 # TODO Use better regex in case of oddities like "40/1 -19 Allen Street"
 def split_address(text: str) -> tuple[str, str, str]:
     delimiter = text.find("/")
@@ -105,6 +318,39 @@ def split_address(text: str) -> tuple[str, str, str]:
     street = text[space + 1 :]
     return (apt_num, street_num, street)
 
+
+# The same building or property written differently normalizes to one key
+_STREET_TYPES = {
+    "street": "st", "road": "rd", "avenue": "ave", "av": "ave", "parade": "pde",
+    "place": "pl", "lane": "ln", "drive": "dr", "crescent": "cres", "terrace": "tce",
+    "highway": "hwy", "boulevard": "blvd", "court": "ct", "close": "cl", "square": "sq",
+    "circuit": "cct", "esplanade": "esp", "way": "way", "wharf": "wharf",
+}  # fmt: skip
+_UNIT_PREFIXES = re.compile(r"^(?:unit|apartment|apt|suite|lot|u)\s*", re.IGNORECASE)
+_NON_ALNUM = re.compile(r"[^a-z0-9 ]+")
+
+
+def _clean(text: str) -> str:
+    return " ".join(_NON_ALNUM.sub(" ", str(text or "").lower()).split())
+
+
+@lru_cache(maxsize=65536)
+def canonical_building(street_num: str, street: str, postcode: int) -> str:
+    tokens = _clean(street).split()
+    if tokens:
+        tokens[-1] = _STREET_TYPES.get(tokens[-1], tokens[-1])
+    # "1-19" and "1 19" are the same building
+    number = _clean(street_num).replace(" ", "-")
+    return f"{number}|{' '.join(tokens)}|{postcode}"
+
+
+def canonical_address(apt_num: str, street_num: str, street: str, postcode: int) -> str:
+    apt = _clean(_UNIT_PREFIXES.sub("", str(apt_num or "").strip()))
+    # split_address leaves most of a house's address in apt_num when there's no "/"
+    if " " in apt:
+        apt = ""
+    return f"{apt}/{canonical_building(street_num, street, postcode)}"
+
 def parse_price(display: Optional[str]) -> int:
     if not display or "$" not in display:
         return 0
@@ -114,32 +360,36 @@ def parse_price(display: Optional[str]) -> int:
         return int(price_str)
     return 0
 
-def write_to_db(data: list[tuple], db_location: str):
-    try:
-        conn = psycopg2.connect(db_location)
-        cur = conn.cursor()
-    
-        for vals_tuple in data:
-            cur.execute(
-                """
-                INSERT INTO property_sale
-                VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s);
-                """,
-                vals_tuple
-            )
-
-        cur.close()
-        conn.commit()
-        conn.close()
-    except Exception as e:
-        print(e)
+def write_to_db(data: list[tuple], db_location: str, batch_size: int = BATCH_SIZE) -> store.WriteStats:
+    with store.open_writer(db_location, batch_size) as writer:
+        return writer.write(data)
+
+def ingest(
+    patterns: list[str],
+    db_location: str,
+    batch_size: int = BATCH_SIZE,
+    workers: int = 1,
+) -> IngestStats:
+    """Stream every file through extract_fields into the database a batch at a time,
+    so memory stays flat however large the scrape is. workers=0 uses every core."""
+    stats = IngestStats()
+    sales = iter_records(expand_paths(patterns), stats)
+    reported = 0
+    with store.open_writer(db_location, batch_size) as writer:
+        for records in extract(sales, stats, batch_size, workers):
+            writer.write(records)
+            if stats.records - reported >= PROGRESS_EVERY:
+                reported = stats.records
+                print(stats.report())
+    print(stats.report())
+    print(writer.stats.report())
+    return stats
 
 if __name__ == "__main__":
-    sales = parse_json()
-    data = []
-    for s in sales:
-        record = extract_fields(s)
-        if record:
-            print(record)
-            data.append(record)
-    write_to_db(data, sys.argv[1])
+    parser = argparse.ArgumentParser(description="Load scraped sold listings into property_sale")
+    parser.add_argument("db_location", help="Postgres URL, or sqlite:///path for a local file")
+    parser.add_argument("paths", nargs="*", default=["results.json"], help="JSON/NDJSON files or globs, optionally gzipped")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    parser.add_argument("--workers", type=int, default=1, help="extraction processes, 0 for one per core")
+    args = parser.parse_args()
+    ingest(args.paths, args.db_location, args.batch_size, args.workers)
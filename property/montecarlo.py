@@ -0,0 +1,235 @@
+"""Monte Carlo price paths for property_sale listings.
+
+Annual log returns are fitted per postcode and bedroom count from the
+year-on-year change in mean log sale price. Groups with too little history
+use their postcode's, then every sale's. Each simulated path resamples a
+group's historical returns year by year, so fat tails and crashes in the
+data carry through.
+
+Net return after stamp duty, holding costs, selling costs and any mortgage
+interest only grows with the final price, so its percentiles are the
+percentiles of the path's log price ratio pushed through that formula. Paths
+are generated a chunk at a time into a fixed histogram of that ratio per
+holding period, so memory doesn't grow with the number of paths.
+
+    python property/montecarlo.py sqlite:///property.db --postcode 2009 --paths 50000
+"""
+
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+import os
+from typing import Iterable, Optional
+
+import numpy as np
+
+import mortgage
+import projection
+
+PATHS = 20_000
+CHUNK = 4_096
+PERCENTILES = (10, 50, 90)
+# Returns a group needs before its own history is resampled
+MIN_RETURNS = 5
+# Longest gap between years with sales that still gives a return
+MAX_GAP_YEARS = 3
+# Histogram of log(sell / purchase), 0.001 wide bins cover -99% to 54x
+LOG_RATIO_RANGE = (-5.0, 4.0)
+LOG_RATIO_BINS = 9_000
+
+
+def annual_returns(groups: np.ndarray, years: np.ndarray, log_price: np.ndarray) -> dict[int, np.ndarray]:
+    """{group: annual log returns} from the change in mean log price between years with sales."""
+    year = np.floor(years).astype(np.int64)
+    if len(year):
+        year -= year.min()
+    span = int(year.max(initial=0)) + 1
+    cells, cell_index = np.unique(groups * span + year, return_inverse=True)
+    mean = np.bincount(cell_index, log_price) / np.bincount(cell_index)
+    cell_group, cell_year = cells // span, cells % span
+
+    # cells are sorted by group then year, neighbours in the same group give a return
+    same = cell_group[1:] == cell_group[:-1]
+    gap = cell_year[1:] - cell_year[:-1]
+    usable = same & (gap <= MAX_GAP_YEARS)
+    returns = (mean[1:] - mean[:-1])[usable] / gap[usable]
+    owners = cell_group[1:][usable]
+    order = np.argsort(owners, kind="stable")
+    owners, returns = owners[order], returns[order]
+    keys, starts = np.unique(owners, return_index=True)
+    return dict(zip(keys.tolist(), np.split(returns, starts[1:])))
+
+
+@dataclass
+class ReturnModel:
+    by_group: dict[tuple[int, int], np.ndarray]  # (postcode, bedrooms)
+    by_postcode: dict[int, np.ndarray]
+    overall: np.ndarray
+
+    def returns_for(self, postcode: int, bedrooms: int) -> np.ndarray:
+        for returns in (self.by_group.get((postcode, bedrooms)), self.by_postcode.get(postcode)):
+            if returns is not None and len(returns) >= MIN_RETURNS:
+                return returns
+        return self.overall if len(self.overall) else np.zeros(1)
+
+
+def fit(sales: projection.Sales) -> ReturnModel:
+    sales = sales.take(sales.listing_price > 0)
+    years, log_price = sales.years(), np.log(sales.listing_price)
+
+    postcodes, postcode_index = np.unique(sales.postcode, return_inverse=True)
+    pairs, pair_index = np.unique(np.stack([sales.postcode, sales.bedrooms], axis=1), axis=0, return_inverse=True)
+    by_postcode = annual_returns(postcode_index, years, log_price)
+    by_group = annual_returns(pair_index.ravel(), years, log_price)
+    overall = annual_returns(np.zeros(len(sales), dtype=np.int64), years, log_price)
+    return ReturnModel(
+        {tuple(pairs[i].tolist()): r for i, r in by_group.items()},
+        {int(postcodes[i]): r for i, r in by_postcode.items()},
+        overall.get(0, np.zeros(0)),
+    )
+
+
+@dataclass
+class Case:
+    """One property to simulate, everything in dollars."""
+
+    purchase: float
+    annual_costs: float
+    returns: np.ndarray
+    interest: np.ndarray  # (holding period,)
+    seed: np.random.SeedSequence
+
+
+def _log_ratio_histogram(case: Case, years: np.ndarray, paths: int, chunk: int) -> np.ndarray:
+    """(holding period, bin) counts of simulated log(sell price / purchase)."""
+    rng = np.random.default_rng(case.seed)
+    low, high = LOG_RATIO_RANGE
+    width = (high - low) / LOG_RATIO_BINS
+    counts = np.zeros((len(years), LOG_RATIO_BINS), dtype=np.int64)
+    offsets = np.arange(len(years))[:, None] * LOG_RATIO_BINS
+    horizon = int(years.max())
+    for start in range(0, paths, chunk):
+        n = min(chunk, paths - start)
+        draws = case.returns[rng.integers(len(case.returns), size=(n, horizon))]
+        log_ratio = np.cumsum(draws, axis=1)[:, years - 1].T
+        bins = np.clip(((log_ratio - low) / width).astype(np.int64), 0, LOG_RATIO_BINS - 1)
+        counts += np.bincount((bins + offsets).ravel(), minlength=counts.size).reshape(counts.shape)
+    return counts
+
+
+def _percentile_log_ratios(counts: np.ndarray, percentiles: Iterable[float]) -> np.ndarray:
+    """(holding period, percentile) log ratios at the centre of the bin each percentile falls in."""
+    low, high = LOG_RATIO_RANGE
+    width = (high - low) / LOG_RATIO_BINS
+    cdf = np.cumsum(counts, axis=1) / counts.sum(axis=1, keepdims=True)
+    bins = np.stack([(cdf < p / 100).sum(axis=1) for p in percentiles], axis=1)
+    return low + (bins + 0.5) * width
+
+
+def simulate_case(
+    case: Case,
+    years: np.ndarray,
+    paths: int = PATHS,
+    chunk: int = CHUNK,
+    percentiles: Iterable[float] = PERCENTILES,
+    selling_cost: float = projection.SELLING_COST,
+) -> np.ndarray:
+    """(holding period, percentile) net return for one property."""
+    log_ratio = _percentile_log_ratios(_log_ratio_histogram(case, years, paths, chunk), percentiles)
+    sell_price = case.purchase * np.exp(log_ratio)
+    duty = projection.stamp_duty(np.array([case.purchase]))[0]
+    costs = duty + case.annual_costs * years[:, None] + case.interest[:, None]
+    return sell_price * (1 - selling_cost) - case.purchase - costs
+
+
+def _simulate_cases(cases: list[Case], years: np.ndarray, paths: int, chunk: int, percentiles, selling_cost) -> np.ndarray:
+    return np.stack([simulate_case(c, years, paths, chunk, percentiles, selling_cost) for c in cases])
+
+
+@dataclass
+class Outcomes:
+    years: np.ndarray
+    percentiles: tuple
+    net_return: np.ndarray  # (property, holding period, percentile)
+
+
+def simulate(
+    sales: projection.Sales,
+    model: ReturnModel,
+    years: Iterable[int],
+    paths: int = PATHS,
+    seed: int = 0,
+    workers: int = 1,
+    chunk: int = CHUNK,
+    percentiles: Iterable[float] = PERCENTILES,
+    selling_cost: float = projection.SELLING_COST,
+    interest: Optional[np.ndarray] = None,
+) -> Outcomes:
+    """Percentile net returns for buying each sale's property at its sale price.
+
+    Every property gets its own seed spawned from seed, so results don't
+    depend on how properties are split across the worker processes.
+    interest is (property, holding period), see mortgage.financing_costs.
+    """
+    years = np.asarray(years, dtype=np.int64)
+    percentiles = tuple(percentiles)
+    if interest is None:
+        interest = np.zeros((len(sales), len(years)))
+    seeds = np.random.SeedSequence(seed).spawn(len(sales))
+    costs = sales.annual_costs()
+    cases = [
+        Case(
+            float(sales.listing_price[i]),
+            float(costs[i]),
+            model.returns_for(int(sales.postcode[i]), int(sales.bedrooms[i])),
+            interest[i],
+            seeds[i],
+        )
+        for i in range(len(sales))
+    ]
+    if not cases:
+        return Outcomes(years, percentiles, np.zeros((0, len(years), len(percentiles))))
+
+    args = (years, paths, chunk, percentiles, selling_cost)
+    if workers == 1:
+        net_return = _simulate_cases(cases, *args)
+    else:
+        workers = workers or os.cpu_count() or 1
+        shard = -(-len(cases) // workers)
+        with ProcessPoolExecutor(workers) as pool:
+            shards = [cases[i : i + shard] for i in range(0, len(cases), shard)]
+            net_return = np.concatenate(list(pool.map(_simulate_cases, shards, *([a] * len(shards) for a in args))))
+    return Outcomes(years, percentiles, net_return)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Percentile outcomes of buying property_sale listings")
+    parser.add_argument("db_location", help="Postgres URL, or sqlite:///path for a local file")
+    parser.add_argument("--years", type=int, nargs="+", default=[5, 10, 20])
+    parser.add_argument("--paths", type=int, default=PATHS)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--workers", type=int, default=1, help="0 for one per core")
+    parser.add_argument("--postcode", type=int)
+    parser.add_argument("--bedrooms", type=int)
+    parser.add_argument("--loan-rate", type=float, help="finance each purchase at this annual rate")
+    parser.add_argument("--deposit", type=float, default=0.2)
+    args = parser.parse_args()
+
+    sales = projection.load_sales(args.db_location)
+    model = fit(sales)
+    latest = projection.latest_sales(sales)
+    if args.postcode:
+        latest = latest.take(latest.postcode == args.postcode)
+    if args.bedrooms is not None:
+        latest = latest.take(latest.bedrooms == args.bedrooms)
+
+    interest = None
+    if args.loan_rate is not None:
+        interest = mortgage.financing_costs(latest.listing_price, args.years, deposit=args.deposit, rate=args.loan_rate)
+    outcomes = simulate(latest, model, args.years, args.paths, args.seed, args.workers, interest=interest)
+    print(f"{len(latest)} properties, {args.paths} paths each, median across properties:")
+    for y, years in enumerate(outcomes.years):
+        cells = ", ".join(
+            f"P{p:g} {np.median(outcomes.net_return[:, y, i]):+,.0f}" for i, p in enumerate(outcomes.percentiles)
+        )
+        print(f"{years} years: {cells}")
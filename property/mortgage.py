@@ -0,0 +1,233 @@
+"""Monthly amortization schedules for many loans at once.
+
+Loans are arrays, one element per loan or scenario. Rate changes, offset
+balance changes and lump sum repayments happen at whole months shared by the
+batch. Between two of those events every loan's balance has a closed form:
+with monthly rate r, repayment p and offset o the part of the balance over
+the offset follows d(k) = d(0)(1+r)^k - p((1+r)^k - 1)/r until it reaches the
+offset, then falls by p a month with no interest charged. A 30 year schedule
+is one broadcast per event, not a Python loop over months.
+
+When the rate changes the minimum repayment is recalculated from the current
+balance over the remaining term, like a variable rate loan. Extra repayments
+are always paid on top of it.
+
+    python property/mortgage.py 800000 0.06 --extra 0 250 500 1000 2000
+"""
+
+import argparse
+from dataclasses import dataclass, field
+from typing import Iterable, Optional
+
+import numpy as np
+
+TERM_MONTHS = 360
+# Balances under half a cent are paid off, rather than float residue
+PAID_OFF = 0.005
+
+
+@dataclass
+class Loans:
+    """Arrays broadcast to one element per loan, amounts in dollars and annual rates as fractions."""
+
+    principal: np.ndarray
+    rate: np.ndarray
+    term_months: int = TERM_MONTHS
+    offset: np.ndarray = 0.0
+    # Paid every month on top of the minimum repayment
+    extra: np.ndarray = 0.0
+    # {month: array} events, applied at the start of the month
+    rate_changes: dict[int, np.ndarray] = field(default_factory=dict)
+    offset_changes: dict[int, np.ndarray] = field(default_factory=dict)
+    lump_sums: dict[int, np.ndarray] = field(default_factory=dict)
+
+    def __post_init__(self):
+        arrays = np.broadcast_arrays(
+            *(np.atleast_1d(np.asarray(a, dtype=np.float64)) for a in (self.principal, self.rate, self.offset, self.extra))
+        )
+        self.principal, self.rate, self.offset, self.extra = (a.copy() for a in arrays)
+
+    def __len__(self) -> int:
+        return len(self.principal)
+
+
+@dataclass
+class Schedule:
+    """Month m of (loan, month) arrays runs from the start of month m to the start of month m + 1."""
+
+    balance: Optional[np.ndarray]  # (loan, month + 1), after that month's lump sum
+    interest: Optional[np.ndarray]
+    payment: Optional[np.ndarray]  # including extra repayments and lump sums
+    total_interest: np.ndarray  # (loan,)
+    total_paid: np.ndarray
+    payoff_month: np.ndarray  # months until the balance reached zero, term_months + 1 if it didn't
+    final_balance: np.ndarray
+
+
+def minimum_repayment(principal: np.ndarray, monthly_rate: np.ndarray, months: int) -> np.ndarray:
+    """The level monthly repayment that clears principal in months."""
+    months = max(months, 1)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        level = principal * monthly_rate / -np.expm1(-months * np.log1p(monthly_rate))
+    return np.where(monthly_rate > 0, level, principal / months)
+
+
+def _segment(balance: np.ndarray, monthly_rate: np.ndarray, repayment: np.ndarray, offset: np.ndarray, months: int):
+    """(balances at months 0..months, interest for months 0..months-1) with nothing changing in between."""
+    k = np.arange(months + 1, dtype=np.float64)[None, :]
+    r, p, o = monthly_rate[:, None], repayment[:, None], offset[:, None]
+    d0 = (balance - offset)[:, None]
+
+    growth = (1 + r) ** k
+    with np.errstate(divide="ignore", invalid="ignore"):
+        annuity = np.where(r > 0, (growth - 1) / r, k)
+        compounding = d0 * growth - p * annuity
+        # First month the balance is at or under the offset, interest stops from then on
+        crossing = np.where(
+            d0 <= 0,
+            0,
+            np.where(
+                r > 0,
+                np.where(p > r * d0, np.ceil(np.log(p / (p - r * d0)) / np.log1p(r)), np.inf),
+                np.ceil(d0 / p),
+            ),
+        )
+    crossing = np.minimum(crossing, months).astype(np.int64)
+    at_crossing = np.take_along_axis(compounding, crossing, axis=1)
+    over_offset = np.where(k < crossing, compounding, at_crossing - p * (k - crossing))
+
+    balances = over_offset + o
+    balances[balances < PAID_OFF] = 0
+    interest = r * np.maximum(over_offset[:, :-1], 0) * (balances[:, :-1] > 0)
+    return balances, interest
+
+
+def amortize(loans: Loans, keep_schedule: bool = True) -> Schedule:
+    n, term = len(loans), loans.term_months
+    as_array = lambda a: np.broadcast_to(np.asarray(a, dtype=np.float64), (n,))
+
+    events = {0, term} | {
+        m for m in (*loans.rate_changes, *loans.offset_changes, *loans.lump_sums) if 0 <= m < term
+    }
+    boundaries = sorted(events)
+
+    balance = loans.principal.copy()
+    rate, offset = loans.rate.copy(), loans.offset.copy()
+    repayment = minimum_repayment(balance, rate / 12, term)
+    total_interest, total_paid = np.zeros(n), np.zeros(n)
+    payoff_month = np.full(n, term + 1)
+    if keep_schedule:
+        balances, interests, payments = np.zeros((n, term + 1)), np.zeros((n, term)), np.zeros((n, term))
+        balances[:, 0] = balance
+
+    for start, end in zip(boundaries, boundaries[1:]):
+        lump = np.zeros(n)
+        if start in loans.lump_sums:
+            lump = np.minimum(as_array(loans.lump_sums[start]), balance)
+            balance = balance - lump
+        if start in loans.offset_changes:
+            offset = as_array(loans.offset_changes[start]).copy()
+        if start in loans.rate_changes:
+            rate = as_array(loans.rate_changes[start]).copy()
+            repayment = minimum_repayment(balance, rate / 12, term - start)
+
+        segment_balances, segment_interest = _segment(balance, rate / 12, repayment + loans.extra, offset, end - start)
+        # What was paid each month is whatever the balance and interest don't account for
+        segment_payments = segment_balances[:, :-1] - segment_balances[:, 1:] + segment_interest
+        segment_payments[:, 0] += lump
+
+        paid_off = (segment_balances[:, 1:] <= 0) & (payoff_month == term + 1)[:, None]
+        first = np.argmax(paid_off, axis=1)
+        payoff_month = np.where(paid_off.any(axis=1), start + first + 1, payoff_month)
+        total_interest += segment_interest.sum(axis=1)
+        total_paid += segment_payments.sum(axis=1)
+        balance = segment_balances[:, -1]
+        if keep_schedule:
+            balances[:, start] = segment_balances[:, 0]
+            balances[:, start + 1 : end + 1] = segment_balances[:, 1:]
+            interests[:, start:end] = segment_interest
+            payments[:, start:end] = segment_payments
+
+    if not keep_schedule:
+        balances = interests = payments = None
+    return Schedule(balances, interests, payments, total_interest, total_paid, payoff_month, balance)
+
+
+@dataclass
+class Grid:
+    """Every array is (loan, extra repayment)."""
+
+    extra: np.ndarray
+    total_interest: np.ndarray
+    interest_saved: np.ndarray
+    payoff_month: np.ndarray
+    months_saved: np.ndarray
+
+
+def extra_repayment_grid(loans: Loans, extras: Iterable[float]) -> Grid:
+    """How total interest and payoff time change with each monthly extra repayment
+    on top of the loans' own, against the loans as given."""
+    extras = np.asarray([0.0, *extras], dtype=np.float64)
+    n, m = len(loans), len(extras)
+    repeat = lambda a: np.repeat(a, m)
+    grid = Loans(
+        principal=repeat(loans.principal),
+        rate=repeat(loans.rate),
+        term_months=loans.term_months,
+        offset=repeat(loans.offset),
+        extra=repeat(loans.extra) + np.tile(extras, n),
+        rate_changes={k: repeat(np.broadcast_to(v, (n,))) for k, v in loans.rate_changes.items()},
+        offset_changes={k: repeat(np.broadcast_to(v, (n,))) for k, v in loans.offset_changes.items()},
+        lump_sums={k: repeat(np.broadcast_to(v, (n,))) for k, v in loans.lump_sums.items()},
+    )
+    schedule = amortize(grid, keep_schedule=False)
+    total_interest = schedule.total_interest.reshape(n, m)
+    payoff_month = schedule.payoff_month.reshape(n, m)
+    return Grid(
+        extras[1:],
+        total_interest[:, 1:],
+        total_interest[:, :1] - total_interest[:, 1:],
+        payoff_month[:, 1:],
+        payoff_month[:, :1] - payoff_month[:, 1:],
+    )
+
+
+def interest_by_year(schedule: Schedule, years: Iterable[float]) -> np.ndarray:
+    """(loan, holding period) interest paid in the first `years` of each loan."""
+    months = np.clip(np.round(np.asarray(years, dtype=np.float64) * 12).astype(np.int64), 0, schedule.interest.shape[1])
+    cumulative = np.concatenate([np.zeros((len(schedule.interest), 1)), schedule.interest.cumsum(axis=1)], axis=1)
+    return cumulative[:, months]
+
+
+def financing_costs(
+    purchase: np.ndarray,
+    years: Iterable[float],
+    deposit: float = 0.2,
+    rate: float = 0.06,
+    extra: float = 0.0,
+    offset: float = 0.0,
+    term_months: int = TERM_MONTHS,
+) -> np.ndarray:
+    """(property, holding period) interest on a loan for purchase less the deposit, for projection.project."""
+    loans = Loans(principal=np.asarray(purchase) * (1 - deposit), rate=rate, term_months=term_months, offset=offset, extra=extra)
+    return interest_by_year(amortize(loans), years)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Interest saved by extra monthly repayments")
+    parser.add_argument("principal", type=float)
+    parser.add_argument("rate", type=float, help="annual, e.g. 0.06")
+    parser.add_argument("--extra", type=float, nargs="+", default=[250, 500, 1000, 2000])
+    parser.add_argument("--offset", type=float, default=0.0)
+    parser.add_argument("--years", type=int, default=TERM_MONTHS // 12)
+    args = parser.parse_args()
+
+    loans = Loans(principal=args.principal, rate=args.rate, term_months=args.years * 12, offset=args.offset)
+    base = amortize(loans, keep_schedule=False)
+    print(
+        f"minimum repayment ${minimum_repayment(loans.principal, loans.rate / 12, loans.term_months)[0]:,.2f}/month, "
+        f"interest ${base.total_interest[0]:,.0f}, paid off in {base.payoff_month[0] / 12:.1f} years"
+    )
+    grid = extra_repayment_grid(loans, args.extra)
+    for extra, saved, months in zip(grid.extra, grid.interest_saved[0], grid.months_saved[0]):
+        print(f"+${extra:,.0f}/month: saves ${saved:,.0f} interest and {months / 12:.1f} years")
@@ -0,0 +1,306 @@
+"""Projected returns for property_sale listings over holding periods and growth scenarios.
+
+property_sale is loaded once into column arrays. Annual growth is estimated
+per postcode and per building (street number, street and postcode) from
+the trend of log sale price over time, and buildings with few sales lean
+on their postcode. Every property is then projected for every growth
+scenario and holding period in one broadcast, giving arrays shaped
+(property, scenario, holding period).
+
+    python property/projection.py sqlite:///property.db --years 5 10 20
+"""
+
+import argparse
+from dataclasses import dataclass
+from typing import Iterable, Optional
+
+import numpy as np
+
+import data
+import mortgage
+import store
+
+SECONDS_PER_YEAR = 365.25 * 24 * 60 * 60
+# Sales needed before a group's own trend is used at all
+MIN_SALES = 5
+# A building with n sales gets weight n / (n + BUILDING_PRIOR) against its postcode
+BUILDING_PRIOR = 10
+SELLING_COST = 0.02  # agent commission and marketing, as a share of the sell price
+
+# NSW transfer duty 2024-25: (over, base duty, rate per dollar over)
+STAMP_DUTY_BRACKETS = np.array(
+    [
+        (0, 0, 0.0125),
+        (17_000, 212, 0.015),
+        (36_000, 497, 0.0175),
+        (97_000, 1_564, 0.035),
+        (364_000, 10_909, 0.045),
+        (1_212_000, 49_069, 0.055),
+        (3_636_000, 182_389, 0.07),
+    ]
+)
+
+
+@dataclass
+class Sales:
+    """property_sale as one array per column, row i of each is one sale."""
+
+    apt_num: np.ndarray
+    street_num: np.ndarray
+    street: np.ndarray
+    postcode: np.ndarray
+    listing_price: np.ndarray
+    square_mtr: np.ndarray
+    sell_time: np.ndarray
+    bedrooms: np.ndarray
+    bathrooms: np.ndarray
+    car_spaces: np.ndarray
+    water_rates: np.ndarray
+    council_rates: np.ndarray
+    strata: np.ndarray
+    listing_id: np.ndarray
+
+    @classmethod
+    def from_rows(cls, rows: Iterable[tuple]) -> "Sales":
+        """From tuples in store.COLUMNS order, like extract_fields returns."""
+        columns = list(zip(*rows)) or [()] * len(store.COLUMNS)
+        text = {"apt_num", "street_num", "street"}
+        return cls(
+            **{
+                name: np.array(values, dtype=object if name in text else np.int64)
+                for name, values in zip(store.COLUMNS, columns)
+            }
+        )
+
+    def __len__(self) -> int:
+        return len(self.listing_price)
+
+    def take(self, index: np.ndarray) -> "Sales":
+        return Sales(**{name: getattr(self, name)[index] for name in store.COLUMNS})
+
+    def building_keys(self) -> np.ndarray:
+        """data.canonical_building of each sale, as repeat_sales.py groups buildings."""
+        rows = zip(self.street_num.tolist(), self.street.tolist(), self.postcode.tolist())
+        return np.array([data.canonical_building(*row) for row in rows], dtype=str)
+
+    def property_keys(self) -> np.ndarray:
+        rows = zip(self.apt_num.tolist(), self.street_num.tolist(), self.street.tolist(), self.postcode.tolist())
+        return np.array([data.canonical_address(*row) for row in rows], dtype=str)
+
+    def years(self) -> np.ndarray:
+        return self.sell_time / SECONDS_PER_YEAR
+
+    def per_sqm(self) -> np.ndarray:
+        with np.errstate(divide="ignore", invalid="ignore"):
+            return np.where(self.square_mtr > 0, self.listing_price / self.square_mtr, np.nan)
+
+    def annual_costs(self) -> np.ndarray:
+        return (self.strata + self.water_rates + self.council_rates).astype(np.float64)
+
+
+def load_sales(url: str, after_listing_id: Optional[int] = None) -> Sales:
+    return Sales.from_rows(store.read_columns(url, after_listing_id=after_listing_id))
+
+
+def latest_sales(sales: Sales) -> Sales:
+    """The most recent sale of each property."""
+    keys = sales.property_keys()
+    # Sort by key then time, the last row of each key run is its latest sale
+    order = np.lexsort((sales.sell_time, keys))
+    sorted_keys = keys[order]
+    last = np.ones(len(order), dtype=bool)
+    last[:-1] = sorted_keys[1:] != sorted_keys[:-1]
+    return sales.take(order[last])
+
+
+def group_growth(groups: np.ndarray, years: np.ndarray, price: np.ndarray, n_groups: int):
+    """(annual growth, sales) per group from a least squares fit of log price on time.
+
+    Growth is nan for groups with fewer than MIN_SALES sales or all on one day.
+    """
+    log_price = np.log(price)
+    # Centre time so the sums of squares keep their precision
+    t = years - (years.mean() if len(years) else 0)
+    n = np.bincount(groups, minlength=n_groups).astype(np.float64)
+    sum_t = np.bincount(groups, t, n_groups)
+    sum_y = np.bincount(groups, log_price, n_groups)
+    sum_tt = np.bincount(groups, t * t, n_groups)
+    sum_ty = np.bincount(groups, t * log_price, n_groups)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        var = sum_tt - sum_t * sum_t / n
+        cov = sum_ty - sum_t * sum_y / n
+        slope = np.where((n >= MIN_SALES) & (var > 1e-9), cov / var, np.nan)
+    return np.expm1(slope), n
+
+
+@dataclass
+class Growth:
+    postcodes: np.ndarray
+    postcode_growth: np.ndarray
+    postcode_sales: np.ndarray
+    buildings: np.ndarray
+    building_growth: np.ndarray
+    building_sales: np.ndarray
+    overall: float
+
+    def for_sales(self, sales: Sales) -> np.ndarray:
+        """Annual growth to project each sale with, the building's shrunk towards its postcode."""
+        postcode = _lookup(self.postcodes, self.postcode_growth, sales.postcode)
+        postcode = np.where(np.isnan(postcode), self.overall, postcode)
+
+        keys = sales.building_keys()
+        building = _lookup(self.buildings, self.building_growth, keys)
+        n = np.nan_to_num(_lookup(self.buildings, self.building_sales, keys))
+        weight = np.where(np.isnan(building), 0, n / (n + BUILDING_PRIOR))
+        return weight * np.nan_to_num(building) + (1 - weight) * postcode
+
+
+def _lookup(sorted_keys: np.ndarray, values: np.ndarray, queries: np.ndarray) -> np.ndarray:
+    """values for each query found in sorted_keys, nan for the rest."""
+    if not len(sorted_keys):
+        return np.full(len(queries), np.nan)
+    index = np.searchsorted(sorted_keys, queries).clip(0, len(sorted_keys) - 1)
+    return np.where(sorted_keys[index] == queries, values[index], np.nan)
+
+
+def estimate_growth(sales: Sales) -> Growth:
+    valid = sales.listing_price > 0
+    sales = sales.take(valid)
+    years = sales.years() if len(sales) else np.zeros(0)
+
+    postcodes, postcode_groups = np.unique(sales.postcode, return_inverse=True)
+    postcode_growth, postcode_sales = group_growth(postcode_groups, years, sales.listing_price, len(postcodes))
+    buildings, building_groups = np.unique(sales.building_keys(), return_inverse=True)
+    building_growth, building_sales = group_growth(building_groups, years, sales.listing_price, len(buildings))
+    overall, _ = group_growth(np.zeros(len(sales), dtype=np.int64), years, sales.listing_price, 1)
+    return Growth(
+        postcodes,
+        postcode_growth,
+        postcode_sales,
+        buildings,
+        building_growth,
+        building_sales,
+        float(np.nan_to_num(overall[0])),
+    )
+
+
+def stamp_duty(price: np.ndarray) -> np.ndarray:
+    bracket = np.searchsorted(STAMP_DUTY_BRACKETS[:, 0], price, side="right") - 1
+    over, base, rate = STAMP_DUTY_BRACKETS[bracket.clip(0)].T
+    return base + rate * (price - over)
+
+
+@dataclass
+class Projection:
+    """Every array is (property, scenario, holding period), dollars unless noted."""
+
+    years: np.ndarray
+    growth_delta: np.ndarray
+    growth: np.ndarray  # (property,) annual growth before the scenario's delta
+    purchase: np.ndarray  # (property,)
+    stamp_duty: np.ndarray  # (property,)
+    sell_price: np.ndarray
+    gross_return: np.ndarray
+    holding_costs: np.ndarray
+    selling_costs: np.ndarray
+    interest: np.ndarray
+    net_return: np.ndarray
+    net_per_sqm: np.ndarray
+    annualized: np.ndarray  # net return a year on price plus duty, as a fraction
+
+
+def project(
+    sales: Sales,
+    growth: Growth,
+    years: Iterable[float],
+    growth_delta: Iterable[float] = (0.0,),
+    purchase: Optional[np.ndarray] = None,
+    selling_cost: float = SELLING_COST,
+    interest: Optional[np.ndarray] = None,
+) -> Projection:
+    """Project buying each sale's property at purchase (default its sale price) and selling
+    it after each holding period, with the property's growth plus each scenario's delta.
+
+    interest is the (property, holding period) mortgage interest paid by each
+    sale, see mortgage.financing_costs, and comes off the net return.
+    """
+    years = np.asarray(years, dtype=np.float64)
+    growth_delta = np.asarray(growth_delta, dtype=np.float64)
+    purchase = sales.listing_price.astype(np.float64) if purchase is None else np.asarray(purchase, dtype=np.float64)
+    base_growth = growth.for_sales(sales)
+
+    rate = base_growth[:, None, None] + growth_delta[None, :, None]
+    price = purchase[:, None, None]
+    sell_price = price * (1 + rate) ** years[None, None, :]
+    duty = stamp_duty(purchase)
+    holding_costs = sales.annual_costs()[:, None, None] * years[None, None, :]
+    selling_costs = selling_cost * sell_price
+    gross = sell_price - price
+    interest = np.zeros((len(purchase), len(years))) if interest is None else np.asarray(interest)
+    net = gross - duty[:, None, None] - holding_costs - selling_costs - interest[:, None, :]
+    outlay = (purchase + duty)[:, None, None]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        sqm = np.where(sales.square_mtr > 0, sales.square_mtr, np.nan)[:, None, None]
+        ratio = 1 + net / outlay
+        # Losing more than the outlay is -100% however long it took
+        annualized = np.where(ratio > 0, np.abs(ratio) ** (1 / years) - 1, -1.0)
+    return Projection(
+        years,
+        growth_delta,
+        base_growth,
+        purchase,
+        duty,
+        sell_price,
+        gross,
+        holding_costs,
+        selling_costs,
+        interest,
+        net,
+        net / sqm,
+        annualized,
+    )
+
+
+def summary(projection: Projection) -> list[tuple[float, float, float, float, float]]:
+    """(years, growth delta, median net return, median net per sqm, median annualized) per cell."""
+    net = np.median(projection.net_return, axis=0)
+    per_sqm = np.nanmedian(projection.net_per_sqm, axis=0)
+    annualized = np.median(projection.annualized, axis=0)
+    return [
+        (float(years), float(delta), float(net[s, y]), float(per_sqm[s, y]), float(annualized[s, y]))
+        for s, delta in enumerate(projection.growth_delta)
+        for y, years in enumerate(projection.years)
+    ]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Project returns on property_sale listings")
+    parser.add_argument("db_location", help="Postgres URL, or sqlite:///path for a local file")
+    parser.add_argument("--years", type=float, nargs="+", default=[5, 10, 20])
+    parser.add_argument("--growth-delta", type=float, nargs="+", default=[-0.02, 0.0, 0.02])
+    parser.add_argument("--postcode", type=int, help="only project properties in this postcode")
+    parser.add_argument("--selling-cost", type=float, default=SELLING_COST)
+    parser.add_argument("--loan-rate", type=float, help="finance each purchase at this annual rate")
+    parser.add_argument("--deposit", type=float, default=0.2, help="share of the price not borrowed")
+    parser.add_argument("--extra", type=float, default=0.0, help="extra monthly repayment")
+    args = parser.parse_args()
+
+    sales = load_sales(args.db_location)
+    growth = estimate_growth(sales)
+    for postcode, g, n in zip(growth.postcodes, growth.postcode_growth, growth.postcode_sales):
+        print(f"{postcode}: {g:+.2%} a year from {int(n)} sales")
+
+    latest = latest_sales(sales)
+    if args.postcode:
+        latest = latest.take(latest.postcode == args.postcode)
+    interest = None
+    if args.loan_rate is not None:
+        interest = mortgage.financing_costs(
+            latest.listing_price, args.years, deposit=args.deposit, rate=args.loan_rate, extra=args.extra
+        )
+    projection = project(
+        latest, growth, args.years, args.growth_delta, selling_cost=args.selling_cost, interest=interest
+    )
+    print(f"{len(latest)} properties, medians:")
+    for years, delta, net, per_sqm, annualized in summary(projection):
+        print(f"{years:g} years, growth {delta:+.1%}: net {net:+,.0f} ({per_sqm:+,.0f}/sqm), {annualized:+.2%} a year")
@@ -0,0 +1,95 @@
+"""Strata, water and council rates quoted in listing descriptions, as annual dollars.
+
+One compiled pattern finds every rate mention in a single scan. The period
+after the amount ("per quarter", "pa", "/month", ...) scales it to a year,
+amounts without one are taken as quarterly, which is how NSW agents quote
+levies and rates. The first mention of each kind wins.
+"""
+
+from functools import lru_cache
+import re
+from typing import Iterable
+
+KINDS = ("strata", "water", "council")
+QUARTERLY, ANNUAL, MONTHLY = 4, 1, 12
+DEFAULT_PERIOD = QUARTERLY
+
+RATE = re.compile(
+    r"""
+    (?=[swc])\b(?P<kind>strata|water|council)\b
+    # A $ or a word like "rates" comes before the amount, so "water views, 3 bed" isn't
+    # one, and the filler stops at the next kind, "the water. Council rates $345" is council's
+    (?:[^0-9\n$swc]|[swc](?!trata|ater|ouncil)){0,40}?
+    (?:\$|\b(?:rates?|levies|levy|fees?)\b(?:[^0-9\nswc]|[swc](?!trata|ater|ouncil)){0,40}?)
+    (?P<amount>(?:\d{1,3}(?:,\d{3})+|\d+)(?:\.\d{1,2})?)
+    \s*
+    (?P<period>
+        (?:per|a|each|every|/)\s*
+        (?:quarterly|quarter|qtr|q|annually|annum|yearly|year|yr|monthly|month|mth)
+        | quarterly | annually | yearly | monthly
+        | p\.?\s*[aqm]\.?
+    )?
+    (?![a-z0-9])
+    """,
+    # Matched against lowercased text, IGNORECASE makes the scan several times slower
+    re.VERBOSE,
+)
+
+_NOT_LETTERS = re.compile(r"[^a-z]")
+_PERIODS = {
+    QUARTERLY: ("quarter", "qtr", "q", "quarterly", "pq"),
+    ANNUAL: ("annum", "year", "yr", "annually", "yearly", "pa"),
+    MONTHLY: ("month", "mth", "monthly", "pm"),
+}
+_UNITS = {unit: multiplier for multiplier, units in _PERIODS.items() for unit in units}
+_PREFIXES = ("per", "a", "each", "every")
+
+
+# There are only a handful of ways to write a period
+@lru_cache(maxsize=1024)
+def _multiplier(period: str) -> int:
+    word = _NOT_LETTERS.sub("", period.lower())
+    for prefix in _PREFIXES:
+        if word.startswith(prefix) and word != prefix and word[len(prefix):] in _UNITS:
+            word = word[len(prefix):]
+            break
+    return _UNITS.get(word, DEFAULT_PERIOD)
+
+
+def annual(amount: str, period: str) -> int:
+    return round(float(amount.replace(",", "")) * _multiplier(period or ""))
+
+
+def extract_rates(description: str) -> tuple[int, int, int]:
+    """(strata, water, council) in dollars a year, 0 where not mentioned."""
+    found: dict[str, int] = {}
+    for match in RATE.finditer(description.lower()):
+        kind = match["kind"]
+        if kind in found:
+            continue
+        found[kind] = annual(match["amount"], match["period"])
+        if len(found) == len(KINDS):
+            break
+    return (found.get("strata", 0), found.get("water", 0), found.get("council", 0))
+
+
+def extract_rates_column(descriptions: Iterable[str]):
+    """extract_rates over a whole column at once, as a DataFrame of strata/water/council."""
+    import pandas as pd
+
+    series = pd.Series(descriptions, dtype=object).fillna("").str.lower()
+    matches = series.str.extractall(RATE)
+    result = pd.DataFrame(0, index=series.index, columns=list(KINDS), dtype="int64")
+    if matches.empty:
+        return result
+
+    # extractall keeps the (row, match) order finditer would, so first() is the first mention
+    matches = matches.reset_index(level="match", drop=True)
+    amounts = matches["amount"].str.replace(",", "", regex=False).astype("float64")
+    periods = matches["period"].fillna("")
+    multipliers = periods.map({p: _multiplier(p) for p in periods.unique()})
+    matches["annual"] = (amounts * multipliers).round().astype("int64")
+
+    first = matches.groupby([matches.index, "kind"])["annual"].first().unstack("kind")
+    result.update(first.reindex(columns=list(KINDS)))
+    return result.astype("int64")
@@ -0,0 +1,269 @@
+"""Repeat-sales price index per postcode and per building.
+
+Every sale gets a canonical property key, a hash of its normalized address.
+A {key: sales in time order} map pairs each sale with the sales of the same
+property either side of it as sales arrive, one dict lookup and a bisect per
+sale, and a backfilled sale retracts the pair it splits. Each pair says the
+log price moved y between periods s and t, and the index b solves y = b[t] -
+b[s] by least squares (Bailey, Muth and Nourse), with pairs weighted down by
+the years between them like Case-Shiller. The weights are fixed rather than
+re-estimated, so each group's normal equations are plain sums that new pairs
+add to, and solving them is a small dense solve over its periods.
+
+    python property/repeat_sales.py sqlite:///property.db --postcode 2009
+"""
+
+import argparse
+import bisect
+from dataclasses import dataclass, field
+import hashlib
+import os
+import pickle
+import sys
+from typing import Optional
+
+import numpy as np
+
+import data
+import projection
+
+STATE_PATH = os.getenv("REPEAT_SALES_PATH", "repeat_sales.pkl")
+ORIGIN_YEAR = 1990
+# Variance of a pair's log price change: noise in each sale plus drift per year held
+NOISE_VARIANCE = 0.01
+DRIFT_VARIANCE = 0.002
+# Faster than this either way is a renovation or a data error, not the market
+MAX_ANNUAL_LOG_RETURN = 0.4
+
+def key_hash(text: str) -> int:
+    return int.from_bytes(hashlib.blake2b(text.encode(), digest_size=8).digest(), "little", signed=True)
+
+
+def period_of(sell_time: np.ndarray, period_months: int) -> np.ndarray:
+    """Periods since ORIGIN_YEAR, period_months long."""
+    dates = np.asarray(sell_time, dtype="datetime64[s]").astype("datetime64[M]").astype(np.int64)
+    return (dates - (ORIGIN_YEAR - 1970) * 12) // period_months
+
+
+@dataclass
+class Pairs:
+    """Consecutive sales of the same property, earlier sale first."""
+
+    postcode: np.ndarray
+    building: np.ndarray  # key_hash of canonical_building
+    first_time: np.ndarray
+    second_time: np.ndarray
+    log_change: np.ndarray
+    # 1 for a new pair, -1 for one a backfilled sale split in two
+    sign: np.ndarray
+
+    def __len__(self) -> int:
+        """New pairs less retracted ones."""
+        return int(self.sign.sum())
+
+
+@dataclass
+class PairBuilder:
+    # {property key: [(sell_time, log price, listing_id)]} of its sales in time order
+    sales: dict[int, list[tuple[int, float, int]]] = field(default_factory=dict)
+    seen_listings: set[int] = field(default_factory=set)
+
+    def add(self, sales: projection.Sales) -> Pairs:
+        """Pair each new sale with the sales of its property either side of it.
+
+        A backfilled sale between two already paired sales splits their pair, which
+        comes back retracted, so the pairs don't depend on the order sales arrive in.
+        """
+        order = np.argsort(sales.sell_time, kind="stable")
+        postcode, building, first, second, change, sign = [], [], [], [], [], []
+
+        def pair(code: int, group: int, earlier: tuple, later: tuple, direction: int):
+            postcode.append(code)
+            building.append(group)
+            first.append(earlier[0])
+            second.append(later[0])
+            change.append(later[1] - earlier[1])
+            sign.append(direction)
+
+        for i in order.tolist():
+            listing_id = int(sales.listing_id[i])
+            price = int(sales.listing_price[i])
+            if listing_id in self.seen_listings or price <= 0:
+                continue
+            self.seen_listings.add(listing_id)
+            apt, num, street, code = sales.apt_num[i], sales.street_num[i], sales.street[i], int(sales.postcode[i])
+            key = key_hash(data.canonical_address(apt, num, street, code))
+            sale = (int(sales.sell_time[i]), float(np.log(price)), listing_id)
+            history = self.sales.setdefault(key, [])
+            at = bisect.bisect(history, sale)
+            history.insert(at, sale)
+            if len(history) == 1:
+                continue
+            group = key_hash(data.canonical_building(num, street, code))
+            before = history[at - 1] if at > 0 else None
+            after = history[at + 1] if at + 1 < len(history) else None
+            if before and after:
+                pair(code, group, before, after, -1)
+            if before:
+                pair(code, group, before, sale, 1)
+            if after:
+                pair(code, group, sale, after, 1)
+        return Pairs(
+            np.array(postcode, dtype=np.int64),
+            np.array(building, dtype=np.int64),
+            np.array(first, dtype=np.int64),
+            np.array(second, dtype=np.int64),
+            np.array(change, dtype=np.float64),
+            np.array(sign, dtype=np.int64),
+        )
+
+
+@dataclass
+class NormalEquations:
+    """X'WX and X'Wy of one group's pairs, over periods start..start+len-1."""
+
+    start: int
+    xtx: np.ndarray
+    xty: np.ndarray
+    pairs: int = 0
+
+    def cover(self, low: int, high: int):
+        """Grow to cover periods low..high."""
+        new_start, new_end = min(self.start, low), max(self.start + len(self.xty) - 1, high)
+        before, after = self.start - new_start, new_end - (self.start + len(self.xty) - 1)
+        if before or after:
+            self.xtx = np.pad(self.xtx, ((before, after), (before, after)))
+            self.xty = np.pad(self.xty, (before, after))
+            self.start = new_start
+
+    def add(self, first: np.ndarray, second: np.ndarray, y: np.ndarray, weight: np.ndarray):
+        self.cover(int(first.min()), int(second.max()))
+        i, j = first - self.start, second - self.start
+        np.add.at(self.xtx, (i, i), weight)
+        np.add.at(self.xtx, (j, j), weight)
+        np.add.at(self.xtx, (i, j), -weight)
+        np.add.at(self.xtx, (j, i), -weight)
+        np.add.at(self.xty, j, weight * y)
+        np.add.at(self.xty, i, -weight * y)
+        self.pairs += int(np.sign(weight).sum())
+
+    def solve(self) -> tuple[np.ndarray, np.ndarray]:
+        """(periods, log index) relative to the first period with a sale, nan where no pair touches."""
+        # A period whose only pairs were retracted can keep a rounding error's worth
+        diagonal = np.diag(self.xtx)
+        observed = diagonal > 1e-9 * diagonal.max()
+        index = np.full(len(self.xty), np.nan)
+        if observed.sum() < 2:
+            return np.arange(self.start, self.start + len(self.xty)), index
+        cols = np.flatnonzero(observed)
+        base, rest = cols[0], cols[1:]
+        beta, *_ = np.linalg.lstsq(self.xtx[np.ix_(rest, rest)], self.xty[rest], rcond=None)
+        index[base] = 0.0
+        index[rest] = beta
+        return np.arange(self.start, self.start + len(self.xty)), index
+
+
+@dataclass
+class RepeatSalesIndex:
+    """Normal equations per group, by postcode or building."""
+
+    level: str  # "postcode" or "building"
+    period_months: int = 3
+    groups: dict[int, NormalEquations] = field(default_factory=dict)
+
+    def add(self, pairs: Pairs) -> None:
+        first = period_of(pairs.first_time, self.period_months)
+        second = period_of(pairs.second_time, self.period_months)
+        years = (pairs.second_time - pairs.first_time) / projection.SECONDS_PER_YEAR
+        with np.errstate(divide="ignore", invalid="ignore"):
+            plausible = np.abs(pairs.log_change) <= MAX_ANNUAL_LOG_RETURN * np.maximum(years, 1)
+        usable = (second > first) & plausible
+        if not usable.any():
+            return
+        group = (pairs.postcode if self.level == "postcode" else pairs.building)[usable]
+        first, second = first[usable], second[usable]
+        y = pairs.log_change[usable]
+        weight = pairs.sign[usable] / (NOISE_VARIANCE + DRIFT_VARIANCE * years[usable])
+
+        order = np.argsort(group, kind="stable")
+        group, first, second, y, weight = group[order], first[order], second[order], y[order], weight[order]
+        keys, starts = np.unique(group, return_index=True)
+        for key, chunk in zip(keys.tolist(), np.split(np.arange(len(group)), starts[1:])):
+            equations = self.groups.get(key)
+            if equations is None:
+                low = int(first[chunk].min())
+                equations = self.groups[key] = NormalEquations(low, np.zeros((1, 1)), np.zeros(1))
+            equations.add(first[chunk], second[chunk], y[chunk], weight[chunk])
+
+    def series(self, group: int) -> tuple[list[str], np.ndarray]:
+        """(period labels, index with the first period at 100)."""
+        periods, log_index = self.groups[group].solve()
+        months = periods * self.period_months
+        labels = [
+            f"{ORIGIN_YEAR + m // 12}" if self.period_months == 12 else f"{ORIGIN_YEAR + m // 12}-{m % 12 + 1:02d}"
+            for m in months.tolist()
+        ]
+        return labels, 100 * np.exp(log_index)
+
+
+@dataclass
+class RepeatSales:
+    builder: PairBuilder = field(default_factory=PairBuilder)
+    by_postcode: RepeatSalesIndex = field(default_factory=lambda: RepeatSalesIndex("postcode", 3))
+    # Buildings have far fewer pairs, a year per period keeps them solvable
+    by_building: RepeatSalesIndex = field(default_factory=lambda: RepeatSalesIndex("building", 12))
+    # The largest listing_id update_from_db has read, None before it has read any
+    listing_cursor: Optional[int] = None
+
+    def add(self, sales: projection.Sales) -> int:
+        """Fold in new sales, already seen listings are skipped. Returns the new pairs."""
+        pairs = self.builder.add(sales)
+        self.by_postcode.add(pairs)
+        self.by_building.add(pairs)
+        return len(pairs)
+
+    def update_from_db(self, url: str) -> int:
+        """Fold in the sales stored since the last update, read past listing_cursor."""
+        sales = projection.load_sales(url, after_listing_id=self.listing_cursor)
+        if len(sales):
+            self.listing_cursor = max(self.listing_cursor or 0, int(sales.listing_id.max()))
+        return self.add(sales)
+
+    def building_series(self, street_num: str, street: str, postcode: int) -> tuple[list[str], np.ndarray]:
+        return self.by_building.series(key_hash(data.canonical_building(street_num, street, postcode)))
+
+    def save(self, path: str = STATE_PATH):
+        with open(path, "wb") as f:
+            pickle.dump(self, f)
+
+    @staticmethod
+    def load(path: str = STATE_PATH) -> "RepeatSales":
+        if not os.path.exists(path):
+            return RepeatSales()
+        with open(path, "rb") as f:
+            return pickle.load(f)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Repeat-sales price index from property_sale")
+    parser.add_argument("db_location", help="Postgres URL, or sqlite:///path for a local file")
+    parser.add_argument("--state", default=STATE_PATH, help="saved index, updated with new sales")
+    parser.add_argument("--postcode", type=int)
+    parser.add_argument("--building", nargs=2, metavar=("STREET_NUM", "STREET"), help="building in --postcode")
+    args = parser.parse_args()
+
+    state = RepeatSales.load(args.state)
+    print(f"{state.update_from_db(args.db_location)} new repeat sale pairs")
+    state.save(args.state)
+
+    if args.building and args.postcode:
+        labels, index = state.building_series(*args.building, args.postcode)
+    elif args.postcode:
+        labels, index = state.by_postcode.series(args.postcode)
+    else:
+        for postcode, equations in sorted(state.by_postcode.groups.items()):
+            print(f"{postcode}: {equations.pairs} pairs")
+        sys.exit(0)
+    for label, value in zip(labels, index):
+        if not np.isnan(value):
+            print(f"{label}: {value:.1f}")
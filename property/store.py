@@ -0,0 +1,267 @@
+"""Bulk, idempotent writes of extracted listings to property_sale.
+
+Rows are upserted on listing_id a batch at a time, so re-running a scrape
+refreshes listings instead of duplicating them. Postgres is the real store,
+SQLite takes the same rows through the same interface for local runs.
+"""
+
+from abc import ABC, abstractmethod
+from dataclasses import dataclass, field
+import sqlite3
+from typing import Optional
+
+BATCH_SIZE = 1000
+
+# In extract_fields' tuple order
+COLUMNS = (
+    "apt_num",
+    "street_num",
+    "street",
+    "postcode",
+    "listing_price",
+    "square_mtr",
+    "sell_time",
+    "bedrooms",
+    "bathrooms",
+    "car_spaces",
+    "water_rates",
+    "council_rates",
+    "strata",
+    "listing_id",
+)
+LISTING_ID = COLUMNS.index("listing_id")
+
+CREATE_TABLE = """
+    CREATE TABLE IF NOT EXISTS property_sale (
+        apt_num TEXT,
+        street_num TEXT,
+        street TEXT,
+        postcode INTEGER,
+        listing_price INTEGER,
+        square_mtr INTEGER,
+        sell_time INTEGER, --unix timestamp
+        bedrooms INTEGER,
+        bathrooms INTEGER,
+        car_spaces INTEGER,
+        water_rates INTEGER,
+        council_rates INTEGER,
+        strata INTEGER,
+        listing_id BIGINT
+    )
+"""
+CREATE_INDEX = """
+    CREATE UNIQUE INDEX IF NOT EXISTS property_sale_listing_id
+    ON property_sale (listing_id)
+"""
+
+_UPSERT = f"""
+    INSERT INTO property_sale ({", ".join(COLUMNS)})
+    VALUES {{values}}
+    ON CONFLICT (listing_id) DO UPDATE SET
+    {", ".join(f"{c} = EXCLUDED.{c}" for c in COLUMNS if c != "listing_id")}
+"""
+
+
+@dataclass
+class BatchError:
+    batch: int
+    start: int  # offset of the batch's first row in the rows written
+    rows: int
+    error: str
+
+
+@dataclass
+class WriteStats:
+    batches: int = 0
+    rows: int = 0  # distinct listings upserted, a batch's repeats count once
+    failed: list[BatchError] = field(default_factory=list)
+
+    def report(self) -> str:
+        failed_rows = sum(f.rows for f in self.failed)
+        return (
+            f"batches={self.batches} rows={self.rows} "
+            f"failed_batches={len(self.failed)} failed_rows={failed_rows}"
+        )
+
+
+def dedupe(rows: list[tuple]) -> list[tuple]:
+    """Keep the last row per listing_id, one statement can't upsert a key twice."""
+    return list({row[LISTING_ID]: row for row in rows}.values())
+
+
+class Writer(ABC):
+    def __init__(self, batch_size: int = BATCH_SIZE):
+        self.batch_size = batch_size
+        self.stats = WriteStats()
+
+    @abstractmethod
+    def ensure_schema(self): ...
+
+    @abstractmethod
+    def upsert(self, rows: list[tuple]): ...
+
+    @abstractmethod
+    def rollback(self): ...
+
+    @abstractmethod
+    def close(self): ...
+
+    def write(self, rows: list[tuple]) -> WriteStats:
+        """Upsert rows in batch_size chunks, each committed on its own.
+
+        A failing batch is rolled back, reported and counted in stats.failed,
+        the batches after it are still written.
+        """
+        for i in range(0, len(rows), self.batch_size):
+            batch = rows[i : i + self.batch_size]
+            self.stats.batches += 1
+            unique = dedupe(batch)
+            try:
+                self.upsert(unique)
+            except Exception as e:
+                self.rollback()
+                failure = BatchError(self.stats.batches, i, len(batch), str(e).strip())
+                self.stats.failed.append(failure)
+                print(f"batch {failure.batch} (rows {i}-{i + len(batch) - 1}) failed: {failure.error}")
+                continue
+            self.stats.rows += len(unique)
+        return self.stats
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def sqlite_path(url: str) -> Optional[str]:
+    """The file for sqlite:///path or a .db/.sqlite path, None for a Postgres URL."""
+    if url.startswith("sqlite:///"):
+        return url.removeprefix("sqlite:///")
+    if url.endswith((".db", ".sqlite")):
+        return url
+    return None
+
+
+def connect(url: str):
+    if (path := sqlite_path(url)) is not None:
+        return sqlite3.connect(path)
+    import psycopg2
+
+    return psycopg2.connect(url)
+
+
+def read_columns(
+    url: str, columns: tuple[str, ...] = COLUMNS, after_listing_id: Optional[int] = None
+) -> list[tuple]:
+    """Every row, or with after_listing_id only the listings stored since a read that
+    saw up to it. Listing IDs are handed out in increasing order, so new listings are
+    the ones past the largest read before."""
+    conn = connect(url)
+    try:
+        cur = conn.cursor()
+        query = f"SELECT {', '.join(columns)} FROM property_sale"
+        if after_listing_id is None:
+            cur.execute(query)
+        else:
+            placeholder = "?" if sqlite_path(url) is not None else "%s"
+            cur.execute(f"{query} WHERE listing_id > {placeholder}", (after_listing_id,))
+        return cur.fetchall()
+    finally:
+        conn.close()
+
+
+class PostgresWriter(Writer):
+    def __init__(self, url: str, batch_size: int = BATCH_SIZE):
+        super().__init__(batch_size)
+        self.conn = connect(url)
+
+    def ensure_schema(self):
+        with self.conn.cursor() as cur:
+            cur.execute(CREATE_TABLE)
+            cur.execute("ALTER TABLE property_sale ADD COLUMN IF NOT EXISTS listing_id BIGINT")
+            cur.execute("SELECT to_regclass('property_sale_listing_id')")
+            if cur.fetchone()[0] is None:
+                # Earlier runs inserted every scrape again, keep the first copy. Only
+                # needed once, the unique index keeps it that way from then on.
+                cur.execute(
+                    """
+                    DELETE FROM property_sale a USING property_sale b
+                    WHERE a.listing_id = b.listing_id AND a.ctid > b.ctid
+                    """
+                )
+                cur.execute(CREATE_INDEX)
+        self.conn.commit()
+
+    def upsert(self, rows: list[tuple]):
+        from psycopg2.extras import execute_values
+
+        with self.conn.cursor() as cur:
+            execute_values(cur, _UPSERT.format(values="%s"), rows, page_size=len(rows))
+        self.conn.commit()
+
+    def rollback(self):
+        self.conn.rollback()
+
+    def close(self):
+        self.conn.close()
+
+
+class SQLiteWriter(Writer):
+    def __init__(self, path: str, batch_size: int = BATCH_SIZE):
+        super().__init__(batch_size)
+        self.conn = connect(f"sqlite:///{path}")
+        self.conn.execute("PRAGMA journal_mode = WAL")
+        self.conn.execute("PRAGMA synchronous = NORMAL")
+
+    def ensure_schema(self):
+        columns = {row[1] for row in self.conn.execute("PRAGMA table_info(property_sale)")}
+        self.conn.execute(CREATE_TABLE)
+        if columns and "listing_id" not in columns:
+            self.conn.execute("ALTER TABLE property_sale ADD COLUMN listing_id BIGINT")
+        indexed = self.conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'index' AND name = 'property_sale_listing_id'"
+        ).fetchone()
+        if not indexed:
+            # Earlier runs inserted every scrape again, keep the first copy. Only
+            # needed once, the unique index keeps it that way from then on.
+            self.conn.execute(
+                """
+                DELETE FROM property_sale
+                WHERE listing_id IS NOT NULL AND rowid NOT IN (
+                    SELECT MIN(rowid) FROM property_sale GROUP BY listing_id
+                )
+                """
+            )
+            self.conn.execute(CREATE_INDEX)
+        self.conn.commit()
+
+    def upsert(self, rows: list[tuple]):
+        placeholders = f"({', '.join('?' * len(COLUMNS))})"
+        self.conn.executemany(_UPSERT.format(values=placeholders), rows)
+        self.conn.commit()
+
+    def rollback(self):
+        self.conn.rollback()
+
+    def close(self):
+        self.conn.close()
+
+
+def open_writer(url: str, batch_size: int = BATCH_SIZE) -> Writer:
+    """SQLite for sqlite:///path or a .db/.sqlite file, Postgres otherwise."""
+    if (path := sqlite_path(url)) is not None:
+        writer: Writer = SQLiteWriter(path, batch_size)
+    else:
+        writer = PostgresWriter(url, batch_size)
+    writer.ensure_schema()
+    return writer
+
+
+def count(writer: Writer) -> tuple[int, int]:
+    """(rows, distinct listing_ids) in property_sale."""
+    cur = writer.conn.cursor()
+    cur.execute("SELECT COUNT(*), COUNT(DISTINCT listing_id) FROM property_sale")
+    row: Optional[tuple] = cur.fetchone()
+    cur.close()
+    return row or (0, 0)
@@ -0,0 +1,76 @@
+import numpy as np
+import pytest
+
+import bench_extract
+import comparables
+import data
+import projection
+import store
+
+SALES, QUERIES = 5_000, 200
+
+
+@pytest.fixture(scope="module")
+def synthetic():
+    records, _ = data.extract_batch(bench_extract.synthetic_listings(SALES + QUERIES, seed=0))
+    sales = projection.Sales.from_rows(records[:-QUERIES])
+    listings = projection.Sales.from_rows(records[-QUERIES:])
+    return records[:-QUERIES], sales, listings, float(sales.sell_time.max())
+
+
+@pytest.fixture(scope="module")
+def batched(synthetic):
+    _, sales, _, _ = synthetic
+    index = comparables.ComparableIndex()
+    for batch in np.array_split(np.arange(len(sales)), 4):
+        index.add(sales.take(batch))
+    return index
+
+
+def brute_force(index: comparables.ComparableIndex, listings: projection.Sales, i: int, now: float) -> set[int]:
+    """The K nearest sales in listing i's postcode, from a float64 sort over all of them."""
+    bucket = index.buckets[int(listings.postcode[i])]
+    query = projection.Sales(**{**listings.take(np.array([i])).__dict__, "sell_time": np.array([now])})
+    q = comparables._features(query, comparables.DEFAULT_SQM).astype(np.float64)
+    distance = ((bucket.features.astype(np.float64) - q) ** 2).sum(axis=1)
+    return set(bucket.listing_id[np.argsort(distance, kind="stable")[: comparables.K]].tolist())
+
+
+def test_batched_matches_whole(synthetic, batched):
+    _, sales, listings, now = synthetic
+    whole = comparables.ComparableIndex()
+    whole.add(sales)
+
+    assert batched.add(sales) == 0
+    assert np.array_equal(whole.query(listings, now=now).listing_id, batched.query(listings, now=now).listing_id)
+
+
+def test_agrees_with_brute_force(synthetic, batched):
+    _, _, listings, now = synthetic
+    result = batched.query(listings, now=now)
+    # float32 distances can swap exact ties, so compare as sets
+    agree = sum(set(result.listing_id[i].tolist()) == brute_force(batched, listings, i, now) for i in range(len(listings)))
+    assert agree >= 0.98 * len(listings)
+
+
+def test_refresh_reads_only_new_listings(synthetic, batched, tmp_path, monkeypatch):
+    records, _, listings, now = synthetic
+    url = f"sqlite:///{tmp_path / 'property.db'}"
+    read = []
+    read_columns = store.read_columns
+
+    def counted(*args, **kwargs):
+        read.append(len(result := read_columns(*args, **kwargs)))
+        return result
+
+    monkeypatch.setattr(store, "read_columns", counted)
+    refreshed = comparables.ComparableIndex()
+    half = len(records) // 2
+    for batch in (records[:half], records[half:]):
+        with store.open_writer(url) as writer:
+            writer.write(batch)
+        refreshed.refresh(url)
+    refreshed.refresh(url)
+
+    assert read == [half, len(records) - half, 0]
+    assert np.array_equal(refreshed.query(listings, now=now).listing_id, batched.query(listings, now=now).listing_id)
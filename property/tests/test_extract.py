@@ -0,0 +1,50 @@
+import json
+import tracemalloc
+
+import pytest
+
+import bench_extract
+import data
+
+
+@pytest.fixture(scope="module")
+def listings():
+    return bench_extract.synthetic_listings(3_000, seed=0)
+
+
+def extracted(listings: list[dict], workers: int):
+    stats = data.IngestStats()
+    records = [r for batch in data.extract(listings, stats, 250, workers) for r in batch]
+    return records, stats
+
+
+def test_parallel_matches_serial(listings):
+    expected, expected_stats = extracted(listings, 1)
+    records, stats = extracted(listings, 2)
+
+    assert expected_stats.rejected
+    assert records == expected
+    assert stats.rejected == expected_stats.rejected
+    assert (stats.records, stats.accepted) == (expected_stats.records, expected_stats.accepted)
+
+
+def test_malformed_element_only_loses_itself(listings, tmp_path):
+    # Big enough that reading it whole would stand out from the read buffers
+    copies = 10
+    elements = [json.dumps(listing) for listing in listings] * copies
+    bad = len(listings) // 10
+    elements[bad] = elements[bad].replace('"address"', '"address" 5', 1)
+    path = tmp_path / "listings.json"
+    path.write_text("[" + ", ".join(elements) + "]")
+
+    stats = data.IngestStats()
+    tracemalloc.start()
+    read = [r["listingId"] for r in data.iter_records([str(path)], stats)]
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    # Streamed, not read whole
+    assert peak < path.stat().st_size / 4
+    expected = [listing["listingId"] for listing in listings] * copies
+    assert read == expected[:bad] + expected[bad + 1 :]
+    assert stats.rejected == {"invalid_json": 1}
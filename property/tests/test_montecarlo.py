@@ -0,0 +1,52 @@
+import numpy as np
+import pytest
+
+import bench_extract
+import data
+import montecarlo
+import projection
+
+YEARS = np.array([5, 10, 20])
+
+
+@pytest.fixture(scope="module")
+def model_and_properties():
+    records, _ = data.extract_batch(bench_extract.synthetic_listings(20_000, seed=0))
+    sales = projection.Sales.from_rows(records)
+    latest = projection.latest_sales(sales)
+    return montecarlo.fit(sales), latest.take(np.arange(20))
+
+
+def test_histogram_percentiles_match_exact(model_and_properties):
+    model, properties = model_and_properties
+    paths = 20_000
+    case = montecarlo.Case(
+        float(properties.listing_price[0]),
+        float(properties.annual_costs()[0]),
+        model.returns_for(int(properties.postcode[0]), int(properties.bedrooms[0])),
+        np.zeros(len(YEARS)),
+        np.random.SeedSequence(1),
+    )
+    streamed = montecarlo.simulate_case(case, YEARS, paths)
+
+    # Every path at once, the way the histogram avoids
+    rng = np.random.default_rng(np.random.SeedSequence(1))
+    chunks = []
+    for start in range(0, paths, montecarlo.CHUNK):
+        n = min(montecarlo.CHUNK, paths - start)
+        draws = case.returns[rng.integers(len(case.returns), size=(n, YEARS.max()))]
+        chunks.append(np.cumsum(draws, axis=1)[:, YEARS - 1])
+    log_ratio = np.percentile(np.concatenate(chunks), montecarlo.PERCENTILES, axis=0).T
+    sell = case.purchase * np.exp(log_ratio)
+    duty = projection.stamp_duty(np.array([case.purchase]))[0]
+    exact = sell * (1 - projection.SELLING_COST) - case.purchase - duty - case.annual_costs * YEARS[:, None]
+
+    # One bin is 0.1% of the price
+    assert np.abs(streamed - exact).max() / case.purchase < 0.002
+
+
+def test_workers_give_the_same_numbers(model_and_properties):
+    model, properties = model_and_properties
+    one = montecarlo.simulate(properties, model, YEARS, 2_000, 0, 1)
+    two = montecarlo.simulate(properties, model, YEARS, 2_000, 0, 2)
+    assert np.array_equal(one.net_return, two.net_return)
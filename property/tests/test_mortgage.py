@@ -0,0 +1,37 @@
+import numpy as np
+
+import bench_mortgage
+import mortgage
+
+
+def reference(loans: mortgage.Loans, i: int) -> tuple[np.ndarray, np.ndarray]:
+    """Loan i's balances and interest, one month at a time."""
+    term = loans.term_months
+    balance, rate, offset = loans.principal[i], loans.rate[i], loans.offset[i]
+    repayment = mortgage.minimum_repayment(np.array([balance]), np.array([rate / 12]), term)[0]
+    balances, interests = [balance], []
+    for month in range(term):
+        if month in loans.lump_sums:
+            balance = max(balance - np.broadcast_to(loans.lump_sums[month], (len(loans),))[i], 0)
+            balances[-1] = balance
+        if month in loans.offset_changes:
+            offset = np.broadcast_to(loans.offset_changes[month], (len(loans),))[i]
+        if month in loans.rate_changes:
+            rate = np.broadcast_to(loans.rate_changes[month], (len(loans),))[i]
+            repayment = mortgage.minimum_repayment(np.array([balance]), np.array([rate / 12]), term - month)[0]
+        interest = rate / 12 * max(balance - offset, 0)
+        balance = max(balance + interest - repayment - loans.extra[i], 0)
+        if balance < mortgage.PAID_OFF:
+            balance = 0
+        interests.append(interest)
+        balances.append(balance)
+    return np.array(balances), np.array(interests)
+
+
+def test_amortize_matches_monthly_loop():
+    loans = bench_mortgage.random_loans(200, np.random.default_rng(0))
+    schedule = mortgage.amortize(loans)
+    for i in range(len(loans)):
+        balances, interests = reference(loans, i)
+        np.testing.assert_allclose(schedule.balance[i], balances, rtol=0, atol=0.01)
+        np.testing.assert_allclose(schedule.interest[i], interests, rtol=0, atol=0.01)
@@ -0,0 +1,25 @@
+import json
+import os
+
+import pytest
+
+import rates
+
+with open(os.path.join(os.path.dirname(__file__), "..", "fixtures", "rates.json")) as f:
+    FIXTURES = json.load(f)
+
+
+def expected(fixture: dict) -> tuple[int, int, int]:
+    return fixture["strata"], fixture["water"], fixture["council"]
+
+
+@pytest.mark.parametrize("fixture", FIXTURES, ids=range(len(FIXTURES)))
+def test_extract_rates(fixture):
+    assert rates.extract_rates(fixture["description"]) == expected(fixture)
+
+
+def test_extract_rates_column():
+    column = rates.extract_rates_column([f["description"] for f in FIXTURES])
+    assert [tuple(int(v) for v in row) for row in column.itertuples(index=False)] == [
+        expected(f) for f in FIXTURES
+    ]
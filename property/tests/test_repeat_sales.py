@@ -0,0 +1,99 @@
+import numpy as np
+import pytest
+
+import bench_repeat_sales
+import projection
+import repeat_sales
+import store
+
+PROPERTIES = 5_000
+# Worst log error allowed against the true path with this many apartments. It
+# shrinks with the square root of the pairs in each quarter, much below a couple of
+# thousand apartments some quarters only have a pair or two.
+ERROR_TOLERANCE = 0.05 * (20_000 / PROPERTIES) ** 0.5
+
+
+@pytest.fixture(scope="module")
+def synthetic():
+    return bench_repeat_sales.synthetic_sales(PROPERTIES, seed=0)
+
+
+@pytest.fixture(scope="module")
+def whole(synthetic):
+    sales, _ = synthetic
+    index = repeat_sales.RepeatSales()
+    index.add(sales.take(np.random.default_rng(0).permutation(len(sales))))
+    return index
+
+
+def worst_difference(a: repeat_sales.RepeatSales, b: repeat_sales.RepeatSales) -> float:
+    worst = 0.0
+    for postcode in bench_repeat_sales.POSTCODES:
+        _, index = a.by_postcode.series(postcode)
+        _, other = b.by_postcode.series(postcode)
+        worst = max(worst, np.nanmax(np.abs(other - index)))
+    return worst
+
+
+def rows(sales: projection.Sales) -> list[tuple]:
+    return list(zip(*(getattr(sales, column).tolist() for column in store.COLUMNS)))
+
+
+def test_recovers_true_path(synthetic, whole):
+    _, truth = synthetic
+    for postcode, path in truth.items():
+        labels, index = whole.by_postcode.series(postcode)
+        log_index = np.log(index / 100)
+        # Both relative to the first quarter the index covers
+        first_quarter = (int(labels[0][:4]) - 2000) * 4 + (int(labels[0][5:]) - 1) // 3
+        expected = path[first_quarter : first_quarter + len(index)] - path[first_quarter]
+        known = ~np.isnan(log_index)
+        error = log_index[known] - expected[: len(index)][known]
+        # The first quarter's own noise shifts the whole index, only its shape counts
+        assert np.abs(error - error.mean()).max() < ERROR_TOLERANCE
+
+
+def test_differently_written_addresses_share_a_key(whole):
+    assert len(whole.builder.sales) == PROPERTIES
+
+
+def test_batches_match_whole(synthetic, whole):
+    sales, _ = synthetic
+    incremental = repeat_sales.RepeatSales()
+    for batch in np.array_split(np.arange(len(sales)), 5):
+        incremental.add(sales.take(batch))
+    assert worst_difference(whole, incremental) < 1e-6
+
+
+def test_backfilled_batches_match_whole(synthetic, whole):
+    sales, _ = synthetic
+    # Later sales first, then the history before them
+    backfilled = repeat_sales.RepeatSales()
+    by_date = np.argsort(sales.sell_time, kind="stable")
+    for batch in reversed(np.array_split(by_date, 5)):
+        backfilled.add(sales.take(batch))
+    assert worst_difference(whole, backfilled) < 1e-6
+
+
+def test_update_from_db_reads_only_new_listings(synthetic, whole, tmp_path, monkeypatch):
+    sales, _ = synthetic
+    url = f"sqlite:///{tmp_path / 'property.db'}"
+    read = []
+    read_columns = store.read_columns
+
+    def counted(*args, **kwargs):
+        read.append(len(result := read_columns(*args, **kwargs)))
+        return result
+
+    monkeypatch.setattr(store, "read_columns", counted)
+    updated = repeat_sales.RepeatSales()
+    first, second = np.array_split(np.arange(len(sales)), 2)
+    for batch in (first, second):
+        with store.open_writer(url) as writer:
+            writer.write(rows(sales.take(batch)))
+        updated.update_from_db(url)
+    updated.update_from_db(url)
+
+    assert read == [len(first), len(second), 0]
+    assert updated.listing_cursor == int(sales.listing_id.max())
+    assert worst_difference(whole, updated) < 1e-6
@@ -0,0 +1,18 @@
+import bench_extract
+import data
+import store
+
+
+def test_reingesting_keeps_one_row_per_listing(tmp_path):
+    records, _ = data.extract_batch(bench_extract.synthetic_listings(2_000, seed=0))
+    url = f"sqlite:///{tmp_path / 'property.db'}"
+    for _ in range(2):
+        with store.open_writer(url, batch_size=300) as writer:
+            # The repeat is deduped in its batch and counted once
+            stats = writer.write(records[:1] + records)
+            rows, listings = store.count(writer)
+
+        assert not stats.failed
+        assert rows == listings == stats.rows == len(records)
+
+    assert sorted(store.read_columns(url)) == sorted(records)
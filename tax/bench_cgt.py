@@ -0,0 +1,86 @@
+"""Speed of cgt.py over a synthetic trade history.
+
+Generates a sorted history of buys and sells across many tickers, never
+selling more than is held, and times both matching methods over all of it in
+one run, and over what's past a saved state from an earlier run.
+tests/test_cgt.py checks the results.
+
+    python tax/bench_cgt.py --trades 1000000
+"""
+
+import argparse
+from datetime import date, timedelta
+import json
+import math
+import os
+import random
+import tempfile
+import time
+
+import cgt
+
+
+def synthetic_history(n: int, tickers: int, seed: int, years: int = 6) -> list[tuple]:
+    rng = random.Random(seed)
+    names = [f"T{i:03d}" for i in range(tickers)]
+    price = {t: rng.uniform(5, 200) for t in names}
+    held = dict.fromkeys(names, 0)
+    day = date(2019, 3, 29)
+    per_day = max(n // (years * 365), 1)
+    history = []
+    for i in range(n):
+        if i % per_day == 0:
+            day += timedelta(days=1)
+        ticker = rng.choice(names)
+        price[ticker] *= math.exp(rng.gauss(0.0002, 0.02))
+        if held[ticker] and rng.random() < 0.4:
+            action, units = "SELL", rng.randint(1, held[ticker])
+            held[ticker] -= units
+        else:
+            action, units = "BUY", rng.randint(1, 200)
+            held[ticker] += units
+        p = round(price[ticker], 2)
+        history.append((day.isoformat(), ticker, action, str(units), str(p), f"{units * p + 9.5:.2f}"))
+    return history
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--trades", type=int, default=1_000_000)
+    parser.add_argument("--tickers", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    history = synthetic_history(args.trades, args.tickers, args.seed)
+    split = next(i for i, t in enumerate(history) if t[0] >= "2022-07-01")
+    results = {"trades": len(history)}
+    for method in cgt.METHODS:
+        engine = cgt.Engine(method)
+        start = time.perf_counter()
+        engine.process(history)
+        seconds = time.perf_counter() - start
+        summary = engine.summary()
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "state.json")
+            first = cgt.Engine(method)
+            first.process(history[:split])
+            first.save(path)
+            second = cgt.Engine.load(path, method)
+            start = time.perf_counter()
+            applied = second.process(history)
+            incremental_seconds = time.perf_counter() - start
+
+        results[method] = {
+            "seconds": round(seconds, 3),
+            "trades_per_second": round(len(history) / seconds),
+            "incremental_trades": applied,
+            "incremental_seconds": round(incremental_seconds, 3),
+            "net_capital_gain": round(sum(r["net_capital_gain"] for r in summary)),
+        }
+
+    print(json.dumps(results))
+
+
+if __name__ == "__main__":
+    main()
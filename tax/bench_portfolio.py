@@ -0,0 +1,83 @@
+"""Speed of portfolio.py over a synthetic trade history and prices.
+
+Writes a close for every weekday and ticker over ten years, then times the
+daily series built three ways: cold, warm from the cache with nothing new, and
+warm after another month of trades and closes. tests/test_portfolio.py checks
+the incremental build against a cold one, the trades and cgt.py.
+
+    python tax/bench_portfolio.py --tickers 300 --trades 200000 --years 10
+"""
+
+import argparse
+import json
+import os
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+import bench_cgt
+import portfolio
+
+
+def write_prices(history: list[tuple], directory: str, start: str, end: str, seed: int):
+    """A random walk close for every weekday from start to end, anchored on each ticker's trade prices."""
+    rng = np.random.default_rng(seed)
+    days = pd.bdate_range(start, end)
+    tickers = sorted({t[1] for t in history})
+    first_price = {}
+    for _, ticker, _, _, price, _ in history:
+        first_price.setdefault(ticker, float(price))
+    walks = np.exp(np.cumsum(rng.normal(0.0002, 0.02, size=(len(days), len(tickers))), axis=0))
+    for i, ticker in enumerate(tickers):
+        frame = pd.DataFrame({"Date": days.strftime("%Y-%m-%d"), "Close": np.round(first_price[ticker] * walks[:, i], 3)})
+        frame.to_csv(os.path.join(directory, f"{ticker}.csv"), index=False)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--trades", type=int, default=200_000)
+    parser.add_argument("--tickers", type=int, default=300)
+    parser.add_argument("--years", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    history = bench_cgt.synthetic_history(args.trades, args.tickers, args.seed, args.years)
+    first, end = history[0][0], history[-1][0]
+    # The last month arrives in a later run
+    through = np.datetime64(end) - 30
+    split = next(i for i, t in enumerate(history) if np.datetime64(t[0]) > through)
+    results = {"trades": len(history), "tickers": len({t[1] for t in history})}
+
+    with tempfile.TemporaryDirectory() as directory:
+        prices_dir, cache_dir = (os.path.join(directory, d) for d in ("prices", "cache"))
+        os.makedirs(prices_dir)
+        write_prices(history, prices_dir, first, str(through), args.seed)
+        cache = portfolio.Cache(cache_dir)
+
+        start = time.perf_counter()
+        frame, computed = portfolio.build(history[:split], prices_dir, cache, through)
+        results["cold_seconds"] = round(time.perf_counter() - start, 3)
+        results["days"] = len(frame.days)
+
+        start = time.perf_counter()
+        warm, warm_computed = portfolio.build(history[:split], prices_dir, cache, through)
+        warm.totals()
+        results["warm_seconds"] = round(time.perf_counter() - start, 3)
+        results["warm_days_computed"] = warm_computed
+
+        write_prices(history, prices_dir, first, end, args.seed)
+        start = time.perf_counter()
+        incremental, incremental_computed = portfolio.build(history, prices_dir, cache, np.datetime64(end))
+        results["incremental_seconds"] = round(time.perf_counter() - start, 3)
+        results["incremental_days_computed"] = incremental_computed
+
+    latest = incremental.totals().iloc[-1]
+    results["final_value"] = round(float(latest["value"]))
+    results["final_unrealized"] = round(float(latest["unrealized"]))
+    print(json.dumps(results))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+"""Speed of trades.py over synthetic broker exports.
+
+Writes a Stake-style export, an ASX Movements export and a unified file that
+overlap in date range, and times trades.run over them with a run size small
+enough to exercise the external merge. tests/test_trades.py checks the output.
+
+    python tax/bench_trades.py --trades 1000000 --run-size 100000
+"""
+
+import argparse
+from collections import Counter
+import csv
+from datetime import date, timedelta
+import json
+import os
+import random
+import tempfile
+import time
+
+import trades
+
+TICKERS = ["VAS", "VGS", "NDQ", "A200", "IVV", "BHP", "CBA", "CSL", "WES", "MQG"]
+
+
+def synthetic_trades(n: int, seed: int) -> list[tuple[date, str, str, int, float]]:
+    rng = random.Random(seed)
+    start = date(2019, 3, 29)
+    return [
+        (
+            start + timedelta(days=rng.randrange(6 * 365)),
+            rng.choice(TICKERS),
+            rng.choice(["Buy", "Sell"]),
+            rng.randint(1, 500),
+            round(rng.uniform(5, 300), 2),
+        )
+        for _ in range(n)
+    ]
+
+
+def write_exports(
+    rows, directory: str, overlap: float, fills: float, rng: random.Random
+) -> tuple[list[str], Counter]:
+    """Three exports, each trade in one of them and some share of trades in two, and
+    some share written twice to each as identical partial fills. Returns the paths
+    and how many times each trade should come out."""
+    stake, asx, unified = (os.path.join(directory, name) for name in ("stake.csv", "asx.csv", "unified.csv"))
+    files = [open(p, "w", newline="") for p in (stake, asx, unified)]
+    writers = [csv.writer(f) for f in files]
+    writers[0].writerow(["Trade date", "Symbol", "Side", "Quantity", "Unit price", "Value"])
+    writers[1].writerow(["Trade Date", "Settlement Date", "Code", "Action", "Units", "Average Price", "Brokerage", "Total"])
+    writers[2].writerow(trades.UNIFIED_HEADER)
+    in_file = [Counter() for _ in files]
+    for when, ticker, action, units, price in rows:
+        total = f"{units * price:.2f}"
+        formatted = [
+            [when.isoformat(), ticker, action.upper(), units, price, total],
+            [when.strftime("%d/%m/%Y"), "", ticker, action, units, f"${price:,.2f}", "9.50", f"${float(total):,.2f}"],
+            [when.strftime("%d %b %Y"), ticker, action, f"{units}.0", price, total],
+        ]
+        targets = rng.sample(range(3), 2 if rng.random() < overlap else 1)
+        copies = 2 if rng.random() < fills else 1
+        key = (when.isoformat(), ticker, action.upper(), str(units), f"{trades.Decimal(str(price)).normalize():f}")
+        for t in targets:
+            writers[t].writerows([formatted[t]] * copies)
+            in_file[t][key] += copies
+    for f in files:
+        f.close()
+    expected = Counter()
+    for counts in in_file:
+        expected |= counts
+    return [stake, asx, unified], expected
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--trades", type=int, default=1_000_000)
+    parser.add_argument("--run-size", type=int, default=100_000)
+    parser.add_argument("--overlap", type=float, default=0.2)
+    parser.add_argument("--fills", type=float, default=0.01)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rows = synthetic_trades(args.trades, args.seed)
+
+    with tempfile.TemporaryDirectory() as directory:
+        paths, copies = write_exports(rows, directory, args.overlap, args.fills, random.Random(args.seed))
+        out = os.path.join(directory, "formatted.csv")
+        start = time.perf_counter()
+        counts = trades.run(paths, out, "sharesight", args.run_size)
+        seconds = time.perf_counter() - start
+
+    print(
+        json.dumps(
+            {
+                "rows_read": counts["read"],
+                "distinct_trades": len(copies),
+                "trades": sum(copies.values()),
+                "duplicates": counts["duplicates"],
+                "runs": counts["runs"],
+                "seconds": round(seconds, 3),
+                "rows_per_second": round(counts["read"] / seconds),
+            }
+        )
+    )
+
+
+if __name__ == "__main__":
+    main()
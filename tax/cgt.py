@@ -0,0 +1,267 @@
+"""Capital gains per Australian financial year from the merged trade history.
+
+Sells are matched against open buy parcels per ticker, either first in first
+out (a deque) or highest cost first (a heap), which is the usual choice of
+specific identification since it realises the smallest gain. A parcel held
+for more than 12 months, not counting the days bought and sold, gets the 50%
+CGT discount. Trades come from trades.py, sorted and deduplicated, so any
+mix of broker exports or merged.csv works.
+
+Open parcels, carried forward losses and the date processed up to are saved
+as JSON, so each new financial year only reads trades after that date rather
+than replaying from 2019.
+
+    python tax/cgt.py data/stocks/merged.csv --state cgt_state.json --method fifo
+"""
+
+import argparse
+from collections import Counter, defaultdict, deque
+import csv
+from datetime import date
+from functools import lru_cache
+import heapq
+import json
+import os
+import tempfile
+from typing import Iterable, Optional
+
+import trades
+
+STATE_PATH = os.getenv("CGT_STATE_PATH", "cgt_state.json")
+METHODS = ("fifo", "hifo")
+DISCOUNT = 0.5
+# Units left under this after a sell are float residue, not a parcel
+DUST = 1e-9
+SUMMARY_FIELDS = ("proceeds", "cost_base", "discountable_gains", "other_gains", "losses")
+
+
+def financial_year(day: date) -> int:
+    """The year a 1 July - 30 June financial year ends in, FY2024 runs from 1 July 2023."""
+    return day.year + (day.month >= 7)
+
+
+@lru_cache(maxsize=None)
+def _anniversary(acquired: int) -> int:
+    """Ordinal of the day a year after the ordinal acquired."""
+    bought = date.fromordinal(acquired)
+    try:
+        return bought.replace(year=bought.year + 1).toordinal()
+    except ValueError:  # 29 February
+        return date(bought.year + 1, 3, 1).toordinal()
+
+
+def discountable(acquired: date, disposed: date) -> bool:
+    """Held at least 12 months, excluding the days of acquisition and disposal."""
+    return disposed.toordinal() > _anniversary(acquired.toordinal())
+
+
+class Book:
+    """Open parcels per ticker. A parcel is [acquired ordinal, units, cost per unit]."""
+
+    def __init__(self, method: str = "fifo"):
+        if method not in METHODS:
+            raise ValueError(f"method must be one of {METHODS}")
+        self.method = method
+        self.lots: dict[str, object] = defaultdict(deque if method == "fifo" else list)
+        # Tie-break for the heap so equal costs come off oldest first
+        self.sequence = 0
+
+    def buy(self, ticker: str, acquired: int, units: float, unit_cost: float):
+        if self.method == "fifo":
+            self.lots[ticker].append([acquired, units, unit_cost])
+        else:
+            heapq.heappush(self.lots[ticker], [-unit_cost, acquired, self.sequence, [acquired, units, unit_cost]])
+            self.sequence += 1
+
+    def _next(self, ticker: str) -> Optional[list]:
+        lots = self.lots.get(ticker)
+        if not lots:
+            return None
+        return lots[0] if self.method == "fifo" else lots[0][3]
+
+    def _drop(self, ticker: str):
+        if self.method == "fifo":
+            self.lots[ticker].popleft()
+        else:
+            heapq.heappop(self.lots[ticker])
+
+    def sell(self, ticker: str, units: float) -> tuple[list[tuple[int, float, float]], float]:
+        """([(acquired, units, cost per unit)] of the parcels sold, units that matched no parcel)."""
+        matched = []
+        while units > DUST:
+            parcel = self._next(ticker)
+            if parcel is None:
+                break
+            acquired, held, unit_cost = parcel
+            taken = min(held, units)
+            matched.append((acquired, taken, unit_cost))
+            units -= taken
+            parcel[1] = held - taken
+            if parcel[1] <= DUST:
+                self._drop(ticker)
+        return matched, max(units, 0.0)
+
+    def open_parcels(self) -> dict[str, list[list]]:
+        if self.method == "fifo":
+            parcels = {t: [list(p) for p in lots] for t, lots in self.lots.items()}
+        else:
+            # In the order bought, so loading them back keeps the tie-break
+            parcels = {t: [list(e[3]) for e in sorted(lots, key=lambda e: e[2])] for t, lots in self.lots.items()}
+        return {t: p for t, p in parcels.items() if p}
+
+
+class Engine:
+    """Matches trades in date order and totals gains per financial year."""
+
+    def __init__(self, method: str = "fifo"):
+        self.book = Book(method)
+        self.through: Optional[str] = None  # ISO date of the last trade processed
+        self.carried_losses = 0.0
+        self.years: dict[int, dict[str, float]] = defaultdict(lambda: dict.fromkeys(SUMMARY_FIELDS, 0.0))
+        self.unmatched_units: dict[str, float] = defaultdict(float)
+        self.events: Optional[list] = None
+
+    def process(self, sorted_trades: Iterable[trades.Trade]) -> int:
+        """Apply trades dated after self.through, sorted by date. Returns how many were applied.
+
+        A day is all or nothing, so run on exports that cover whole days."""
+        applied, after = 0, self.through
+        buy, sell = self.book.buy, self.book.sell
+        ordinal = {}
+        for day, ticker, action, units, price, total in sorted_trades:
+            if after is not None and day <= after:
+                continue
+            if day not in ordinal:
+                ordinal[day] = date.fromisoformat(day).toordinal()
+            units, price, total = float(units), float(price), abs(float(total))
+            if units <= 0:
+                continue
+            # Total includes brokerage, buys cost it and sells net it off
+            amount = total or units * price
+            if action == "BUY":
+                buy(ticker, ordinal[day], units, amount / units)
+            elif action == "SELL":
+                matched, missing = sell(ticker, units)
+                self._dispose(ticker, ordinal[day], amount / units, matched)
+                if missing:
+                    self.unmatched_units[ticker] += missing
+            else:
+                continue
+            applied += 1
+            self.through = day
+        return applied
+
+    def _dispose(self, ticker: str, disposed: int, unit_proceeds: float, matched: list):
+        year = self.years[financial_year(date.fromordinal(disposed))]
+        for acquired, units, unit_cost in matched:
+            proceeds, cost = units * unit_proceeds, units * unit_cost
+            gain = proceeds - cost
+            long_held = disposed > _anniversary(acquired)
+            year["proceeds"] += proceeds
+            year["cost_base"] += cost
+            if gain < 0:
+                year["losses"] -= gain
+            elif long_held:
+                year["discountable_gains"] += gain
+            else:
+                year["other_gains"] += gain
+            if self.events is not None:
+                bought, sold = date.fromordinal(acquired).isoformat(), date.fromordinal(disposed).isoformat()
+                self.events.append((ticker, bought, sold, units, cost, proceeds, gain, long_held))
+
+    def summary(self) -> list[dict]:
+        """Net capital gain per financial year in order. Losses, this year's then carried forward,
+        come off non-discountable gains first, and the discount applies to what's left."""
+        rows = []
+        carried = self.carried_losses
+        for fy in sorted(self.years):
+            year = self.years[fy]
+            losses = year["losses"] + carried
+            other = max(year["other_gains"] - losses, 0.0)
+            losses = max(losses - year["other_gains"], 0.0)
+            discountable_left = max(year["discountable_gains"] - losses, 0.0)
+            carried = max(losses - year["discountable_gains"], 0.0)
+            net = other + discountable_left * (1 - DISCOUNT)
+            rows.append(
+                {
+                    "financial_year": fy,
+                    **{k: round(v, 2) for k, v in year.items()},
+                    "net_capital_gain": round(net, 2),
+                    "losses_carried": round(carried, 2),
+                }
+            )
+        return rows
+
+    def close_years(self, before: int):
+        """Fold financial years before `before` into carried losses, once they're lodged."""
+        for row in self.summary():
+            if row["financial_year"] < before:
+                self.carried_losses = row["losses_carried"]
+                del self.years[row["financial_year"]]
+
+    def save(self, path: str):
+        state = {
+            "method": self.book.method,
+            "through": self.through,
+            "carried_losses": self.carried_losses,
+            "open_parcels": self.book.open_parcels(),
+            "years": {str(fy): year for fy, year in self.years.items()},
+            "unmatched_units": dict(self.unmatched_units),
+        }
+        with open(path, "w") as f:
+            json.dump(state, f)
+
+    @staticmethod
+    def load(path: str, method: str = "fifo") -> "Engine":
+        if not os.path.exists(path):
+            return Engine(method)
+        with open(path) as f:
+            state = json.load(f)
+        if state["method"] != method:
+            raise ValueError(f"{path} was matched {state['method']}, not {method}")
+        engine = Engine(method)
+        engine.through = state["through"]
+        engine.carried_losses = state["carried_losses"]
+        for ticker, parcels in state["open_parcels"].items():
+            for acquired, units, unit_cost in parcels:
+                engine.book.buy(ticker, acquired, units, unit_cost)
+        for fy, year in state["years"].items():
+            engine.years[int(fy)] = year
+        engine.unmatched_units.update(state["unmatched_units"])
+        return engine
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Capital gains per financial year from broker trade exports")
+    parser.add_argument("paths", nargs="*", help="merged.csv or broker CSVs, default the exports in STOCKS_DIR")
+    parser.add_argument("--state", default=STATE_PATH, help="open parcels saved by the last run, updated")
+    parser.add_argument("--method", choices=METHODS, default="fifo", help="hifo sells the highest cost parcels first")
+    parser.add_argument("--close-before", type=int, help="fold financial years before this into carried losses")
+    parser.add_argument("--events", help="write every parcel disposal to this CSV")
+    args = parser.parse_args()
+
+    engine = Engine.load(args.state, args.method)
+    if args.events:
+        engine.events = []
+    counts = Counter()
+    sources = (trades.read_trades(path, counts) for path in args.paths or trades.broker_exports())
+    with tempfile.TemporaryDirectory() as directory:
+        applied = engine.process(trades.sorted_trades(sources, directory, counts))
+    print(f"{applied} new trades through {engine.through}, {counts['duplicates']} duplicates, {counts['skipped']} skipped")
+    for ticker, units in sorted(engine.unmatched_units.items()):
+        print(f"warning: {units:g} {ticker} sold without a matching buy")
+
+    for row in engine.summary():
+        print(
+            f"FY{row['financial_year']}: proceeds ${row['proceeds']:,.2f}, discountable ${row['discountable_gains']:,.2f}, "
+            f"other ${row['other_gains']:,.2f}, losses ${row['losses']:,.2f}, net gain ${row['net_capital_gain']:,.2f}, "
+            f"losses carried ${row['losses_carried']:,.2f}"
+        )
+    if args.events:
+        with open(args.events, "w", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(["Ticker", "Acquired", "Disposed", "Units", "Cost Base", "Proceeds", "Gain", "Discountable"])
+            writer.writerows(engine.events)
+    if args.close_before:
+        engine.close_years(args.close_before)
+    engine.save(args.state)
@@ -0,0 +1,263 @@
+"""Daily holdings, value, cost base and unrealized P&L from the trade history.
+
+Every series is a (day, ticker) array. Units held are a cumulative sum of each
+day's signed trades, and cost base is a cumulative sum of what each buy added
+and each sell's parcels took away, matched first in first out like cgt.py.
+Closing prices come from one CSV per ticker in PRICES_DIR (Date and Close
+columns), carried forward over days without a price.
+
+The arrays are cached as .npy files, memory mapped when read back. A later
+run checks the trades up to the last cached day are unchanged and only works
+out the days since, and prices are only read again when a price file changes.
+
+    python tax/portfolio.py data/stocks/merged.csv --prices data/prices
+"""
+
+import argparse
+from collections import Counter
+import hashlib
+import json
+import os
+import tempfile
+import time
+from typing import Iterable, NamedTuple, Optional
+
+import numpy as np
+import pandas as pd
+
+import cgt
+import trades
+
+PRICES_DIR = os.getenv("PRICES_DIR", os.path.join(os.path.dirname(trades.STOCKS_DIR), "prices"))
+CACHE_DIR = os.getenv("PORTFOLIO_CACHE", os.path.join(trades.STOCKS_DIR, "portfolio_cache"))
+COLUMNS = ("units", "cost_base", "price")
+
+
+class Frame(NamedTuple):
+    """(day, ticker) arrays, price is nan before a ticker's first close."""
+
+    days: np.ndarray  # datetime64[D]
+    tickers: list[str]
+    units: np.ndarray
+    cost_base: np.ndarray
+    price: np.ndarray
+
+    def value(self) -> np.ndarray:
+        # Nothing held is worth nothing, even without a price
+        return np.where(self.units != 0, self.units * self.price, 0.0)
+
+    def totals(self) -> pd.DataFrame:
+        """Daily portfolio value, cost base and unrealized P&L. Tickers without a price yet
+        count at cost."""
+        value = self.value()
+        priced = ~np.isnan(value)
+        value = np.where(priced, value, self.cost_base).sum(axis=1)
+        cost_base = self.cost_base.sum(axis=1)
+        return pd.DataFrame(
+            {"value": value, "cost_base": cost_base, "unrealized": value - cost_base},
+            index=pd.DatetimeIndex(self.days, name="date"),
+        )
+
+
+def _fingerprint(history: list[trades.Trade]) -> str:
+    digest = hashlib.blake2b(digest_size=16)
+    for trade in history:
+        digest.update("\x1f".join(trade).encode())
+        digest.update(b"\x1e")
+    return digest.hexdigest()
+
+
+def trade_deltas(history: list[trades.Trade], book: cgt.Book) -> tuple[np.ndarray, list[str], np.ndarray, np.ndarray]:
+    """(day, ticker, signed units, cost base change) per trade, applying sells to book."""
+    day, ticker, units, cost = [], [], [], []
+    for date, code, action, quantity, price, total in history:
+        quantity = float(quantity)
+        if quantity <= 0 or action not in ("BUY", "SELL"):
+            continue
+        amount = abs(float(total)) or quantity * float(price)
+        if action == "BUY":
+            book.buy(code, 0, quantity, amount / quantity)
+            units.append(quantity)
+            cost.append(amount)
+        else:
+            matched, _ = book.sell(code, quantity)
+            units.append(-quantity)
+            cost.append(-sum(u * c for _, u, c in matched))
+        day.append(date)
+        ticker.append(code)
+    return np.array(day, dtype="datetime64[D]"), ticker, np.array(units), np.array(cost)
+
+
+def cumulative(
+    days: np.ndarray, tickers: list[str], day: np.ndarray, ticker: list[str], delta: np.ndarray, start: np.ndarray
+) -> np.ndarray:
+    """(day, ticker) running totals of delta from start, a row of the totals the day before days[0]."""
+    column = {t: i for i, t in enumerate(tickers)}
+    change = np.zeros((len(days), len(tickers)))
+    if len(day):
+        rows = (day - days[0]).astype(np.int64)
+        np.add.at(change, (rows, np.array([column[t] for t in ticker], dtype=np.int64)), delta)
+    totals = np.cumsum(change, axis=0) + start
+    # Sold out positions land on float residue rather than exactly zero
+    totals[np.abs(totals) < cgt.DUST] = 0.0
+    return totals
+
+
+def read_prices(ticker: str, directory: str) -> Optional[tuple[np.ndarray, np.ndarray]]:
+    """(dates, closes) sorted by date, from directory/TICKER.csv."""
+    path = os.path.join(directory, f"{ticker}.csv")
+    if not os.path.exists(path):
+        return None
+    frame = pd.read_csv(path, usecols=["Date", "Close"], dtype={"Date": str}).dropna()
+    try:
+        # ISO dates, as most price sources write them, parse in one numpy call
+        dates = frame["Date"].to_numpy().astype("datetime64[D]")
+    except ValueError:
+        dates = pd.to_datetime(frame["Date"], dayfirst=True).to_numpy().astype("datetime64[D]")
+    order = np.argsort(dates, kind="stable")
+    return dates[order], frame["Close"].to_numpy(dtype=np.float64)[order]
+
+
+def price_matrix(days: np.ndarray, tickers: list[str], directory: str) -> np.ndarray:
+    """(day, ticker) latest close on or before each day."""
+    price = np.full((len(days), len(tickers)), np.nan)
+    for i, ticker in enumerate(tickers):
+        prices = read_prices(ticker, directory)
+        if prices is None:
+            continue
+        dates, closes = prices
+        latest = np.searchsorted(dates, days, side="right") - 1
+        price[:, i] = np.where(latest >= 0, closes[np.maximum(latest, 0)], np.nan)
+    return price
+
+
+def price_versions(tickers: Iterable[str], directory: str) -> dict[str, float]:
+    """{ticker: modification time} of the price files there are."""
+    paths = {t: os.path.join(directory, f"{t}.csv") for t in tickers}
+    return {t: os.stat(p).st_mtime for t, p in paths.items() if os.path.exists(p)}
+
+
+class Cache:
+    """Frame columns as directory/<column>.npy, with what they were built from in meta.json."""
+
+    def __init__(self, directory: str = CACHE_DIR):
+        self.directory = directory
+        self.meta_path = os.path.join(directory, "meta.json")
+
+    def load(self) -> Optional[tuple[Frame, dict]]:
+        if not os.path.exists(self.meta_path):
+            return None
+        with open(self.meta_path) as f:
+            meta = json.load(f)
+        columns = {c: np.load(os.path.join(self.directory, f"{c}.npy"), mmap_mode="r") for c in COLUMNS}
+        # Columns from a run interrupted before meta.json was replaced don't match it
+        if any(len(c) != meta["days"] for c in columns.values()):
+            return None
+        start = np.datetime64(meta["start"], "D")
+        days = start + np.arange(len(columns["units"]))
+        return Frame(days, meta["tickers"], **columns), meta
+
+    def save(self, frame: Frame, meta: dict):
+        os.makedirs(self.directory, exist_ok=True)
+        # Written beside the old files and renamed over them, so an interrupted run leaves the old cache
+        for column in COLUMNS:
+            fd, path = tempfile.mkstemp(suffix=".npy", dir=self.directory)
+            with os.fdopen(fd, "wb") as f:
+                np.save(f, np.ascontiguousarray(getattr(frame, column)))
+            os.replace(path, os.path.join(self.directory, f"{column}.npy"))
+        fd, path = tempfile.mkstemp(suffix=".json", dir=self.directory)
+        with os.fdopen(fd, "w") as f:
+            json.dump({**meta, "start": str(frame.days[0]), "days": len(frame.days), "tickers": frame.tickers}, f)
+        os.replace(path, self.meta_path)
+
+
+def _restore_book(meta: dict) -> cgt.Book:
+    book = cgt.Book("fifo")
+    for ticker, parcels in meta["open_parcels"].items():
+        for acquired, units, unit_cost in parcels:
+            book.buy(ticker, acquired, units, unit_cost)
+    return book
+
+
+def build(
+    history: list[trades.Trade],
+    prices_dir: str = PRICES_DIR,
+    cache: Optional[Cache] = None,
+    through: Optional[np.datetime64] = None,
+    rebuild: bool = False,
+) -> tuple[Frame, int]:
+    """(frame up to through, days of units and cost base computed this run). history must be
+    sorted by date, through defaults to today or the last trade if that's later.
+
+    Units and cost base are only worked out for days after the cache. Prices are
+    joined again for every day when a price file has changed, which reading the
+    files to find new closes would cost anyway, and not at all otherwise.
+    """
+    if not history:
+        raise ValueError("no trades")
+    tickers = sorted({t[1] for t in history})
+    through = max(through or np.datetime64("today", "D"), np.datetime64(history[-1][0], "D"))
+    versions = price_versions(tickers, prices_dir)
+
+    cached = None if rebuild or cache is None else cache.load()
+    if cached is not None:
+        frame, meta = cached
+        end = str(frame.days[-1])
+        old = [t for t in history if t[0] <= end]
+        if meta["fingerprint"] != _fingerprint(old) or not set(tickers) <= set(frame.tickers):
+            cached = None
+
+    if cached is None:
+        book = cgt.Book("fifo")
+        tickers_now, start_row = tickers, np.zeros(len(tickers))
+        days = np.arange(np.datetime64(history[0][0], "D"), through + 1)
+        day, ticker, units, cost = trade_deltas(history, book)
+        units = cumulative(days, tickers, day, ticker, units, start_row)
+        cost = cumulative(days, tickers, day, ticker, cost, start_row)
+        computed = len(days)
+    else:
+        tickers_now = frame.tickers
+        days = np.arange(frame.days[-1] + 1, through + 1)
+        book = _restore_book(meta)
+        day, ticker, units, cost = trade_deltas(history[len(old) :], book)
+        units = np.concatenate([frame.units, cumulative(days, tickers_now, day, ticker, units, frame.units[-1])])
+        cost = np.concatenate([frame.cost_base, cumulative(days, tickers_now, day, ticker, cost, frame.cost_base[-1])])
+        computed = len(days)
+        days = np.concatenate([frame.days, days])
+
+    if cached is not None and not computed and meta["price_versions"] == versions:
+        price = frame.price
+    else:
+        price = price_matrix(days, tickers_now, prices_dir)
+    frame = Frame(days, tickers_now, units, cost, price)
+
+    if cache is not None and (cached is None or computed or price is not cached[0].price):
+        meta = {"fingerprint": _fingerprint(history), "open_parcels": book.open_parcels(), "price_versions": versions}
+        cache.save(frame, meta)
+    return frame, computed
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Daily portfolio value, cost base and unrealized P&L")
+    parser.add_argument("paths", nargs="*", help="merged.csv or broker CSVs, default the exports in STOCKS_DIR")
+    parser.add_argument("--prices", default=PRICES_DIR, help="directory of TICKER.csv with Date and Close columns")
+    parser.add_argument("--cache", default=CACHE_DIR)
+    parser.add_argument("--rebuild", action="store_true", help="ignore the cache and start again")
+    parser.add_argument("--output", help="write the daily totals to this CSV")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    counts = Counter()
+    sources = (trades.read_trades(path, counts) for path in args.paths or trades.broker_exports())
+    with tempfile.TemporaryDirectory() as directory:
+        history = list(trades.sorted_trades(sources, directory, counts))
+    frame, computed = build(history, args.prices, Cache(args.cache), rebuild=args.rebuild)
+    totals = frame.totals()
+    print(f"{len(frame.days)} days x {len(frame.tickers)} tickers, {computed} days computed in {time.perf_counter() - start:.2f}s")
+    latest = totals.iloc[-1]
+    print(
+        f"{totals.index[-1].date()}: value ${latest['value']:,.2f}, cost base ${latest['cost_base']:,.2f}, "
+        f"unrealized ${latest['unrealized']:+,.2f}"
+    )
+    if args.output:
+        totals.to_csv(args.output)
@@ -0,0 +1,12 @@
+import os
+
+import trades
+
+
+def merge_csvs():
+    # Sharesight import straight from the broker exports, merged.csv from merge.py isn't needed first
+    trades.run(trades.broker_exports(), os.path.join(trades.STOCKS_DIR, "formatted.csv"), "sharesight")
+
+
+if __name__ == "__main__":
+    merge_csvs()
@@ -0,0 +1,51 @@
+from datetime import date
+import math
+
+import pytest
+
+import bench_cgt
+import cgt
+
+
+@pytest.fixture(scope="module")
+def history():
+    return bench_cgt.synthetic_history(20_000, 50, seed=0)
+
+
+def test_discount_boundary():
+    assert not cgt.discountable(date(2023, 1, 10), date(2024, 1, 10))
+    assert cgt.discountable(date(2023, 1, 10), date(2024, 1, 11))
+    assert cgt.discountable(date(2020, 2, 29), date(2021, 3, 2))
+    assert not cgt.discountable(date(2020, 2, 29), date(2021, 3, 1))
+    assert cgt.financial_year(date(2023, 6, 30)) == 2023
+    assert cgt.financial_year(date(2023, 7, 1)) == 2024
+
+
+@pytest.mark.parametrize("method", cgt.METHODS)
+def test_cost_base_is_conserved(history, method):
+    engine = cgt.Engine(method)
+    engine.process(history)
+    # Every dollar of cost base is either sold or still in an open parcel
+    bought = sum(float(t[5]) for t in history if t[2] == "BUY")
+    sold = sum(year["cost_base"] for year in engine.years.values())
+    still_open = sum(units * cost for parcels in engine.book.open_parcels().values() for _, units, cost in parcels)
+
+    assert not sum(engine.unmatched_units.values())
+    assert math.isclose(bought, sold + still_open, rel_tol=1e-9)
+
+
+@pytest.mark.parametrize("method", cgt.METHODS)
+def test_incremental_matches_one_run(history, method, tmp_path):
+    whole = cgt.Engine(method)
+    whole.process(history)
+
+    split = next(i for i, t in enumerate(history) if t[0] >= "2022-07-01")
+    first = cgt.Engine(method)
+    first.process(history[:split])
+    first.save(str(tmp_path / "state.json"))
+    second = cgt.Engine.load(str(tmp_path / "state.json"), method)
+    # The whole history again, only what's past the saved state is applied
+    applied = second.process(history)
+
+    assert applied == len(history) - split
+    assert second.summary() == whole.summary()
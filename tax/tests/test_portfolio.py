@@ -0,0 +1,64 @@
+import numpy as np
+import pytest
+
+import bench_cgt
+import bench_portfolio
+import cgt
+import portfolio
+
+
+def same(a: portfolio.Frame, b: portfolio.Frame) -> bool:
+    return (
+        np.array_equal(a.days, b.days)
+        and a.tickers == b.tickers
+        and np.allclose(a.units, b.units)
+        and np.allclose(a.cost_base, b.cost_base, rtol=1e-9, atol=1e-6)
+        and np.allclose(a.price, b.price, equal_nan=True)
+    )
+
+
+@pytest.fixture(scope="module")
+def history():
+    return bench_cgt.synthetic_history(20_000, 30, seed=0, years=3)
+
+
+@pytest.fixture(scope="module")
+def cold(history, tmp_path_factory):
+    directory = tmp_path_factory.mktemp("cold")
+    bench_portfolio.write_prices(history, str(directory), history[0][0], history[-1][0], 0)
+    frame, _ = portfolio.build(history, str(directory), portfolio.Cache(str(directory / "cache")), np.datetime64(history[-1][0]))
+    return frame
+
+
+def test_incremental_matches_cold(history, cold, tmp_path):
+    first, end = history[0][0], history[-1][0]
+    # The last month arrives in a later run
+    through = np.datetime64(end) - 30
+    split = next(i for i, t in enumerate(history) if np.datetime64(t[0]) > through)
+    prices_dir = tmp_path / "prices"
+    prices_dir.mkdir()
+    bench_portfolio.write_prices(history, str(prices_dir), first, str(through), 0)
+    cache = portfolio.Cache(str(tmp_path / "cache"))
+
+    portfolio.build(history[:split], str(prices_dir), cache, through)
+    _, warm_computed = portfolio.build(history[:split], str(prices_dir), cache, through)
+    bench_portfolio.write_prices(history, str(prices_dir), first, end, 0)
+    incremental, incremental_computed = portfolio.build(history, str(prices_dir), cache, np.datetime64(end))
+
+    assert warm_computed == 0
+    assert incremental_computed == (np.datetime64(end) - through).astype(int)
+    assert same(incremental, cold)
+
+
+def test_holdings_match_trades(history, cold):
+    held = {}
+    for _, ticker, action, units, _, _ in history:
+        held[ticker] = held.get(ticker, 0) + (int(units) if action == "BUY" else -int(units))
+    assert np.allclose(cold.units[-1], [held[t] for t in cold.tickers])
+
+
+def test_cost_base_matches_cgt(history, cold):
+    engine = cgt.Engine("fifo")
+    engine.process(history)
+    open_cost = {t: sum(u * c for _, u, c in p) for t, p in engine.book.open_parcels().items()}
+    assert np.allclose(cold.cost_base[-1], [open_cost.get(t, 0.0) for t in cold.tickers])
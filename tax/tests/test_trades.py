@@ -0,0 +1,23 @@
+import csv
+import random
+
+import bench_trades
+import trades
+
+
+def test_merged_exports_keep_every_trade_in_date_order(tmp_path):
+    rows = bench_trades.synthetic_trades(5_000, seed=0)
+    paths, copies = bench_trades.write_exports(rows, str(tmp_path), 0.2, 0.05, random.Random(0))
+    out = str(tmp_path / "formatted.csv")
+    # Small runs, so the external merge is exercised
+    counts = trades.run(paths, out, "sharesight", 500)
+    with open(out, newline="") as f:
+        reader = csv.reader(f)
+        header = next(reader)
+        written = [(r[0], r[1], r[5], r[3], r[4]) for r in reader]
+
+    assert counts["runs"] > 1
+    assert header == trades.SHARESIGHT_HEADER
+    # As many times as the export with the most copies of it has it, so identical
+    # partial fills within one export survive
+    assert written == sorted(copies.elements())
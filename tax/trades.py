@@ -0,0 +1,231 @@
+"""Broker trade exports to one sorted, deduplicated CSV, in a single pass.
+
+Each input CSV is matched to a column mapper by its header, so Stake, ASX
+Movements and our own unified files can be mixed. Trades are normalized
+(ISO dates, BUY/SELL, plain numbers), sorted by date with an external merge
+sort, and exports that overlap in date range are deduplicated on (date,
+ticker, action, units, price), keeping trades repeated within one export,
+like partial fills at the same price. Sorted runs of at most run_size
+trades are spilled to temporary files, so memory doesn't grow with the
+input.
+
+    python tax/trades.py data/stocks/stake.csv data/stocks/ASX-Movements-*.csv -o formatted.csv
+"""
+
+import argparse
+from collections import Counter
+import csv
+from dataclasses import dataclass
+from datetime import datetime
+from decimal import Decimal, InvalidOperation
+from functools import lru_cache
+from itertools import groupby
+import glob
+import heapq
+import os
+import tempfile
+import time
+from typing import Iterable, Iterator, Optional
+
+RUN_SIZE = 200_000
+STOCKS_DIR = os.getenv("STOCKS_DIR", os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data", "stocks"))
+
+# date, ticker, action, units, price, total
+Trade = tuple[str, str, str, str, str, str]
+UNIFIED_HEADER = ["Date", "Ticker", "Action", "Shares", "Price", "Total"]
+SHARESIGHT_HEADER = [
+    "Trade Date",
+    "Instrument Code",
+    "Market Code",
+    "Quantity",
+    "Price",
+    "Transaction Type",
+    "Exchange Rate (optional)",
+    "Brokerage (optional)",
+    "Brokerage Currency (optional)",
+    "Comments (optional)",
+]
+DATE_FORMATS = ("%Y-%m-%d", "%d/%m/%Y", "%d/%m/%y", "%d-%m-%Y", "%d %b %Y", "%d %B %Y", "%Y/%m/%d")
+ACTIONS = {"buy": "BUY", "b": "BUY", "bought": "BUY", "sell": "SELL", "s": "SELL", "sold": "SELL"}
+
+
+@dataclass(frozen=True)
+class Mapper:
+    """Where a broker's export keeps each Trade field, by header name."""
+
+    name: str
+    columns: tuple[str, str, str, str, str, str]
+
+    def indices(self, header: list[str]) -> Optional[list[int]]:
+        names = [h.strip() for h in header]
+        if not all(c in names for c in self.columns):
+            return None
+        return [names.index(c) for c in self.columns]
+
+
+MAPPERS = [
+    Mapper("unified", tuple(UNIFIED_HEADER)),
+    Mapper("asx", ("Trade Date", "Code", "Action", "Units", "Average Price", "Total")),
+]
+
+
+def mapper_for(header: list[str], mappers: Iterable[Mapper] = MAPPERS) -> tuple[str, list[int]]:
+    for mapper in mappers:
+        indices = mapper.indices(header)
+        if indices is not None:
+            return mapper.name, indices
+    # Stake exports have the unified columns in order under their own names
+    if len(header) == len(UNIFIED_HEADER):
+        return "positional", list(range(len(UNIFIED_HEADER)))
+    raise ValueError(f"no mapper for header {header}")
+
+
+@lru_cache(maxsize=65536)
+def normalize_date(text: str) -> str:
+    text = text.strip()
+    for fmt in DATE_FORMATS:
+        try:
+            return datetime.strptime(text, fmt).date().isoformat()
+        except ValueError:
+            continue
+    raise ValueError(f"unrecognised date {text!r}")
+
+
+@lru_cache(maxsize=65536)
+def normalize_number(text: str) -> str:
+    """'$1,234.50' -> '1234.5', so the same amount always dedupes."""
+    value = Decimal(text.strip().replace("$", "").replace(",", "") or "0")
+    return f"{value.normalize():f}"
+
+
+def normalize(row: list[str], indices: list[int]) -> Trade:
+    date, ticker, action, units, price, total = (row[i] for i in indices)
+    action = action.strip()
+    return (
+        normalize_date(date),
+        ticker.strip().upper(),
+        ACTIONS.get(action.lower(), action.upper()),
+        normalize_number(units),
+        normalize_number(price),
+        normalize_number(total),
+    )
+
+
+def read_trades(path: str, counts: Counter, mappers: Iterable[Mapper] = MAPPERS) -> Iterator[Trade]:
+    with open(path, newline="", encoding="utf-8-sig") as f:
+        reader = csv.reader(f)
+        header = next(reader, None)
+        if header is None:
+            return
+        name, indices = mapper_for(header, mappers)
+        print(f"{path}: {name} columns")
+        for row in reader:
+            counts["read"] += 1
+            if not row or len(row) <= max(indices) or not row[indices[0]].strip():
+                counts["skipped"] += 1
+                continue
+            try:
+                yield normalize(row, indices)
+            except (ValueError, InvalidOperation):
+                counts["skipped"] += 1
+
+
+def dedupe(trades: Iterable[tuple], counts: Counter) -> Iterator[Trade]:
+    """Drop the copies of trades that overlapping exports share, trades must be sorted
+    and tagged with the export they came from. Identical trades within one export,
+    like two partial fills at the same price, are real, so each key is kept as many
+    times as the export with the most of it has it."""
+    for _, group in groupby(trades, key=lambda t: t[:5]):
+        group = list(group)
+        if len(group) > 1:
+            source, keep = Counter(t[6] for t in group).most_common(1)[0]
+            counts["duplicates"] += len(group) - keep
+            group = [t for t in group if t[6] == source]
+        for trade in group:
+            yield trade[:6]
+
+
+def _spill(run: list[tuple], directory: str) -> str:
+    run.sort()
+    fd, path = tempfile.mkstemp(suffix=".csv", dir=directory)
+    with os.fdopen(fd, "w", newline="") as f:
+        csv.writer(f).writerows(run)
+    return path
+
+
+def _read_run(path: str) -> Iterator[tuple]:
+    with open(path, newline="") as f:
+        for row in csv.reader(f):
+            yield tuple(row)
+
+
+def sorted_trades(
+    sources: Iterable[Iterable[Trade]], directory: str, counts: Counter, run_size: int = RUN_SIZE
+) -> Iterator[Trade]:
+    """The trades of each export, sorted by date and deduplicated across exports,
+    holding at most run_size in memory."""
+    runs, run = [], []
+    for source, trades in enumerate(sources):
+        # A string, like the tag read back from a spilled run
+        tag = str(source)
+        for trade in trades:
+            run.append(trade + (tag,))
+            if len(run) >= run_size:
+                runs.append(_spill(run, directory))
+                run = []
+    run.sort()
+    if not runs:
+        yield from dedupe(run, counts)
+        return
+    counts["runs"] = len(runs) + 1
+    yield from dedupe(heapq.merge(iter(run), *(_read_run(p) for p in runs)), counts)
+
+
+def sharesight_row(trade: Trade) -> list[str]:
+    date, ticker, action, units, price, _ = trade
+    return [date, ticker, "ASX", units, price, action, "", "", "", ""]
+
+
+FORMATS = {
+    "sharesight": (SHARESIGHT_HEADER, sharesight_row),
+    "unified": (UNIFIED_HEADER, list),
+}
+
+
+def run(paths: Iterable[str], out_file: str, output_format: str = "sharesight", run_size: int = RUN_SIZE) -> Counter:
+    header, to_row = FORMATS[output_format]
+    counts = Counter()
+    start = time.perf_counter()
+    sources = (read_trades(path, counts) for path in paths)
+    # Spill next to the output so runs don't fill a small /tmp
+    with tempfile.TemporaryDirectory(dir=os.path.dirname(os.path.abspath(out_file))) as directory:
+        with open(out_file, "w", newline="") as outfile:
+            writer = csv.writer(outfile)
+            writer.writerow(header)
+            for trade in sorted_trades(sources, directory, counts, run_size):
+                writer.writerow(to_row(trade))
+                counts["written"] += 1
+    seconds = time.perf_counter() - start
+    print(
+        f"{out_file}: read={counts['read']} written={counts['written']} duplicates={counts['duplicates']} "
+        f"skipped={counts['skipped']} runs={counts['runs'] or 1} rate={counts['read'] / max(seconds, 1e-9):.0f}/s"
+    )
+    return counts
+
+
+def broker_exports(directory: str = STOCKS_DIR) -> list[str]:
+    """stake.csv and every ASX Movements export in directory."""
+    paths = sorted(glob.glob(os.path.join(directory, "ASX-Movements-*.csv")))
+    stake = os.path.join(directory, "stake.csv")
+    return ([stake] if os.path.exists(stake) else []) + paths
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Merge broker trade exports into one sorted CSV")
+    parser.add_argument("paths", nargs="*", help=f"broker CSVs, default stake.csv and ASX-Movements-*.csv in {STOCKS_DIR}")
+    parser.add_argument("-o", "--output", default=os.path.join(STOCKS_DIR, "formatted.csv"))
+    parser.add_argument("--format", choices=sorted(FORMATS), default="sharesight")
+    parser.add_argument("--run-size", type=int, default=RUN_SIZE, help="trades held in memory before spilling to disk")
+    args = parser.parse_args()
+
+    run(args.paths or broker_exports(), args.output, args.format, args.run_size)